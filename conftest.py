@@ -0,0 +1 @@
+# here so pytest puts the repo root on the path and tests/ can import secondary_motion
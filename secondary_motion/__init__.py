@@ -0,0 +1,12 @@
+"""
+Secondary motion for Maya: the verlet/spring logic from the scripts in the repo root,
+pulled out into modules so the scripts (and anything else) can import it.
+
+Put the repo root on Maya's python path (or in the scripts folder) and then:
+    from secondary_motion.pipeline import bake
+    bake("SELECT_THIS", 1, 50)
+
+Nothing here needs Maya to be imported. Anything that talks to the scene takes cmds=...,
+which is maya.cmds by default, or a FakeCmds from secondary_motion.fake_cmds to run without Maya.
+The solver itself (secondary_motion.solver) only takes and gives numpy arrays.
+"""
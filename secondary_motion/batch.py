@@ -0,0 +1,251 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import traceback
+
+from secondary_motion import solver
+from secondary_motion.pipeline import bake
+from secondary_motion.profiling import Profiler
+from secondary_motion.scene import get_cmds
+
+"""
+What code does:
+bakes a whole list of shots from the command line, no selection and no Maya UI needed,
+so a sequence can go to the farm overnight as a few parallel jobs
+
+Usage:
+    mayapy -m secondary_motion.batch sh010.mb sh020.mb --roots tail_01 ear_L_01 --output baked/ --k 0.2
+    mayapy -m secondary_motion.batch shots/*.mb --pattern "*:tail_01" --start 1001 --end 1120 --output baked/
+    mayapy -m secondary_motion.batch --shots shots.json --output baked/ --job-index 3 --job-count 8
+and the same thing without Maya, on scenes FakeCmds saved (file(rename=...), file(save=True)):
+    python -m secondary_motion.batch shots/*.json --fake --roots SELECT_THIS --output baked/
+
+Functions:
+- make_shots(scene_list, roots=None, pattern=None, start_frame=None, end_frame=None, **params)
+- load_shots(path)
+- shot_name(shot) / shot_key(shot, bake_kwargs=None)
+- bake_shot(shot, output, name=None, profile=False, cmds=None, **bake_kwargs)
+- batch_bake(shot_list, output, job_index=0, job_count=1, resume=True, profile=False, log=print, cmds=None,
+	**bake_kwargs)
+- main(argv=None)
+
+A shot is a dict:
+- scene: the file to open
+- roots: the objects to bake (like what would be selected), or pattern: cmds.ls pattern that finds them
+- start / end: the frame range, the scene's playback range when they're left out
+- params: solver params (k, damping, substeps...), see solver.DEFAULT_PARAMS
+--shots takes a json list of those, so every shot can have its own roots, range and params
+
+What every shot leaves in output:
+- <name>.mb / .ma (or .json with --fake): the scene with the keys on
+- <name>.smtraj: the solved positions and keyed translates (secondary_motion.trajectory),
+	for putting the same motion back on later without baking again
+- <name>.done.json: how long it took (opening, baking, saving, and every bake stage with --profile),
+	what it baked and the shot's key, written last, so it's only there when everything else is
+- <name>.failed.json: the error, when it didn't work (the other shots still go)
+name is the scene's file name, with the frame range when the same scene is in the list more than once
+
+Resuming: a shot with a .done.json that has the same key is skipped, so running the same command again after a crash
+or a killed job only does what's left
+the key is the scene (its path, size and modified time, so saving it again bakes it again), roots, range, params
+and every bake option that changes what comes out (--interpolation, not --workers)
+
+Parallel jobs: --job-index I --job-count N does every Nth shot from the Ith, every job with the same list,
+they only write their own shots' files so they can share output
+"""
+
+# bake options that only change how fast it goes (or where it keeps things on the way), not what comes out
+SPEED_KWARGS = ("workers", "cache", "buffers", "checkpoint_every")
+
+
+# One shot per scene, all with the same roots / pattern, range and params
+def make_shots(scene_list, roots=None, pattern=None, start_frame=None, end_frame=None, **params):
+    if not roots and not pattern:
+        raise ValueError("Every shot needs roots or a pattern.")
+    return [{"scene": scene, "roots": list(roots or []), "pattern": pattern, "start": start_frame,
+             "end": end_frame, "params": dict(params)} for scene in scene_list]
+
+
+# Shots from a json list of shot dicts
+def load_shots(path):
+    with open(path) as f:
+        shot_list = json.load(f)
+    for shot in shot_list:
+        if not shot.get("roots") and not shot.get("pattern"):
+            raise ValueError(f"{shot.get('scene')}: every shot needs roots or a pattern.")
+        shot.setdefault("roots", [])
+        shot.setdefault("pattern", None)
+        shot.setdefault("start", None)
+        shot.setdefault("end", None)
+        shot.setdefault("params", {})
+    return shot_list
+
+
+# The scene's file name, what every file this shot leaves in output starts with
+def shot_name(shot, with_range=False):
+    name = os.path.splitext(os.path.basename(shot["scene"]))[0]
+    if with_range:
+        name += f"_{shot['start']}_{shot['end']}"
+    return name
+
+
+# Same shot, same key: scene file, roots, range, params and the bake options that change what comes out
+def shot_key(shot, bake_kwargs=None):
+    scene = os.path.abspath(shot["scene"])
+    stat = os.stat(scene) if os.path.exists(scene) else None
+    options = sorted((name, value) for name, value in (bake_kwargs or {}).items() if name not in SPEED_KWARGS)
+    value = json.dumps([scene, stat and [stat.st_size, stat.st_mtime_ns], shot["roots"], shot["pattern"],
+                        shot["start"], shot["end"], sorted(shot["params"].items()), options], default=float)
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+# Writing a json file all at once, so nothing half written is ever there (a job can get killed any time)
+def _write_json(path, value):
+    with open(path + ".tmp", "w") as f:
+        json.dump(value, f, indent=1, default=float)
+    os.replace(path + ".tmp", path)
+
+
+# Opening, baking and saving one shot, gives back what goes in its .done.json
+def bake_shot(shot, output, name=None, profile=False, cmds=None, **bake_kwargs):
+    cmds = get_cmds(cmds)
+    name = name or shot_name(shot)
+    seconds = {}
+
+    start = time.perf_counter()
+    cmds.file(shot["scene"], open=True, force=True)
+    roots = list(shot["roots"]) or cmds.ls(shot["pattern"], long=True, type="transform")
+    if not roots:
+        cmds.error(f"{shot['scene']}: nothing matches {shot['pattern']}.")
+    start_frame = int(shot["start"] if shot["start"] is not None else cmds.playbackOptions(query=True, minTime=True))
+    end_frame = int(shot["end"] if shot["end"] is not None else cmds.playbackOptions(query=True, maxTime=True))
+    seconds["open"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profiler = Profiler() if profile else None
+    solved = bake(roots, start_frame, end_frame, profiler=profiler, trajectory=os.path.join(output, name + ".smtraj"),
+                  cmds=cmds, **dict(bake_kwargs, **shot["params"]))
+    seconds["bake"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extension = os.path.splitext(shot["scene"])[1] or ".mb"
+    scene_path = os.path.join(output, name + extension)
+    cmds.file(rename=scene_path)
+    cmds.file(save=True, force=True, type="mayaAscii" if extension == ".ma" else "mayaBinary")
+    seconds["save"] = time.perf_counter() - start
+
+    result = {"name": name, "scene": shot["scene"], "key": shot_key(shot, bake_kwargs), "roots": roots,
+              "start": start_frame, "end": end_frame, "params": dict(solver.DEFAULT_PARAMS, **shot["params"]),
+              "objects": solved.shape[1], "frames": solved.shape[0], "output": scene_path,
+              "seconds": dict(seconds, total=sum(seconds.values()))}
+    if profiler is not None:
+        result["stages"] = {row["stage"]: row["seconds"] for row in profiler.summary()}
+    return result
+
+
+# Baking every shot of this job that isn't done yet, gives back what every one of them did
+# (the .done.json of the ones it skipped, the error of the ones that failed)
+def batch_bake(shot_list, output, job_index=0, job_count=1, resume=True, profile=False, log=print, cmds=None,
+               **bake_kwargs):
+    cmds = get_cmds(cmds)
+    os.makedirs(output, exist_ok=True)
+    scene_count = {}
+    for shot in shot_list:
+        scene_count[shot_name(shot)] = scene_count.get(shot_name(shot), 0) + 1
+
+    results = []
+    for number, shot in enumerate(shot_list):
+        if number % job_count != job_index:
+            continue
+        name = shot_name(shot, with_range=scene_count[shot_name(shot)] > 1)
+        done_path = os.path.join(output, name + ".done.json")
+        failed_path = os.path.join(output, name + ".failed.json")
+
+        if resume and os.path.exists(done_path):
+            with open(done_path) as f:
+                done = json.load(f)
+            if done.get("key") == shot_key(shot, bake_kwargs):
+                log(f"{name}: done already ({done['seconds']['total']:.1f}s)")
+                results.append(dict(done, skipped=True))
+                continue
+
+        try:
+            result = bake_shot(shot, output, name, profile, cmds, **bake_kwargs)
+        except Exception as error:
+            failed = {"name": name, "scene": shot["scene"], "key": shot_key(shot, bake_kwargs), "error": repr(error),
+                      "traceback": traceback.format_exc()}
+            _write_json(failed_path, failed)
+            log(f"{name}: failed, {error!r}")
+            results.append(failed)
+            continue
+
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+        _write_json(done_path, result)
+        seconds = result["seconds"]
+        log(f"{name}: {result['objects']} objects, frames {result['start']}-{result['end']} in "
+            f"{seconds['total']:.1f}s (open {seconds['open']:.1f}s, bake {seconds['bake']:.1f}s, "
+            f"save {seconds['save']:.1f}s)")
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bake the secondary motion of a list of shots.")
+    parser.add_argument("scenes", nargs="*", help="scene files, every one a shot")
+    parser.add_argument("--shots", help="a json list of shots instead (scene, roots or pattern, start, end, params)")
+    parser.add_argument("--roots", nargs="+", help="objects to bake in every scene")
+    parser.add_argument("--pattern", help="or a cmds.ls pattern that finds them, like '*:tail_01'")
+    parser.add_argument("--start", type=int, default=None, help="first frame (default: the playback range)")
+    parser.add_argument("--end", type=int, default=None, help="last frame (default: the playback range)")
+    parser.add_argument("--output", required=True, help="folder for the baked scenes, positions and timings")
+    parser.add_argument("--job-index", type=int, default=0)
+    parser.add_argument("--job-count", type=int, default=1)
+    parser.add_argument("--no-resume", action="store_true", help="bake shots that are done already again")
+    parser.add_argument("--profile", action="store_true", help="time every bake stage too")
+    parser.add_argument("--fake", action="store_true", help="no Maya: FakeCmds and the scenes it saved")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--interpolation", default="linear")
+    for name, value in solver.DEFAULT_PARAMS.items():
+        if isinstance(value, bool):
+            parser.add_argument(f"--{name}", type=lambda text: text.lower() in ("1", "true", "yes"), default=None)
+        elif name not in ("force", "precision"):
+            parser.add_argument(f"--{name}", type=int if name in ("substeps", "iterations") else float, default=None)
+    parser.add_argument("--force", type=float, nargs=3, default=None)
+    parser.add_argument("--precision", choices=list(solver.PRECISIONS), default=None)
+    args = parser.parse_args(argv)
+
+    params = {name: getattr(args, name) for name in solver.DEFAULT_PARAMS if getattr(args, name) is not None}
+    if args.shots:
+        shot_list = load_shots(args.shots)
+        for shot in shot_list:
+            shot["params"] = dict(params, **shot["params"])
+    else:
+        shot_list = make_shots(args.scenes, args.roots, args.pattern, args.start, args.end, **params)
+
+    standalone = None
+    if args.fake:
+        from secondary_motion.fake_cmds import FakeCmds
+        cmds = FakeCmds()
+    else:
+        import maya.standalone as standalone
+        standalone.initialize(name="python")
+        import maya.cmds as cmds
+
+    try:
+        results = batch_bake(shot_list, args.output, args.job_index, args.job_count, not args.no_resume,
+                             args.profile, cmds=cmds, workers=args.workers, interpolation=args.interpolation)
+    finally:
+        if standalone is not None:
+            standalone.uninitialize()
+    failed = [result["name"] for result in results if "error" in result]
+    if failed:
+        print(f"{len(failed)} failed: {', '.join(failed)}")
+        raise SystemExit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
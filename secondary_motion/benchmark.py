@@ -0,0 +1,413 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from secondary_motion import kernels, solver
+from secondary_motion.fake_cmds import FakeCmds
+from secondary_motion.pipeline import bake
+from secondary_motion.preview import LivePreview
+
+"""
+What code does:
+times the solver on made up shots, no Maya needed, so it can run on any box and be compared over time
+
+Usage:
+    python -m secondary_motion.benchmark --objects 10 100 1000 10000 --frames 50 1000 10000 --json results.json
+or from python:
+    from secondary_motion.benchmark import run_suite
+    results = run_suite(object_counts=(10, 1000), frame_counts=(100,))
+the whole bake on FakeCmds, with what it would cost in Maya, failing when a call count went up since baseline.json:
+    python -m secondary_motion.benchmark --pipeline --objects 10 100 --frames 100 --json new.json --baseline baseline.json
+the live preview playing and scrubbing back on one chain, frames a second it would keep up with:
+    python -m secondary_motion.benchmark --preview --objects 50 --frames 240
+
+Functions:
+- synthetic_driver(kind, frame_count, driver_count=1, seed=0)
+- synthetic_hierarchy(depth, width=1, driver_count=1)
+- run_case(object_count, frame_count, depth=None, driver="sine", backend="numpy", repeat=3, **params)
+- run_suite(object_counts=..., frame_counts=..., drivers=..., backends=None, ..., **params)
+- build_vertical_nurbs_hierarchy(depth, width=1, driver_count=1, frame_count=100, cmds=None)
+- run_pipeline_case(object_count, frame_count, depth=None, driver_count=1, costs=None, **bake_kwargs)
+- run_preview_case(object_count=50, frame_count=240, depth=None, costs=None, **params)
+- call_regressions(results, baseline)
+- main(argv=None)
+
+Drivers (what the parent does):
+- "sine": sways on x and bobs a little on y
+- "step": jumps back and forth on x every 25 frames, the worst case for the springs
+- "noise": a smoothed random walk (same seed, same walk)
+- anything else is a path to recorded positions, .npy or .json, (frames, 3) or (frames, drivers, 3),
+	looped or cut to the frame count
+
+Hierarchies:
+- vertical chains of circles 2 units apart like create_vertical_nurbs_hierarchy in test-file-set-up.py,
+	width chains of depth objects under every driver
+
+What comes back for every case:
+- seconds: best of repeat runs, fps: frames a second, joint_steps_per_second: objects * frames a second
+- peak_memory_bytes: the most memory python and numpy had on top of what was there before the run
+	(tracemalloc, one extra run so it doesn't slow down the timed ones, numba's own scratch arrays aren't counted)
+
+Pipeline cases (--pipeline): pipeline.bake on a FakeCmds scene made like test-file-set-up.py
+- seconds here, and modeled_maya_seconds: every cmds call priced with FakeCmds' cost model
+- calls: how many of every cmds call the bake made, the numbers to keep an eye on between versions
+	(call_regressions / --baseline lists every call that went up)
+
+Preview cases (--preview): preview.LivePreview following the timeline on the same scene, played forward
+and then scrubbed back a frame at a time (the worst case, every frame solves again from a checkpoint)
+- ms_per_frame: what the timeChanged callback took (the time change itself left out, Maya does that anyway)
+	with every call it made priced like --pipeline, fps: frames a second that keeps up with, 24+ is real time
+"""
+
+STEP_PERIOD = 25
+
+
+# Driver positions for frame_count frames: (frames, drivers, 3)
+def synthetic_driver(kind, frame_count, driver_count=1, seed=0):
+    time_list = np.arange(frame_count, dtype=float)[:, None]
+    spacing = 10.0 * np.arange(driver_count)
+    driver = np.zeros((frame_count, driver_count, 3))
+
+    if kind == "sine":
+        # every driver a little out of phase with the one before it
+        phase = np.arange(driver_count) * 0.5
+        driver[:, :, 0] = 3 * np.sin(time_list / 8.0 + phase)
+        driver[:, :, 1] = 0.5 * np.sin(time_list / 3.0 + phase)
+    elif kind == "step":
+        driver[:, :, 0] = np.where((time_list // STEP_PERIOD) % 2, 4.0, 0.0)
+    elif kind == "noise":
+        random = np.random.default_rng(seed)
+        walk = np.cumsum(random.normal(scale=0.3, size=(frame_count, driver_count, 3)), axis=0)
+        # a short moving average so it looks like animation and not like jitter
+        kernel = np.ones(5) / 5
+        driver = np.apply_along_axis(lambda values: np.convolve(values, kernel, mode="same"), 0, walk)
+    else:
+        driver = _recorded_driver(kind, frame_count, driver_count)
+
+    driver[:, :, 0] += spacing
+    return driver
+
+
+# Recorded positions from a file, looped (or cut) to frame_count and repeated for every driver
+def _recorded_driver(path, frame_count, driver_count):
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown driver {path}: use sine, step, noise or a .npy/.json file of positions.")
+    if path.endswith(".json"):
+        with open(path) as f:
+            recorded = np.asarray(json.load(f), dtype=float)
+    else:
+        recorded = np.load(path).astype(float)
+    if recorded.ndim == 2:
+        recorded = recorded[:, None]
+    recorded = np.resize(recorded, (frame_count,) + recorded.shape[1:])
+    return np.resize(recorded.transpose(1, 0, 2), (driver_count, frame_count, 3)).transpose(1, 0, 2).copy()
+
+
+# Rest positions and parent_index for width chains of depth objects under each of driver_count drivers
+# objects go up from their driver 2 units at a time, chains under the same driver sit 1 unit apart on z
+def synthetic_hierarchy(depth, width=1, driver_count=1):
+    rest_list = []
+    parent_index = []
+    for d in range(driver_count):
+        for w in range(width):
+            first = len(parent_index)
+            for i in range(depth):
+                parent_index.append(-d - 1 if i == 0 else first + i - 1)
+                rest_list.append((10.0 * d, 2.0 * (i + 1), float(w)))
+    return np.array(rest_list), np.array(parent_index)
+
+
+# Timing one shot: object_count objects (in chains of depth, one chain when depth is None) over frame_count frames
+def run_case(object_count, frame_count, depth=None, driver="sine", backend="numpy", repeat=3, driver_count=1,
+             **params):
+    depth = min(depth or object_count, object_count)
+    width = max(1, object_count // (depth * driver_count))
+    rest_positions, parent_index = synthetic_hierarchy(depth, width, driver_count)
+    driver_positions = synthetic_driver(driver, frame_count, driver_count)
+
+    def run():
+        return solver.solve(driver_positions, rest_positions, parent_index, backend=backend, **params)
+
+    # the first numba call compiles, that isn't what's being timed
+    if backend == "numba":
+        solver.solve(driver_positions[:2], rest_positions, parent_index, backend=backend, **params)
+
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        seconds = min(seconds, time.perf_counter() - start)
+    del result
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    objects = len(parent_index)
+    return {
+        "objects": objects,
+        "frames": frame_count,
+        "depth": depth,
+        "drivers": driver_count,
+        "driver": driver,
+        "backend": backend,
+        "params": {name: np.asarray(value).tolist() for name, value in params.items()},
+        "seconds": seconds,
+        "fps": frame_count / seconds,
+        "joint_steps_per_second": objects * frame_count / seconds,
+        "peak_memory_bytes": peak,
+    }
+
+
+# Every combination of object count, frame count, driver and backend
+# cases with more than max_joint_steps (objects * frames) are left out so the default run finishes in minutes
+# backends None is numpy, plus numba when it is installed
+def run_suite(object_counts=(10, 100, 1000, 10000), frame_counts=(50, 1000, 10000), drivers=("sine", "step", "noise"),
+              backends=None, depth=None, repeat=3, max_joint_steps=2 * 10 ** 7, log=None, **params):
+    if backends is None:
+        backends = ["numpy"] + (["numba"] if kernels.available() else [])
+
+    results = []
+    for backend in backends:
+        for driver in drivers:
+            for object_count in object_counts:
+                for frame_count in frame_counts:
+                    if max_joint_steps and object_count * frame_count > max_joint_steps:
+                        continue
+                    result = run_case(object_count, frame_count, depth, driver, backend, repeat, **params)
+                    results.append(result)
+                    if log:
+                        log(_row(result))
+    return results
+
+
+# The scene from test-file-set-up.py at any size, with the same maya.cmds calls (so it works in Maya too):
+# driver_count PARENT circles 10 units apart, each with width chains of depth circles going up 2 units at a time,
+# frozen so their position is in the scalePivot, the PARENTs keyed swaying on x, the first circle of every chain selected
+# gives back those first circles
+def build_vertical_nurbs_hierarchy(depth, width=1, driver_count=1, frame_count=100, cmds=None):
+    cmds = cmds or FakeCmds()
+    normal_value = [0, 1, 0]
+    cmds.file(new=True, force=True)
+
+    root_list = []
+    for d in range(driver_count):
+        parent_circle = cmds.circle(name="PARENT", radius=2, normal=normal_value)[0]
+        cmds.move(10 * d, 0, 0, parent_circle)
+        for frame in range(1, frame_count + 1, 4):
+            cmds.setKeyframe(parent_circle, attribute="translateX", t=frame, value=10 * d + 3 * np.sin(frame / 8.0))
+
+        for w in range(width):
+            previous = parent_circle
+            for i in range(depth):
+                circle = cmds.circle(name=f"chain{d}_{w}_{i}", radius=1, normal=normal_value)[0]
+                cmds.parent(circle, previous)
+                cmds.move(10 * d, 2 * (i + 1), w, circle)
+                cmds.makeIdentity(circle, apply=True, t=1, r=1, s=1, n=0)
+                if i == 0:
+                    root_list.append(circle)
+                previous = circle
+
+    cmds.select(root_list)
+    return root_list
+
+
+# Baking object_count objects (in chains of depth) for frame_count frames on FakeCmds
+# costs: FakeCmds' per call cost model, bake_kwargs go to pipeline.bake (workers, substeps...)
+def run_pipeline_case(object_count, frame_count, depth=None, driver_count=1, costs=None, **bake_kwargs):
+    depth = min(depth or object_count, object_count)
+    width = max(1, object_count // (depth * driver_count))
+    cmds = FakeCmds(costs=costs)
+    root_list = build_vertical_nurbs_hierarchy(depth, width, driver_count, frame_count, cmds)
+    # only what the bake does counts
+    cmds.reset_calls()
+
+    start = time.perf_counter()
+    bake(root_list, 1, frame_count, cmds=cmds, **bake_kwargs)
+    seconds = time.perf_counter() - start
+
+    objects = depth * width * driver_count
+    calls = sum(cmds.calls.values())
+    return {
+        "objects": objects,
+        "frames": frame_count,
+        "depth": depth,
+        "drivers": driver_count,
+        "bake": {name: np.asarray(value).tolist() for name, value in bake_kwargs.items()},
+        "seconds": seconds,
+        "modeled_maya_seconds": cmds.modeled_seconds,
+        "calls": dict(cmds.calls),
+        "calls_per_frame": calls / frame_count,
+        "calls_per_object_frame": calls / (objects * frame_count),
+    }
+
+
+# Playing the live preview of object_count objects (in chains of depth) forward and then back a frame at a time
+# costs: FakeCmds' per call cost model, params go to the solver
+def run_preview_case(object_count=50, frame_count=240, depth=None, costs=None, **params):
+    depth = min(depth or object_count, object_count)
+    width = max(1, object_count // depth)
+    cmds = FakeCmds(costs=costs)
+    root_list = build_vertical_nurbs_hierarchy(depth, width, 1, frame_count, cmds)
+    cmds.currentTime(1, edit=True)
+    preview = LivePreview(root_list, 1, cmds=cmds, **params)
+    preview.start()
+
+    result = {"objects": depth * width, "frames": frame_count, "depth": depth, "params": params}
+    for direction, frame_list in (("play", range(2, frame_count + 1)), ("scrub_back", range(frame_count - 1, 0, -1))):
+        seconds = 0.0
+        modeled_seconds = 0.0
+        for frame in frame_list:
+            # the time change without the preview, then only what the preview does
+            job = cmds.jobs.pop(preview.job)
+            cmds.currentTime(frame, edit=True)
+            cmds.jobs[preview.job] = job
+            before = cmds.modeled_seconds
+            start = time.perf_counter()
+            preview.update()
+            seconds += time.perf_counter() - start
+            modeled_seconds += cmds.modeled_seconds - before
+        ms_per_frame = 1000.0 * (seconds + modeled_seconds) / len(frame_list)
+        result[direction] = {"seconds": seconds, "modeled_maya_seconds": modeled_seconds,
+                             "ms_per_frame": ms_per_frame, "fps": 1000.0 / ms_per_frame}
+    preview.stop()
+    return result
+
+
+# Every call that went up since baseline (both lists of run_pipeline_case results),
+# as (objects, frames, depth, drivers, call, before, now), cases that aren't in both are left out
+def call_regressions(results, baseline):
+    def case(result):
+        return result["objects"], result["frames"], result["depth"], result["drivers"]
+
+    before_of = {case(result): result["calls"] for result in baseline}
+    regressions = []
+    for result in results:
+        before = before_of.get(case(result))
+        if before is None:
+            continue
+        for call, count in sorted(result["calls"].items()):
+            if count > before.get(call, 0):
+                regressions.append(case(result) + (call, before.get(call, 0), count))
+    return regressions
+
+
+# What is on this box, so results from different ones aren't compared by accident
+def machine_info():
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "numba": kernels.numba.__version__ if kernels.available() else None,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+HEADER = f"{'backend':<8}{'driver':<10}{'objects':>9}{'frames':>8}{'depth':>7}{'seconds':>10}{'fps':>12}" \
+         f"{'joint steps/s':>16}{'peak MB':>10}"
+
+
+def _row(result):
+    return (f"{result['backend']:<8}{os.path.basename(result['driver']):<10}{result['objects']:>9}"
+            f"{result['frames']:>8}{result['depth']:>7}{result['seconds']:>10.4f}{result['fps']:>12.1f}"
+            f"{result['joint_steps_per_second']:>16.3e}{result['peak_memory_bytes'] / 1e6:>10.2f}")
+
+
+PREVIEW_HEADER = f"{'objects':>9}{'frames':>8}{'depth':>7}{'play ms/frame':>15}{'play fps':>10}" \
+                 f"{'back ms/frame':>15}{'back fps':>10}"
+
+
+def _preview_row(result):
+    play, back = result["play"], result["scrub_back"]
+    return (f"{result['objects']:>9}{result['frames']:>8}{result['depth']:>7}{play['ms_per_frame']:>15.3f}"
+            f"{play['fps']:>10.1f}{back['ms_per_frame']:>15.3f}{back['fps']:>10.1f}")
+
+
+PIPELINE_HEADER = f"{'objects':>9}{'frames':>8}{'depth':>7}{'seconds':>10}{'maya seconds':>14}{'calls':>10}" \
+                  f"{'calls/frame':>13}  most calls"
+
+
+def _pipeline_row(result):
+    top = sorted(result["calls"].items(), key=lambda item: -item[1])[:3]
+    return (f"{result['objects']:>9}{result['frames']:>8}{result['depth']:>7}{result['seconds']:>10.4f}"
+            f"{result['modeled_maya_seconds']:>14.3f}{sum(result['calls'].values()):>10}"
+            f"{result['calls_per_frame']:>13.1f}  " + ", ".join(f"{call} {count}" for call, count in top))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the secondary motion solver on made up shots.")
+    parser.add_argument("--objects", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--frames", type=int, nargs="+", default=[50, 1000, 10000])
+    parser.add_argument("--drivers", nargs="+", default=["sine", "step", "noise"],
+                        help="sine, step, noise or .npy/.json files of recorded positions")
+    parser.add_argument("--backends", nargs="+", default=None, help="numpy and/or numba (default: what's installed)")
+    parser.add_argument("--depth", type=int, default=None, help="objects per chain (default: one chain)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-joint-steps", type=float, default=2e7, help="skip cases bigger than this, 0 for none")
+    parser.add_argument("--substeps", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=0)
+    parser.add_argument("--cascade", action="store_true")
+    parser.add_argument("--precision", choices=list(solver.PRECISIONS), default="float64")
+    parser.add_argument("--pipeline", action="store_true", help="bake on FakeCmds instead of only solving")
+    parser.add_argument("--preview", action="store_true", help="time the live preview on FakeCmds")
+    parser.add_argument("--baseline", help="a --pipeline --json file to compare call counts with")
+    parser.add_argument("--json", help="write the results here")
+    args = parser.parse_args(argv)
+    solver_params = dict(substeps=args.substeps, iterations=args.iterations, cascade=args.cascade,
+                         precision=args.precision)
+
+    if args.preview:
+        print(PREVIEW_HEADER)
+        results = []
+        for object_count in args.objects:
+            for frame_count in args.frames:
+                results.append(run_preview_case(object_count, frame_count, args.depth, **solver_params))
+                print(_preview_row(results[-1]))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"machine": machine_info(), "preview": results}, f, indent=1)
+        return results
+
+    if not args.pipeline:
+        print(HEADER)
+        results = run_suite(args.objects, args.frames, args.drivers, args.backends, args.depth, args.repeat,
+                            int(args.max_joint_steps), log=print, **solver_params)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"machine": machine_info(), "results": results}, f, indent=1)
+        return results
+
+    print(PIPELINE_HEADER)
+    results = []
+    for object_count in args.objects:
+        for frame_count in args.frames:
+            if args.max_joint_steps and object_count * frame_count > args.max_joint_steps:
+                continue
+            results.append(run_pipeline_case(object_count, frame_count, args.depth, **solver_params))
+            print(_pipeline_row(results[-1]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"machine": machine_info(), "pipeline": results}, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = call_regressions(results, json.load(f).get("pipeline", []))
+        for objects, frames, depth, drivers, call, before, count in regressions:
+            print(f"more {call} calls: {before} -> {count} ({objects} objects, {frames} frames, depth {depth})")
+        if regressions:
+            raise SystemExit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
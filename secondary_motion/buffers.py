@@ -0,0 +1,109 @@
+import os
+import shutil
+
+import numpy as np
+
+"""
+What code does:
+keeps the arrays of a bake in memory mapped .npy files instead of in memory, so
+- big batches don't need all of it in memory at once (the OS pages it in and out)
+- solver workers (secondary_motion.parallel) write their part of the solved positions straight into the file
+	instead of pickling it back
+- a bake that crashed (or Maya that crashed) picks up from the last frames it got to, instead of starting over
+
+Classes:
+- BakeBuffers(directory, key, frame_count, driver_count, object_count, chunk, dtype=float)
+	.mark_sampled(frames) / .mark_solved(frames) / .reset() / .remove()
+
+Files, one folder per bake (key) in directory:
+- samples.npy          (frames, drivers, 3) like sampling.sample_scene, only the drivers
+- rest_positions.npy   (objects, 3) the objects on the first frame, the solver starts from them
+- parent_matrices.npy  (frames, drivers, 4, 4)
+- solved.npy           (frames, objects, 3)
+- checkpoints.npy      (chunks + 1, 2, objects, 3) the (current, previous) solver state every chunk frames
+- progress.npy         how many frames are sampled and how many are solved
+samples, rest positions, solved and checkpoints are in dtype (np.float32 for the solver's precision="float32", half the size),
+the parent matrices are always float64
+
+Picking up again:
+- everything gets done chunk frames at a time, and the progress is only moved on once that chunk is
+	flushed to disk, so whatever the progress says is done really is there
+- the key should change whenever anything about the bake changes (pipeline uses the cache's solve key),
+	a folder for another key is never looked at
+"""
+
+
+class BakeBuffers(object):
+
+    # Opening the buffers of the bake called key, or making them when there aren't any (or they don't fit)
+    def __init__(self, directory, key, frame_count, driver_count, object_count, chunk, dtype=float):
+        self.path = os.path.join(directory, key)
+        os.makedirs(self.path, exist_ok=True)
+        self.frame_count = frame_count
+        self.chunk = chunk
+
+        self._made_new = False
+        self.samples = self._open("samples", (frame_count, driver_count, 3), dtype)
+        self.rest_positions = self._open("rest_positions", (object_count, 3), dtype)
+        self.parent_matrices = self._open("parent_matrices", (frame_count, driver_count, 4, 4))
+        self.solved = self._open("solved", (frame_count, object_count, 3), dtype)
+        self.checkpoints = self._open("checkpoints", (-(-frame_count // chunk) + 1, 2, object_count, 3), dtype)
+        self.progress = self._open("progress", (2,), np.int64)
+        # one of them was made from scratch, so none of the others can be trusted
+        if self._made_new:
+            self.reset()
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".npy")
+
+    def _open(self, name, shape, dtype=float):
+        path = self._file(name)
+        if os.path.exists(path):
+            try:
+                array = np.load(path, mmap_mode="r+")
+            except ValueError:
+                array = None
+            if array is not None and array.shape == shape and array.dtype == dtype:
+                return array
+        self._made_new = True
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    # The path of solved.npy, for workers that open it themselves
+    @property
+    def solved_path(self):
+        return self._file("solved")
+
+    # Frames (from the start) that are sampled / solved and on disk
+    @property
+    def sampled_frames(self):
+        return int(self.progress[0])
+
+    @property
+    def solved_frames(self):
+        return int(self.progress[1])
+
+    # Moving the progress on, only after what it counts is flushed
+    def mark_sampled(self, frames):
+        self.samples.flush()
+        self.rest_positions.flush()
+        self.parent_matrices.flush()
+        self.progress[0] = frames
+        self.progress.flush()
+
+    def mark_solved(self, frames):
+        self.solved.flush()
+        self.checkpoints.flush()
+        self.progress[1] = frames
+        self.progress.flush()
+
+    # Starting over, nothing in the files counts as done anymore
+    def reset(self):
+        self.progress[:] = 0
+        self.progress.flush()
+
+    # Deleting the folder once the keys are on, the arrays can't be used after this
+    def remove(self):
+        for name in ("samples", "rest_positions", "parent_matrices", "solved", "checkpoints", "progress"):
+            # let go of the mapping first, windows won't delete a mapped file
+            setattr(self, name, None)
+        shutil.rmtree(self.path, ignore_errors=True)
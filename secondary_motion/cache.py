@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from secondary_motion.curves import CHANNELS
+from secondary_motion.scene import get_cmds
+
+"""
+What code does:
+keeps the sampled parent and the solved positions on disk, so running the script again
+with only k/damping changed skips the sampling, and running it again with nothing changed skips the solving too
+(what they were made from is the parent's animation and the chain's own rest pose, see "What goes in the key")
+
+Functions:
+- curve_data(node_list, cmds=None)
+- animation_hash(node_list, cmds=None) / hash_curves(curves)
+- keyed_hash(node_list, cmds=None)
+- ancestor_paths(node)
+- rest_hash(local_matrices, scale_pivots) / same_rest(old_positions, new_positions)
+- sample_key(animation, node_list, start_frame, end_frame, use_time_context=False, precision="float64", rest="")
+- solve_key(sampled, params)
+- last_bake_key(node_list, start_frame, end_frame, params)
+- changed_frame(old_curves, new_curves)
+- dump_curves(curves) / load_curves(dumped)
+- default_cache_directory(cmds=None)
+- SimulationCache(directory=None, max_bytes=512MB).load(key) / .save(key, **arrays)
+
+What goes in the key:
+- sampling: every key (time, value, tangents) on every anim curve of the parent and its ancestors,
+	everything else that goes into their local matrix as it is (the whole local matrix for the ones without curves,
+	every channel and pivot without a curve on the ones with some), the node paths and the frame range
+- and the chain's own rest pose: what its local matrices are made of besides translate
+	(rotate, scale, shear and scalePivot, rest_hash), its translate keys are left out, bake writes those
+- the chain's positions on the first frame aren't in the key but every entry has them (rest_positions),
+	they get checked with same_rest before anything is used: a bake keys the first frame too,
+	through the parents' inverse matrices, so they come back a rounding off and would never hash the same
+- solving: the sampling key plus dt, mass, force, damping, k and every other solver param
+- anything moving the parent that isn't an anim curve (constraints, expressions) is not seen, turn the cache off for those
+
+Re-simulating only what changed:
+- the last bake of a chain (same nodes, frame range and params) remembers the curves it was made from
+- changed_frame compares those to the curves now and gives back the first frame that can look different
+	(a key changing also changes the curve back to the key before it, so that is where it starts)
+- it also remembers the translate keys it left on the objects (keyed_hash), only keying from the changed frame
+	on is right while those are still on them: a bake with other params (or keys edited by hand) in between
+	means every frame gets keyed again
+
+On disk:
+- one .npz per key in a folder next to the scene (temp folder for untitled scenes)
+- least recently used files go first once the folder is bigger than max_bytes
+"""
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+TANGENT_FLAGS = ("inAngle", "outAngle", "inWeight", "outWeight")
+# what goes into a local matrix besides the curves (see secondary_motion.curves)
+STATIC_ATTRIBUTES = CHANNELS + ("rotatePivot", "scalePivot", "rotateOrder", "shear", "rotateAxis")
+
+
+# Every key on every anim curve of every node, as {node: [(curve, times, values, tangents), ...]}
+# a node with no curves at all gets its local matrix instead, so moving it by hand still changes the hash,
+# a node with some gets ("static", [(attribute, value), ...]) for everything without a curve on it
+# (rotating a parent that is only keyed on translateX changes the hash too)
+def curve_data(node_list, cmds=None):
+    cmds = get_cmds(cmds)
+    data = {}
+    for node in node_list:
+        curves = []
+        for curve in cmds.keyframe(node, query=True, name=True) or []:
+            times = cmds.keyframe(curve, query=True, timeChange=True) or []
+            values = cmds.keyframe(curve, query=True, valueChange=True) or []
+            tangents = [list(cmds.keyTangent(curve, query=True, **{flag: True}) or []) for flag in TANGENT_FLAGS]
+            curves.append((curve, list(times), list(values), tangents))
+        if not curves:
+            curves.append(("matrix", list(cmds.xform(node, query=True, matrix=True))))
+        else:
+            curves.append(("static", _static_values(node, {curve for curve, *_ in curves}, cmds)))
+        data[node] = curves
+    return data
+
+
+# Every STATIC_ATTRIBUTES value of node that none of curve_list is connected to
+def _static_values(node, curve_list, cmds):
+    connections = cmds.listConnections(node, source=True, destination=False, plugs=True, connections=True) or []
+    keyed = {plug.rsplit(".", 1)[-1] for plug, source in zip(connections[::2], connections[1::2])
+             if source.split(".")[0] in curve_list}
+    return [(attribute, np.ravel(cmds.getAttr(f"{node}.{attribute}")).tolist())
+            for attribute in STATIC_ATTRIBUTES if attribute not in keyed]
+
+
+# Hash of everything animating the given nodes
+def animation_hash(node_list, cmds=None):
+    return hash_curves(curve_data(node_list, cmds))
+
+
+def hash_curves(curves):
+    return _hash(sorted(curves.items()))
+
+
+# Hash of the translate keys (times and values) on the objects themselves, what a bake left on them
+def keyed_hash(node_list, cmds=None):
+    cmds = get_cmds(cmds)
+    keys = []
+    for node in node_list:
+        for axis in "XYZ":
+            plug = f"{node}.translate{axis}"
+            keys.append((cmds.keyframe(plug, query=True, timeChange=True) or [],
+                         cmds.keyframe(plug, query=True, valueChange=True) or []))
+    return _hash(keys)
+
+
+# Full path of the parent and every node above it, the parent's world position depends on all of them
+def ancestor_paths(node):
+    parts = node.split("|")
+    return ["|".join(parts[:i]) for i in range(2, len(parts) + 1)]
+
+
+def _hash(value):
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
+
+
+# numpy arrays (like force) don't repr the same way every time, lists do
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+# Hash of the objects' rest pose without their translate, local_matrices and scale_pivots from
+# keys.rest_local_matrices (only the 3x3 part, the translation row is worked out from translate, see same_rest)
+def rest_hash(local_matrices, scale_pivots):
+    return _hash((np.asarray(local_matrices)[:, :3, :3].tolist(), np.asarray(scale_pivots).tolist()))
+
+
+# The objects' positions on the first frame now against the ones an entry was made from,
+# close enough counts (a bake leaves them a rounding off, float32 ones a float32 rounding)
+def same_rest(old_positions, new_positions):
+    return np.allclose(old_positions, new_positions, rtol=1e-6, atol=1e-6)
+
+
+# Key for the sampled arrays (float32 samples are no good to a float64 bake, so the precision is in it too)
+# rest: rest_hash of the objects
+def sample_key(animation, node_list, start_frame, end_frame, use_time_context=False, precision="float64", rest=""):
+    return _hash(("sample", animation, list(node_list), start_frame, end_frame, use_time_context, precision, rest))
+
+
+# Key for the solved arrays: same sampling plus the same solver params
+def solve_key(sampled, params):
+    return _hash(("solve", sampled, sorted((name, _plain(value)) for name, value in params.items())))
+
+
+# Key for the last bake of a chain, whatever the animation was
+def last_bake_key(node_list, start_frame, end_frame, params):
+    return _hash(("last bake", list(node_list), start_frame, end_frame,
+                  sorted((name, _plain(value)) for name, value in params.items())))
+
+
+# curve_data as a string for the .npz and back (json turns the tuples into lists, so compare after a round trip)
+def dump_curves(curves):
+    return np.array(json.dumps(curves, sort_keys=True))
+
+
+def load_curves(dumped):
+    return json.loads(str(dumped))
+
+
+# First frame where the animation in new_curves can differ from old_curves
+# None: nothing changed, -inf: something changed that moves every frame (a node or curve was added or removed,
+# a node without curves was moved, or a channel without a curve was changed)
+def changed_frame(old_curves, new_curves):
+    new_curves = json.loads(json.dumps(new_curves, sort_keys=True))
+    if sorted(old_curves) != sorted(new_curves):
+        return float("-inf")
+
+    first_change = None
+    for node, new_list in new_curves.items():
+        old_list = old_curves[node]
+        if len(old_list) != len(new_list):
+            return float("-inf")
+
+        for old, new in zip(old_list, new_list):
+            if old == new:
+                continue
+            if old[0] != new[0] or old[0] in ("matrix", "static"):
+                return float("-inf")
+
+            # old and new are (curve, times, values, tangents), find the first key that isn't the same
+            old_keys = list(zip(old[1], old[2], _per_key(old[3], len(old[1]))))
+            new_keys = list(zip(new[1], new[2], _per_key(new[3], len(new[1]))))
+            i = 0
+            while i < min(len(old_keys), len(new_keys)) and old_keys[i] == new_keys[i]:
+                i += 1
+            if i == 0:
+                return float("-inf")
+
+            # the curve is the same up to the key before the first changed one
+            frame = old_keys[i - 1][0]
+            first_change = frame if first_change is None else min(first_change, frame)
+    return first_change
+
+
+# tangents are one list per TANGENT_FLAGS entry, turn them into one (in angle, out angle, ...) per key
+def _per_key(tangents, key_count):
+    return [tuple(flag_list[i] for flag_list in tangents) for i in range(key_count)]
+
+
+# Folder next to the scene: scene.ma -> scene_secondary_motion_cache/
+def default_cache_directory(cmds=None):
+    cmds = get_cmds(cmds)
+    scene = cmds.file(query=True, sceneName=True)
+    if not scene:
+        return os.path.join(tempfile.gettempdir(), "secondary_motion_cache")
+    return os.path.splitext(scene)[0] + "_secondary_motion_cache"
+
+
+class SimulationCache(object):
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, cmds=None):
+        self.directory = directory or default_cache_directory(cmds)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    # Arrays saved under key as a dict, or None if they aren't there
+    def load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        # touch it so it counts as recently used
+        os.utime(path)
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def save(self, key, **arrays):
+        # write next to it and rename, so a crash never leaves half a file behind under the real name
+        path = self._path(key)
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+        self._evict()
+
+    # Least recently used go first until everything fits under max_bytes
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.directory, name))
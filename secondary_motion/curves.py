@@ -0,0 +1,205 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from secondary_motion.scene import get_cmds
+
+"""
+What code does:
+works out where a transform is at any time straight from its anim curves, without ever moving the timeline,
+for parents (and what's above them) that are only moved by anim curves
+(every time change makes Maya evaluate the whole scene, which is the slowest part of a bake on a heavy rig)
+
+Functions:
+- frames_per_second(cmds=None)
+- curve_channels(path, cmds=None)
+- read_curve(curve, frames_per_second=24.0, cmds=None)
+- evaluate_curve(curve, time_list)
+- transform_matrices(translate, rotate, scale, rotate_pivot=..., scale_pivot=..., ...)
+- curve_local_matrices(path, time_list, frames_per_second=24.0, cmds=None)
+
+When it's used (secondary_motion.sampling does, for every node with something coming into it):
+- the node is a plain transform and everything coming into it is a time anim curve
+	(animCurveTL/TA/TU) on translate, rotate or scale, nothing on the pivots, shear, rotate order...
+	(constraints, expressions, driven keys, anim layers, joints: it goes back to reading Maya)
+- no weighted tangents, constant pre and post infinity
+- what comes out is checked against Maya's own matrix (getAttr .matrix, time=) at a few times in between keys,
+	anything that doesn't match (units, something not thought of) goes back to reading Maya too
+
+How a curve is evaluated, like Maya does for unweighted curves:
+- before the first key and after the last one: the value of that key
+- step out tangent: the key's value until the next key (stepnext: the next key's)
+- otherwise a cubic hermite between two keys with the out slope of the first and the in slope of the second,
+	a linear tangent points straight at the key next to it, any other slope comes from the tangent angle
+	(keyTangent angles are against time in seconds, so frames_per_second turns them into value per frame)
+
+The local matrix is Maya's:
+[-scalePivot] scale shear [scalePivot] [scalePivotTranslate] [-rotatePivot] rotateAxis rotate [rotatePivot]
+[rotatePivotTranslate] translate, row vectors like everywhere else in secondary_motion
+"""
+
+CHANNELS = tuple(attribute + axis for attribute in ("translate", "rotate", "scale") for axis in "XYZ")
+# anything else on these goes into the matrix too, so a node with something coming into them is left to Maya
+MATRIX_ATTRIBUTES = ("translate", "rotate", "scale", "shear", "inheritsTransform", "offsetParentMatrix")
+TIME_CURVE_TYPES = ("animCurveTL", "animCurveTA", "animCurveTU")
+ROTATE_ORDERS = ("xyz", "yzx", "zxy", "xzy", "yxz", "zyx")
+TIME_UNITS = {"game": 15.0, "film": 24.0, "pal": 25.0, "ntsc": 30.0, "show": 48.0, "palf": 50.0, "ntscf": 60.0}
+
+# one anim curve: key times (frames) and values, in and out slopes (value per frame) and tangent types per key
+AnimCurve = namedtuple("AnimCurve", ["times", "values", "in_slopes", "out_slopes", "in_types", "out_types"])
+
+
+# Frames per second of the scene's time unit (film, ntsc, 23.976fps...)
+def frames_per_second(cmds=None):
+    cmds = get_cmds(cmds)
+    unit = cmds.currentUnit(query=True, time=True)
+    if unit in TIME_UNITS:
+        return TIME_UNITS[unit]
+    match = re.match(r"([\d.]+)fps", unit)
+    if match is None:
+        cmds.error(f"Unknown time unit: {unit}")
+    return float(match.group(1))
+
+
+# The anim curve on every channel of path, {"translateX": curve name, ...},
+# or None when anything else moves it (see "When it's used" at the top)
+def curve_channels(path, cmds=None):
+    cmds = get_cmds(cmds)
+    if cmds.nodeType(path) != "transform":
+        return None
+    connections = cmds.listConnections(path, source=True, destination=False, plugs=True, connections=True) or []
+
+    channels = {}
+    for plug, source in zip(connections[::2], connections[1::2]):
+        attribute = plug.rsplit(".", 1)[-1]
+        if attribute in CHANNELS:
+            if cmds.nodeType(source.split(".")[0]) not in TIME_CURVE_TYPES:
+                return None
+            channels[attribute] = source.split(".")[0]
+        elif attribute.startswith(MATRIX_ATTRIBUTES):
+            return None
+    return channels
+
+
+# Keys and tangents of one curve, None when it can't be evaluated here (weighted tangents, cycling infinity...)
+def read_curve(curve, frames_per_second=24.0, cmds=None):
+    cmds = get_cmds(cmds)
+    if any(cmds.keyTangent(curve, query=True, weightedTangents=True) or [False]):
+        return None
+    for flag in ("preInfinite", "postInfinite"):
+        if (cmds.setInfinity(curve, query=True, **{flag: True}) or ["constant"])[0] != "constant":
+            return None
+
+    times = np.array(cmds.keyframe(curve, query=True, timeChange=True) or [], dtype=float)
+    if not len(times):
+        return None
+    values = np.array(cmds.keyframe(curve, query=True, valueChange=True), dtype=float)
+
+    def tangent(flag):
+        return cmds.keyTangent(curve, query=True, **{flag: True}) or [0.0] * len(times)
+
+    in_slopes = np.tan(np.radians(np.array(tangent("inAngle"), dtype=float))) / frames_per_second
+    out_slopes = np.tan(np.radians(np.array(tangent("outAngle"), dtype=float))) / frames_per_second
+    in_types = np.array(cmds.keyTangent(curve, query=True, inTangentType=True) or ["auto"] * len(times))
+    out_types = np.array(cmds.keyTangent(curve, query=True, outTangentType=True) or ["auto"] * len(times))
+    return AnimCurve(times, values, in_slopes, out_slopes, in_types, out_types)
+
+
+# Value of the curve at every time in time_list (frames, in between frames too), all at once
+def evaluate_curve(curve, time_list):
+    time = np.asarray(time_list, dtype=float)
+    times, values = curve.times, curve.values
+    if len(times) == 1:
+        return np.full(time.shape, values[0])
+
+    segment = np.clip(np.searchsorted(times, time, side="right") - 1, 0, len(times) - 2)
+    t0, t1 = times[segment], times[segment + 1]
+    y0, y1 = values[segment], values[segment + 1]
+    span = t1 - t0
+    s = np.clip((time - t0) / span, 0.0, 1.0)
+
+    # a linear tangent points straight at the key next to it
+    chord = (y1 - y0) / span
+    out_type = curve.out_types[segment]
+    m0 = np.where(out_type == "linear", chord, curve.out_slopes[segment])
+    m1 = np.where(curve.in_types[segment + 1] == "linear", chord, curve.in_slopes[segment + 1])
+
+    s2 = s * s
+    s3 = s2 * s
+    value = ((2 * s3 - 3 * s2 + 1) * y0 + (s3 - 2 * s2 + s) * span * m0
+             + (-2 * s3 + 3 * s2) * y1 + (s3 - s2) * span * m1)
+    value = np.where((out_type == "step") & (s < 1), y0, value)
+    value = np.where((out_type == "stepnext") & (s > 0), y1, value)
+    # held before the first key and after the last one
+    value = np.where(time <= times[0], values[0], value)
+    return np.where(time >= times[-1], values[-1], value)
+
+
+# (frames, 3, 3) rotations for row vectors from (frames, 3) degrees, order "xyz" is X then Y then Z
+def _rotation_matrices(rotate, order="xyz"):
+    angles = np.radians(np.asarray(rotate, dtype=float))
+    cos, sin = np.cos(angles), np.sin(angles)
+    one, zero = np.ones(len(angles)), np.zeros(len(angles))
+    axis_matrix = {
+        "x": np.stack([one, zero, zero, zero, cos[:, 0], sin[:, 0], zero, -sin[:, 0], cos[:, 0]], axis=1),
+        "y": np.stack([cos[:, 1], zero, -sin[:, 1], zero, one, zero, sin[:, 1], zero, cos[:, 1]], axis=1),
+        "z": np.stack([cos[:, 2], sin[:, 2], zero, -sin[:, 2], cos[:, 2], zero, zero, zero, one], axis=1),
+    }
+    first, second, third = (axis_matrix[axis].reshape(-1, 3, 3) for axis in order)
+    return first @ second @ third
+
+
+# Maya's local matrix for every frame, translate / rotate (degrees) / scale are (frames, 3), the rest doesn't move
+def transform_matrices(translate, rotate, scale, rotate_pivot=(0, 0, 0), scale_pivot=(0, 0, 0),
+                       rotate_pivot_translate=(0, 0, 0), scale_pivot_translate=(0, 0, 0), shear=(0, 0, 0),
+                       rotate_axis=(0, 0, 0), rotate_order=0):
+    translate, scale = np.asarray(translate, dtype=float), np.asarray(scale, dtype=float)
+    rotate_pivot, scale_pivot = np.asarray(rotate_pivot, dtype=float), np.asarray(scale_pivot, dtype=float)
+    xy, xz, yz = shear
+    shear_matrix = np.array([[1.0, 0.0, 0.0], [xy, 1.0, 0.0], [xz, yz, 1.0]])
+    axis = _rotation_matrices([rotate_axis])[0]
+    rotation = axis @ _rotation_matrices(rotate, ROTATE_ORDERS[int(rotate_order)])
+
+    matrices = np.zeros((len(translate), 4, 4))
+    matrices[:, :3, :3] = (scale[:, :, None] * shear_matrix) @ rotation
+    pivot_row = (-scale_pivot * scale) @ shear_matrix + scale_pivot + scale_pivot_translate - rotate_pivot
+    matrices[:, 3, :3] = np.einsum("fi,fij->fj", pivot_row, rotation) + rotate_pivot + rotate_pivot_translate + translate
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+# The local matrix of path at every time in time_list from its anim curves,
+# None when it can't be done here or doesn't come out the same as Maya's
+def curve_local_matrices(path, time_list, frames_per_second=24.0, cmds=None):
+    cmds = get_cmds(cmds)
+    channels = curve_channels(path, cmds)
+    if not channels:
+        return None
+    curves = {attribute: read_curve(curve, frames_per_second, cmds) for attribute, curve in channels.items()}
+    if any(curve is None for curve in curves.values()):
+        return None
+
+    static = {attribute: cmds.getAttr(f"{path}.{attribute}")[0] for attribute in
+              ("translate", "rotate", "scale", "rotatePivot", "scalePivot", "rotatePivotTranslate",
+               "scalePivotTranslate", "shear", "rotateAxis")}
+    rotate_order = cmds.getAttr(path + ".rotateOrder")
+
+    def matrices_at(times):
+        values = {}
+        for attribute in ("translate", "rotate", "scale"):
+            values[attribute] = np.tile(np.asarray(static[attribute], dtype=float), (len(times), 1))
+            for a, axis in enumerate("XYZ"):
+                if attribute + axis in curves:
+                    values[attribute][:, a] = evaluate_curve(curves[attribute + axis], times)
+        return transform_matrices(values["translate"], values["rotate"], values["scale"], static["rotatePivot"],
+                                  static["scalePivot"], static["rotatePivotTranslate"], static["scalePivotTranslate"],
+                                  static["shear"], static["rotateAxis"], rotate_order)
+
+    # checked against Maya in between keys, where the tangents matter
+    first, last = float(np.min(time_list)), float(np.max(time_list))
+    check_times = [first + (last - first) * fraction for fraction in (0.237, 0.613, 0.891)]
+    maya = np.array([np.reshape(cmds.getAttr(path + ".matrix", time=time), (4, 4)) for time in check_times])
+    if not np.allclose(matrices_at(check_times), maya, rtol=1e-6, atol=1e-6):
+        return None
+    return matrices_at(np.asarray(time_list, dtype=float))
@@ -0,0 +1,755 @@
+import builtins
+import fnmatch
+import functools
+import json
+import math
+from collections import Counter
+
+import numpy as np
+
+"""
+What code does:
+an in-memory stand-in for the bits of maya.cmds the scripts use, so the pipeline can run
+without a Maya session (farm nodes without licenses, CI, profiling)
+
+Usage:
+    from secondary_motion.fake_cmds import FakeCmds
+    cmds = FakeCmds()
+    cmds.create_node("PARENT")
+    cmds.create_node("SELECT_THIS", parent="PARENT", scale_pivot=[0, 2, 0])
+    cmds.set_keys("PARENT", "translateX", {1: 0, 25: 5, 50: 0})
+and then pass cmds=cmds to anything in secondary_motion
+(or build the scene with the same calls as in Maya: circle, parent, move, makeIdentity... see test-file-set-up.py)
+
+What it keeps:
+- a hierarchy of transforms (short names have to be unique, full paths like "|PARENT|SELECT_THIS" work too)
+- translate, rotate (degrees, xyz order), scale, rotatePivot and scalePivot per transform
+- keys per channel (translateX, rotateY, scaleZ...), evaluated linearly between keys
+	and held before the first and after the last key
+- the playback range and the current time, changing it re-evaluates every keyed channel like Maya does
+	and then runs the timeChanged scriptJobs (their calls count like any other)
+- world matrices built the way Maya builds them, pivots included (row vectors, translation in the last row),
+	kept until something changes
+
+- a scene file: file(rename=path), file(save=True) and file(path, open=True) save and open all of the above
+	as json (not a Maya file, only FakeCmds can open it), so a batch can run on made up shots without Maya
+
+What it doesn't:
+- geometry, constraints, expressions, any other node type than transforms and their shapes
+- shear, rotate orders other than xyz, rotateAxis, pivot translates (getAttr gives back zeros for those)
+- tangents, every key is linear with constant infinity
+
+Counting and pricing calls (for profiling a change without Maya):
+- every maya.cmds call made on it is counted in calls (calls it makes to itself aren't)
+- costs is seconds per call in Maya, a number or a function of (cmds, args, kwargs) for calls that
+	get slower with the scene (currentTime evaluates everything that is keyed),
+	modeled_seconds adds them up, so two versions of the pipeline can be compared on what they'd cost in Maya
+- DEFAULT_COSTS are rough numbers for a light scene, time the calls in your own Maya
+	(secondary_motion.profiling) and pass those for anything that matters
+- log_calls=True also keeps every call in call_log, in order
+- reset_calls() starts counting again, call_report() is one row per call
+"""
+
+AXES = ("X", "Y", "Z")
+TRANSFORM_ATTRIBUTES = ("translate", "rotate", "scale")
+
+
+# Seconds per call in Maya, the time changes get slower the more there is to evaluate
+def _time_change_cost(cmds, args, kwargs):
+    if kwargs.get("query") or not args:
+        return 2e-6
+    return 1e-4 + 2e-6 * cmds.keyed_count
+
+
+DEFAULT_COSTS = {
+    "ls": 2e-5,
+    "select": 2e-5,
+    "listRelatives": 3e-5,
+    "nodeType": 5e-6,
+    "currentTime": _time_change_cost,
+    "pointPosition": 3e-5,
+    "xform": 3e-5,
+    "move": 5e-5,
+    "spaceLocator": 3e-4,
+    "circle": 4e-4,
+    "parent": 2e-4,
+    "makeIdentity": 3e-4,
+    "setKeyframe": 1.5e-4,
+    "cutKey": 1e-4,
+    "keyframe": 3e-5,
+    "keyTangent": 3e-5,
+    "listConnections": 2e-5,
+    "setInfinity": 2e-5,
+    "scriptJob": 2e-5,
+    "currentUnit": 5e-6,
+    "getAttr": lambda cmds, args, kwargs: 5e-5 if "time" in kwargs else 1e-5,
+    "setAttr": 2e-5,
+    "delete": 2e-4,
+    "file": 1e-3,
+    "playbackOptions": 1e-5,
+    "warning": 1e-5,
+    "error": 1e-5,
+}
+
+
+# Counting (and pricing) a maya.cmds call, only when it's made from outside,
+# FakeCmds calling itself (move -> xform) isn't a call Maya would see
+def _maya_call(method):
+    name = method.__name__
+
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        if self._depth == 0:
+            self._record(name, args, kwargs)
+        self._depth += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._depth -= 1
+    return call
+
+
+# Rotation (degrees, xyz order) as a 3x3 for row vectors, Maya's X then Y then Z
+def _rotation_matrix(rotate):
+    if not any(rotate):
+        return np.eye(3)
+    x, y, z = (math.radians(value) for value in rotate)
+    rx = np.array([[1, 0, 0], [0, math.cos(x), math.sin(x)], [0, -math.sin(x), math.cos(x)]])
+    ry = np.array([[math.cos(y), 0, -math.sin(y)], [0, 1, 0], [math.sin(y), 0, math.cos(y)]])
+    rz = np.array([[math.cos(z), math.sin(z), 0], [-math.sin(z), math.cos(z), 0], [0, 0, 1]])
+    return rx @ ry @ rz
+
+
+# Back from a rotation matrix to xyz degrees
+def _rotation_angles(rotation):
+    y = math.asin(max(-1.0, min(1.0, -rotation[0, 2])))
+    if abs(rotation[0, 2]) < 1 - 1e-9:
+        x = math.atan2(rotation[1, 2], rotation[2, 2])
+        z = math.atan2(rotation[0, 1], rotation[0, 0])
+    else:
+        # gimbal lock, all of it goes on x
+        x = math.atan2(-rotation[2, 1], rotation[1, 1])
+        z = 0.0
+    return [math.degrees(x), math.degrees(y), math.degrees(z)]
+
+
+# Maya's local matrix: [-scalePivot] scale [scalePivot] [-rotatePivot] rotate [rotatePivot] translate
+def _local_matrix(translate, rotate, scale, rotate_pivot, scale_pivot):
+    rotation = _rotation_matrix(rotate)
+    scale_pivot = np.asarray(scale_pivot, dtype=float)
+    rotate_pivot = np.asarray(rotate_pivot, dtype=float)
+    matrix = np.eye(4)
+    matrix[:3, :3] = np.asarray(scale, dtype=float)[:, None] * rotation
+    matrix[3, :3] = (scale_pivot - scale_pivot * scale - rotate_pivot) @ rotation + rotate_pivot + translate
+    return matrix
+
+
+# The translate, rotate and scale that give matrix with these pivots (no shear)
+def _decompose(matrix, rotate_pivot, scale_pivot):
+    scale = np.linalg.norm(matrix[:3, :3], axis=1)
+    rotation = matrix[:3, :3] / scale[:, None]
+    scale_pivot = np.asarray(scale_pivot, dtype=float)
+    rotate_pivot = np.asarray(rotate_pivot, dtype=float)
+    translate = matrix[3, :3] - rotate_pivot - (scale_pivot - scale_pivot * scale - rotate_pivot) @ rotation
+    return translate.tolist(), _rotation_angles(rotation), scale.tolist()
+
+
+class FakeCmds(object):
+
+    def __init__(self, costs=None, log_calls=False):
+        self.nodes = {}
+        self.selection = []
+        self.time = 1.0
+        self.playback_range = [1.0, 120.0]
+        self.scene_name = ""
+        self.costs = dict(DEFAULT_COSTS, **(costs or {}))
+        self.log_calls = log_calls
+        self._depth = 0
+        self._world_cache = {}
+        # {job number: (event, function)}
+        self.jobs = {}
+        self._next_job = 1
+        self.reset_calls()
+
+    #########################################################################################
+    # SETTING UP A SCENE ####################################################################
+    #########################################################################################
+
+    # Create a transform, the pivots are in object space like Maya's (rotate_pivot is the scale_pivot by default)
+    def create_node(self, name, parent=None, translate=(0, 0, 0), scale_pivot=(0, 0, 0), node_type="transform",
+                    rotate=(0, 0, 0), scale=(1, 1, 1), rotate_pivot=None):
+        if name in self.nodes:
+            self.error(f"{name} already exists.")
+        parent = self._short(parent) if parent else None
+        self.nodes[name] = {
+            "type": node_type,
+            "parent": parent,
+            "children": [],
+            "translate": [float(value) for value in translate],
+            "rotate": [float(value) for value in rotate],
+            "scale": [float(value) for value in scale],
+            "rotatePivot": [float(value) for value in (scale_pivot if rotate_pivot is None else rotate_pivot)],
+            "scalePivot": [float(value) for value in scale_pivot],
+            "keys": {},
+        }
+        if parent:
+            self.nodes[parent]["children"].append(name)
+        self._changed()
+        return name
+
+    # Key one channel, keys is {frame: value}
+    def set_keys(self, node, attribute, keys):
+        curve = self.nodes[self._short(node)]["keys"].setdefault(attribute, {})
+        curve.update({float(frame): float(value) for frame, value in keys.items()})
+        self._evaluate(self._short(node))
+
+    #########################################################################################
+    # COUNTING CALLS ########################################################################
+    #########################################################################################
+
+    def reset_calls(self):
+        self.calls = Counter()
+        self.call_seconds = Counter()
+        self.modeled_seconds = 0.0
+        self.call_log = []
+
+    def _record(self, name, args, kwargs):
+        cost = self.costs.get(name, 0.0)
+        if callable(cost):
+            cost = cost(self, args, kwargs)
+        self.calls[name] += 1
+        self.call_seconds[name] += cost
+        self.modeled_seconds += cost
+        if self.log_calls:
+            self.call_log.append((name, args, kwargs))
+
+    # One row per call: how many and what they'd cost in Maya, most expensive first
+    def call_report(self):
+        return [{"call": name, "count": self.calls[name], "modeled_seconds": self.call_seconds[name]}
+                for name in sorted(self.calls, key=lambda name: -self.call_seconds[name])]
+
+    # How many keyed transforms a time change has to evaluate
+    @property
+    def keyed_count(self):
+        return sum(1 for data in self.nodes.values() if data["keys"])
+
+    #########################################################################################
+    # HELPERS ###############################################################################
+    #########################################################################################
+
+    # maya.cmds takes a name or a list with one name in it (like what spaceLocator gives back)
+    def _short(self, name):
+        if isinstance(name, (list, tuple)):
+            name = name[0]
+        short = name.rsplit("|", 1)[-1]
+        if short not in self.nodes:
+            self.error(f"No object matches name: {name}")
+        return short
+
+    def _long(self, name):
+        path = []
+        node = self._short(name)
+        while node:
+            path.append(node)
+            node = self.nodes[node]["parent"]
+        return "|" + "|".join(reversed(path))
+
+    # name, or name1, name2... when it's taken, like Maya does
+    def _unique_name(self, name):
+        base_name = name
+        number = 1
+        while name in self.nodes:
+            name = f"{base_name}{number}"
+            number += 1
+        return name
+
+    def _children(self, name):
+        return list(self.nodes[name]["children"])
+
+    # name and every transform under it, parents before their children
+    def _subtree(self, name):
+        result = [name]
+        for node in result:
+            result.extend(child for child in self._children(node) if self.nodes[child]["type"] == "transform")
+        return result
+
+    def _ancestors(self, name):
+        node = self.nodes[name]["parent"]
+        while node:
+            yield node
+            node = self.nodes[node]["parent"]
+
+    # anything moved: every world matrix has to be worked out again
+    def _changed(self):
+        self._world_cache.clear()
+
+    # linear in between keys, flat before the first one and after the last one
+    def _curve_value(self, curve, time):
+        frames = sorted(curve)
+        if time <= frames[0]:
+            return curve[frames[0]]
+        if time >= frames[-1]:
+            return curve[frames[-1]]
+        for left, right in zip(frames, frames[1:]):
+            if left <= time <= right:
+                weight = (time - left) / (right - left)
+                return curve[left] + (curve[right] - curve[left]) * weight
+
+    def _channel_value(self, name, attribute, time):
+        data = self.nodes[name]
+        curve = data["keys"].get(attribute)
+        if curve:
+            return self._curve_value(curve, time)
+        return data[attribute[:-1]][AXES.index(attribute[-1])]
+
+    # translate, rotate or scale of a node at a time
+    def _values_at(self, name, attribute, time):
+        if not self.nodes[name]["keys"]:
+            return list(self.nodes[name][attribute])
+        return [self._channel_value(name, attribute + axis, time) for axis in AXES]
+
+    def _translate_at(self, name, time):
+        return self._values_at(name, "translate", time)
+
+    def _evaluate(self, name):
+        for attribute in TRANSFORM_ATTRIBUTES:
+            self.nodes[name][attribute] = self._values_at(name, attribute, self.time)
+        self._changed()
+
+    def _local_matrix(self, name, time=None):
+        data = self.nodes[name]
+        if time is None:
+            values = [data[attribute] for attribute in TRANSFORM_ATTRIBUTES]
+        else:
+            values = [self._values_at(name, attribute, time) for attribute in TRANSFORM_ATTRIBUTES]
+        return _local_matrix(*values, data["rotatePivot"], data["scalePivot"])
+
+    # 4x4 world matrix at the current time (time=None) or any other time, kept until something changes
+    def _world_matrix(self, name, time=None):
+        key = (name, time)
+        matrix = self._world_cache.get(key)
+        if matrix is None:
+            matrix = self._local_matrix(name, time)
+            parent = self.nodes[name]["parent"]
+            if parent:
+                matrix = matrix @ self._world_matrix(parent, time)
+            self._world_cache[key] = matrix
+        return matrix
+
+    def _parent_matrix(self, name):
+        parent = self.nodes[name]["parent"]
+        return self._world_matrix(parent) if parent else np.eye(4)
+
+    def _world_translation(self, name, time=None):
+        return self._world_matrix(name, time)[3, :3].tolist()
+
+    def _world_point(self, name, attribute, time=None):
+        point = np.append(self.nodes[name][attribute], 1.0)
+        return (point @ self._world_matrix(name, time))[:3].tolist()
+
+    # Giving a node a new local matrix, keeping its pivots
+    def _set_local_matrix(self, name, matrix):
+        data = self.nodes[name]
+        data["translate"], data["rotate"], data["scale"] = _decompose(matrix, data["rotatePivot"], data["scalePivot"])
+        self._changed()
+
+    #########################################################################################
+    # maya.cmds CALLS #######################################################################
+    #########################################################################################
+
+    # names can have wildcards (* and ?) in them, those give back whatever matches, which can be nothing
+    @_maya_call
+    def ls(self, *names, selection=False, long=False, type=None, **kwargs):
+        if selection:
+            result = list(self.selection)
+        else:
+            result = []
+            for name in names:
+                for pattern in name if isinstance(name, (list, tuple)) else [name]:
+                    if any(character in pattern for character in "*?"):
+                        result.extend(node for node in self.nodes if fnmatch.fnmatchcase(node, pattern.lstrip("|")))
+                    else:
+                        result.append(self._short(pattern))
+            result = result if names else list(self.nodes)
+        if type is not None:
+            result = [name for name in result if self.nodes[name]["type"] == type]
+        return [self._long(name) for name in result] if long else result
+
+    @_maya_call
+    def select(self, *names, clear=False, **kwargs):
+        self.selection = [] if clear else [self._short(name) for name in names]
+
+    @_maya_call
+    def listRelatives(self, name, parent=False, children=False, allDescendents=False, fullPath=False, **kwargs):
+        name = self._short(name)
+        if parent:
+            result = [self.nodes[name]["parent"]] if self.nodes[name]["parent"] else []
+        elif allDescendents:
+            result = []
+            stack = [name]
+            while stack:
+                node = stack.pop()
+                for child in self._children(node):
+                    result.append(child)
+                    stack.append(child)
+            # Maya gives these from tip to root
+            result.reverse()
+        else:
+            result = self._children(name)
+        if not result:
+            return None
+        return [self._long(node) for node in result] if fullPath else result
+
+    @_maya_call
+    def nodeType(self, name):
+        if name not in self.nodes and "_" in name and not name.startswith("|"):
+            curve_type = {"translate": "animCurveTL", "rotate": "animCurveTA", "scale": "animCurveTU"}
+            return curve_type[name.rsplit("_", 1)[1][:-1]]
+        return self.nodes[self._short(name)]["type"]
+
+    @_maya_call
+    def currentTime(self, time=None, edit=False, query=False, **kwargs):
+        if query or time is None:
+            return self.time
+        self.time = float(time)
+        for name in self.nodes:
+            if self.nodes[name]["keys"]:
+                self._evaluate(name)
+
+        # the jobs are called by Maya, not by currentTime, so what they call counts
+        depth, self._depth = self._depth, 0
+        try:
+            for event, function in list(self.jobs.values()):
+                if event == "timeChanged":
+                    function()
+        finally:
+            self._depth = depth
+        return self.time
+
+    # event=["timeChanged", function] gives back the job number, kill=number removes it
+    @_maya_call
+    def scriptJob(self, event=None, kill=None, exists=None, **kwargs):
+        if exists is not None:
+            return exists in self.jobs
+        if kill is not None:
+            self.jobs.pop(kill, None)
+            return None
+        job = self._next_job
+        self._next_job += 1
+        self.jobs[job] = (event[0], event[1])
+        return job
+
+    @_maya_call
+    def pointPosition(self, point, world=True, **kwargs):
+        name, attribute = point.split(".")
+        name = self._short(name)
+        if world:
+            return self._world_point(name, attribute)
+        return list(self.nodes[name][attribute])
+
+    @_maya_call
+    def xform(self, name, query=False, q=False, worldSpace=False, ws=False, translation=None, t=None, rotation=None,
+              ro=None, scale=None, s=None, matrix=None, m=None, **kwargs):
+        name = self._short(name)
+        query = query or q
+        world = worldSpace or ws
+        translation = translation if translation is not None else t
+        rotation = rotation if rotation is not None else ro
+        scale = scale if scale is not None else s
+        matrix = matrix if matrix is not None else m
+
+        if query:
+            if matrix:
+                result = self._world_matrix(name) if world else self._local_matrix(name)
+                return result.reshape(16).tolist()
+            if rotation:
+                return list(self.nodes[name]["rotate"])
+            if scale:
+                return list(self.nodes[name]["scale"])
+            return self._world_translation(name) if world else list(self.nodes[name]["translate"])
+
+        data = self.nodes[name]
+        if matrix is not None and not isinstance(matrix, bool):
+            local = np.reshape(np.asarray(matrix, dtype=float), (4, 4))
+            if world:
+                local = local @ np.linalg.inv(self._parent_matrix(name))
+            self._set_local_matrix(name, local)
+        if rotation is not None:
+            data["rotate"] = [float(value) for value in rotation]
+        if scale is not None:
+            data["scale"] = [float(value) for value in scale]
+        if translation is not None:
+            values = [float(value) for value in translation]
+            if world:
+                # the translate that puts the matrix's translation row at values
+                local_row = (np.append(values, 1.0) @ np.linalg.inv(self._parent_matrix(name)))[:3]
+                pivot_part = self._local_matrix(name)[3, :3] - data["translate"]
+                values = (local_row - pivot_part).tolist()
+            data["translate"] = values
+        self._changed()
+
+    # absolute moves put the object there in world space, relative ones move it by that much in world space
+    @_maya_call
+    def move(self, x, y, z, name, relative=False, worldSpace=False, **kwargs):
+        name = self._short(name)
+        if relative:
+            offset = np.array([x, y, z], dtype=float) @ np.linalg.inv(self._parent_matrix(name)[:3, :3])
+            self.nodes[name]["translate"] = (np.array(self.nodes[name]["translate"]) + offset).tolist()
+            self._changed()
+        else:
+            self.xform(name, worldSpace=True, t=(x, y, z))
+
+    @_maya_call
+    def spaceLocator(self, name="locator1", **kwargs):
+        name = self._unique_name(name)
+        self.create_node(name)
+        self.create_node(name + "Shape", parent=name, node_type="locator")
+        return [name]
+
+    # A circle is a transform with a nurbsCurve shape, the curve itself isn't kept
+    # (Maya gives back the makeNurbCircle node second, here it's the shape)
+    @_maya_call
+    def circle(self, name="nurbsCircle1", **kwargs):
+        name = self._unique_name(name)
+        self.create_node(name)
+        self.create_node(name + "Shape", parent=name, node_type="nurbsCurve")
+        return [name, name + "Shape"]
+
+    # Putting child under parent (or under the world with world=True) without moving it, like Maya's default
+    @_maya_call
+    def parent(self, child, parent=None, world=False, **kwargs):
+        child = self._short(child)
+        world_matrix = self._world_matrix(child)
+        new_parent = None if world or parent is None else self._short(parent)
+        if new_parent and child in [new_parent] + list(self._ancestors(new_parent)):
+            self.error(f"Cannot parent {child} under itself.")
+        old_parent = self.nodes[child]["parent"]
+        if old_parent:
+            self.nodes[old_parent]["children"].remove(child)
+        if new_parent:
+            self.nodes[new_parent]["children"].append(child)
+        self.nodes[child]["parent"] = new_parent
+        self._changed()
+        self._set_local_matrix(child, world_matrix @ np.linalg.inv(self._parent_matrix(child)))
+        # like Maya, keyed channels go straight back to what their curves say
+        if self.nodes[child]["keys"]:
+            self._evaluate(child)
+        return [child]
+
+    # Freeze transformations: the frozen values go back to 0 (scale to 1) on name and everything under it,
+    # and the pivots move so they stay where they were in world space
+    @_maya_call
+    def makeIdentity(self, name, apply=False, t=False, r=False, s=False, n=0, **kwargs):
+        if not apply:
+            return
+        nodes = self._subtree(self._short(name))
+        pivot_world = {node: (self._world_point(node, "rotatePivot"), self._world_point(node, "scalePivot"))
+                       for node in nodes}
+        for node in nodes:
+            data = self.nodes[node]
+            if t:
+                data["translate"] = [0.0, 0.0, 0.0]
+            if r:
+                data["rotate"] = [0.0, 0.0, 0.0]
+            if s:
+                data["scale"] = [1.0, 1.0, 1.0]
+            self._changed()
+            # the parent is already done, so this is where the pivots have to be in its space
+            parent_inverse = np.linalg.inv(self._parent_matrix(node))
+            for attribute, world_point in zip(("rotatePivot", "scalePivot"), pivot_world[node]):
+                in_parent = (np.append(world_point, 1.0) @ parent_inverse)[:3]
+                data[attribute] = (in_parent - data["translate"]).tolist()
+            self._changed()
+
+    @_maya_call
+    def setKeyframe(self, name, attribute="translate", t=None, time=None, value=None, **kwargs):
+        name = self._short(name)
+        frame = self.time if t is None and time is None else (t if t is not None else time)
+        if attribute in TRANSFORM_ATTRIBUTES:
+            attributes = [attribute + axis for axis in AXES]
+        else:
+            attributes = [attribute]
+        for attribute in attributes:
+            if value is None:
+                key_value = self.nodes[name][attribute[:-1]][AXES.index(attribute[-1])]
+            else:
+                key_value = value
+            curve = self.nodes[name]["keys"].setdefault(attribute, {})
+            curve[float(frame)] = float(key_value)
+            # the channel follows its curve straight away when the key is on the current time (or is its only key),
+            # keys on other frames show up on the next time change
+            if value is not None and (float(frame) == self.time or len(curve) == 1):
+                self.nodes[name][attribute[:-1]][AXES.index(attribute[-1])] = float(key_value)
+                self._changed()
+
+    @_maya_call
+    def cutKey(self, name, attribute=None, time=None, clear=True, **kwargs):
+        keys = self.nodes[self._short(name)]["keys"]
+        attributes = [attribute] if attribute else list(keys)
+        for attribute in attributes:
+            if attribute not in keys:
+                continue
+            if time is None:
+                del keys[attribute]
+            else:
+                for frame in [frame for frame in keys[attribute] if time[0] <= frame <= time[-1]]:
+                    del keys[attribute][frame]
+
+    # anim curves are called node_attribute here, like Maya's default curve names
+    # a curve (node_translateX) or the plug it's on (node.translateX), a plug without keys has an empty one
+    def _curve(self, name):
+        if name in self.nodes:
+            return None
+        node, attribute = name.rsplit(".", 1) if "." in name else name.rsplit("_", 1)
+        return self.nodes[self._short(node)]["keys"].get(attribute, {})
+
+    @_maya_call
+    def keyframe(self, target, query=False, timeChange=False, valueChange=False, **kwargs):
+        if kwargs.get("name"):
+            node = self._short(target)
+            return [f"{node}_{attribute}" for attribute in sorted(self.nodes[node]["keys"])] or None
+        curve = self._curve(target)
+        if curve is None:
+            self.error("keyframe: query a curve, not a node.")
+        frames = sorted(curve)
+        if timeChange:
+            return frames
+        if valueChange:
+            return [curve[frame] for frame in frames]
+
+    # anim curves are the only thing that connects into a transform here
+    # plugs=True, connections=True gives back (this node's plug, curve's plug) pairs all in one list like Maya
+    @_maya_call
+    def listConnections(self, name, source=True, destination=True, plugs=False, connections=False, **kwargs):
+        node = self._short(name)
+        attributes = sorted(self.nodes[node]["keys"]) if source else []
+        result = []
+        for attribute in attributes:
+            if connections:
+                result.append(f"{node}.{attribute}")
+            result.append(f"{node}_{attribute}.output" if plugs else f"{node}_{attribute}")
+        return result or None
+
+    # every key is linear here, so the tangent types are too and there are no angles or weights to give back
+    @_maya_call
+    def keyTangent(self, target, query=False, inTangentType=False, outTangentType=False, weightedTangents=False,
+                   **kwargs):
+        if not query:
+            return None
+        if weightedTangents:
+            return [False]
+        if inTangentType or outTangentType:
+            return ["linear"] * len(self._curve(target))
+        return [0.0] * len(self._curve(target))
+
+    @_maya_call
+    def setInfinity(self, target, query=False, **kwargs):
+        return ["constant"] if query else None
+
+    @_maya_call
+    def currentUnit(self, query=False, time=False, angle=False, linear=False, **kwargs):
+        if time:
+            return "film"
+        return "deg" if angle else "cm"
+
+    @_maya_call
+    def playbackOptions(self, query=False, minTime=None, maxTime=None, **kwargs):
+        if query:
+            return self.playback_range[1] if maxTime else self.playback_range[0]
+        if minTime is not None:
+            self.playback_range[0] = float(minTime)
+        if maxTime is not None:
+            self.playback_range[1] = float(maxTime)
+        return None
+
+    # new=True empties the scene like File > New, rename / save / open go through a json file (see the top)
+    @_maya_call
+    def file(self, path=None, query=False, sceneName=False, new=False, open=False, save=False, rename=None,
+             force=False, **kwargs):
+        if new:
+            self.nodes = {}
+            self.selection = []
+            self.time = 1.0
+            self.playback_range = [1.0, 120.0]
+            self.scene_name = ""
+            self._changed()
+            return "untitled"
+        if query:
+            return self.scene_name if sceneName else None
+        if rename is not None:
+            self.scene_name = rename
+            return rename
+        if save:
+            scene = {"nodes": self.nodes, "time": self.time, "playback_range": self.playback_range}
+            with builtins.open(self.scene_name, "w") as f:
+                json.dump(scene, f, default=float)
+            return self.scene_name
+        if open:
+            with builtins.open(path) as f:
+                scene = json.load(f)
+            for data in scene["nodes"].values():
+                data["keys"] = {attribute: {float(frame): value for frame, value in curve.items()}
+                                for attribute, curve in data["keys"].items()}
+            self.nodes = scene["nodes"]
+            self.selection = []
+            self.time = scene["time"]
+            self.playback_range = scene["playback_range"]
+            self.scene_name = path
+            self._changed()
+            return path
+        return None
+
+    @_maya_call
+    def getAttr(self, plug, time=None, **kwargs):
+        name, attribute = plug.split(".", 1)
+        name = self._short(name)
+        time = self.time if time is None else time
+        if attribute in ("scalePivot", "rotatePivot"):
+            return [tuple(self.nodes[name][attribute])]
+        if attribute in ("rotatePivotTranslate", "scalePivotTranslate", "shear", "rotateAxis"):
+            return [(0.0, 0.0, 0.0)]
+        if attribute == "rotateOrder":
+            return 0
+        if attribute in TRANSFORM_ATTRIBUTES:
+            return [tuple(self._values_at(name, attribute, time))]
+        if attribute[:-1] in TRANSFORM_ATTRIBUTES and attribute[-1] in AXES:
+            return self._channel_value(name, attribute, time)
+        if attribute.startswith("worldMatrix"):
+            return self._world_matrix(name, None if time == self.time else time).reshape(16).tolist()
+        if attribute == "matrix":
+            return self._local_matrix(name, time).reshape(16).tolist()
+        self.error(f"getAttr: {attribute} is not something FakeCmds knows about.")
+
+    @_maya_call
+    def setAttr(self, plug, *values, **kwargs):
+        name, attribute = plug.split(".", 1)
+        data = self.nodes[self._short(name)]
+        if attribute in TRANSFORM_ATTRIBUTES + ("scalePivot", "rotatePivot"):
+            data[attribute] = [float(value) for value in values]
+        elif attribute[:-1] in TRANSFORM_ATTRIBUTES and attribute[-1] in AXES:
+            data[attribute[:-1]][AXES.index(attribute[-1])] = float(values[0])
+        else:
+            self.error(f"setAttr: {attribute} is not something FakeCmds knows about.")
+        self._changed()
+
+    @_maya_call
+    def delete(self, *names, **kwargs):
+        for name in names:
+            for node in name if isinstance(name, (list, tuple)) else [name]:
+                node = self._short(node)
+                for child in self._children(node):
+                    self.delete(child)
+                if self.nodes[node]["parent"]:
+                    self.nodes[self.nodes[node]["parent"]]["children"].remove(node)
+                del self.nodes[node]
+                if node in self.selection:
+                    self.selection.remove(node)
+        self._changed()
+
+    @_maya_call
+    def warning(self, message):
+        print(f"# Warning: {message}")
+
+    @_maya_call
+    def error(self, message):
+        raise RuntimeError(message)
@@ -0,0 +1,248 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+"""
+What code does:
+the whole solver loop (every frame, every substep, every object) as one compiled function when numba is there,
+solver.solve uses it instead of its numpy arrays with backend="numba" (or "auto", the default, when it can)
+
+Functions:
+- available()
+- use_compiled(backend)
+- solve_frames(anchors, current, previous, parent_index, offsets, lengths, ...)
+- parity(object_count=50, frame_count=100, parent_index=None, **params)
+
+Why:
+- the numpy path does a handful of array operations per frame (per substep, per constraint iteration),
+	which is quick for big hierarchies but mostly python overhead for short ones, and cascade / pointer jumping
+	do even more of them per frame
+- compiled, every object is one pass through a plain loop, parents first, same as the scripts' per object loops
+	but without python in the way
+
+Same maths as solver.step / step_cascade / apply_length_constraint / relax_lengths, in the same order
+(solver's default numpy loop does the same steps on the segments instead of the positions),
+so the two only differ by float rounding (a long chain shaking for long enough makes that visible, parity()
+checks a short shot, tests/test_kernels.py runs it on chains and trees, with substeps, iterations and cascade,
+in float64 and float32)
+
+Without numba this module still imports, available() is False and solver.solve stays on numpy
+"""
+
+
+def available():
+    return numba is not None
+
+
+# Whether solver.solve should use the compiled loop
+# backend: "auto" (numba when it's there), "numba" (error without it) or "numpy"
+def use_compiled(backend):
+    if backend == "auto":
+        return available()
+    if backend == "numba":
+        if not available():
+            raise ImportError("backend='numba' needs numba installed.")
+        return True
+    if backend == "numpy":
+        return False
+    raise ValueError(f"Unknown solver backend: {backend}")
+
+
+# Putting this substep's drivers in the rows after the objects, which is where the roots' parent_row points
+def _set_drivers(points, anchors, n):
+    for d in range(anchors.shape[0]):
+        for axis in range(3):
+            points[n + d, axis] = anchors[d, axis]
+
+
+# One frame of solver.step for every object, next gets the result
+# current, previous and next are (objects + drivers, 3), parent_row[i] is the row of object i's parent in them
+def _step(current, previous, next, parent_row, offsets, lengths, child_share, parent_share, depth_parity,
+          segments, dt, mass, force, damping, k, constraint, iterations):
+    n = len(parent_row)
+    spring = k * dt * dt / mass
+    keep = 1 + damping - spring
+    force_scale = dt * dt / mass
+
+    for i in range(n):
+        p = parent_row[i]
+        for axis in range(3):
+            value = keep * current[i, axis] - damping * previous[i, axis]
+            value += spring * (current[p, axis] + offsets[i, axis])
+            next[i, axis] = value + force[axis] * force_scale
+
+    if not constraint:
+        return
+
+    if iterations == 0:
+        # apply_length_constraint: every segment back to its length, then added up from the drivers
+        for i in range(n):
+            p = parent_row[i]
+            x = next[i, 0] - next[p, 0]
+            y = next[i, 1] - next[p, 1]
+            z = next[i, 2] - next[p, 2]
+            distance = np.sqrt(x * x + y * y + z * z)
+            if distance == 0:
+                x, y, z = offsets[i, 0], offsets[i, 1], offsets[i, 2]
+                distance = lengths[i]
+            ratio = lengths[i] / distance if distance > 0 else 1.0
+            segments[i, 0] = x * ratio
+            segments[i, 1] = y * ratio
+            segments[i, 2] = z * ratio
+        for i in range(n):
+            p = parent_row[i]
+            for axis in range(3):
+                next[i, axis] = next[p, axis] + segments[i, axis]
+        return
+
+    # relax_lengths: even depths then odd depths, every segment of a half worked out before any of them moves
+    for _ in range(iterations):
+        for parity in range(2):
+            for i in range(n):
+                if depth_parity[i] != parity:
+                    continue
+                p = parent_row[i]
+                x = next[i, 0] - next[p, 0]
+                y = next[i, 1] - next[p, 1]
+                z = next[i, 2] - next[p, 2]
+                distance = max(np.sqrt(x * x + y * y + z * z), 1e-12)
+                stretch = 1 - lengths[i] / distance
+                segments[i, 0] = x * stretch
+                segments[i, 1] = y * stretch
+                segments[i, 2] = z * stretch
+            for i in range(n):
+                if depth_parity[i] != parity:
+                    continue
+                p = parent_row[i]
+                for axis in range(3):
+                    next[i, axis] -= segments[i, axis] * child_share[i]
+                    # a driver's share is 0, so it stays put
+                    next[p, axis] += segments[i, axis] * parent_share[i]
+
+
+# One frame of solver.step_cascade: parents come first, so going down the list is going down the levels
+def _step_cascade(current, previous, next, parent_row, offsets, lengths, dt, mass, force, damping, k, constraint):
+    for i in range(len(parent_row)):
+        p = parent_row[i]
+        for axis in range(3):
+            displacement = current[i, axis] - next[p, axis] - offsets[i, axis]
+            acc = (-k * displacement + force[axis]) / mass
+            next[i, axis] = current[i, axis] + damping * (current[i, axis] - previous[i, axis]) + acc * dt * dt
+
+        if constraint:
+            x = next[i, 0] - next[p, 0]
+            y = next[i, 1] - next[p, 1]
+            z = next[i, 2] - next[p, 2]
+            distance = np.sqrt(x * x + y * y + z * z)
+            ratio = lengths[i] / distance if distance > 0 else 1.0
+            next[i, 0] = x * ratio + next[p, 0]
+            next[i, 1] = y * ratio + next[p, 1]
+            next[i, 2] = z * ratio + next[p, 2]
+
+
+# Every frame and substep, same as the loop in solver.solve
+# anchors: (frames, substeps, drivers, 3), the params are already per substep (dt / substeps...)
+# result gets (frames, n, 3), checkpoint_current/previous get the state before frame f at f // checkpoint_every
+# (and after the last frame when the frame count is a multiple of checkpoint_every)
+# current_rows, previous_rows, next_rows (objects + drivers, 3) and segments (n, 3) are scratch, made by the caller
+# in the same precision as everything else
+def _solve_frames(anchors, current, previous, parent_row, offsets, lengths, child_share, parent_share,
+                  depth_parity, dt, mass, force, damping, k, constraint, iterations, cascade,
+                  result, checkpoint_every, checkpoint_current, checkpoint_previous,
+                  current_rows, previous_rows, next_rows, segments):
+    n = len(parent_row)
+    current_rows[:n] = current
+    previous_rows[:n] = previous
+    frame_count = anchors.shape[0]
+
+    for f in range(frame_count + 1):
+        if checkpoint_every > 0 and f % checkpoint_every == 0 and (f < frame_count or f > 0):
+            checkpoint_current[f // checkpoint_every] = current_rows[:n]
+            checkpoint_previous[f // checkpoint_every] = previous_rows[:n]
+        if f == frame_count:
+            break
+
+        for s in range(anchors.shape[1]):
+            _set_drivers(current_rows, anchors[f, s], n)
+            _set_drivers(next_rows, anchors[f, s], n)
+            if cascade:
+                _step_cascade(current_rows, previous_rows, next_rows, parent_row, offsets, lengths,
+                              dt, mass, force, damping, k, constraint)
+            else:
+                _step(current_rows, previous_rows, next_rows, parent_row, offsets, lengths, child_share,
+                      parent_share, depth_parity, segments, dt, mass, force, damping, k, constraint, iterations)
+            # update positions so current becomes previous and next becomes current
+            previous_rows, current_rows, next_rows = current_rows, next_rows, previous_rows
+        result[f] = current_rows[:n]
+
+
+if numba is not None:
+    _set_drivers = numba.njit(cache=True)(_set_drivers)
+    _step = numba.njit(cache=True)(_step)
+    _step_cascade = numba.njit(cache=True)(_step_cascade)
+    _solve_frames = numba.njit(cache=True)(_solve_frames)
+
+
+# Running the compiled loop, gives back the result and fills checkpoints like solver.solve does
+# everything is in the precision anchors is in (float64, or float32 for solver's precision="float32")
+def solve_frames(anchors, current, previous, parent_index, offsets, lengths, dt=1, mass=1, force=(0, 0, 0),
+                 damping=0.8, k=0.1, constraint=True, iterations=0, cascade=False, checkpoints=None,
+                 checkpoint_every=0):
+    parent_index = np.asarray(parent_index, dtype=np.int64)
+    n = len(parent_index)
+    frame_count = len(anchors)
+
+    # drivers go in the rows after the objects, -1 (the first driver) is row n
+    parent_row = np.where(parent_index >= 0, parent_index, n - parent_index - 1)
+
+    # relax_lengths' shares: a segment to a driver only moves its child, siblings split their parent's half,
+    # and whether every object is at an even or odd depth (the two halves)
+    child_count = np.bincount(parent_index[parent_index >= 0], minlength=n)
+    child_share = np.where(parent_index >= 0, 0.5, 1.0)
+    parent_share = np.where(parent_index >= 0, 0.5 / np.maximum(child_count[np.maximum(parent_index, 0)], 1), 0.0)
+    depth = np.zeros(n, dtype=np.int64)
+    for i, parent in enumerate(parent_index):
+        depth[i] = 0 if parent < 0 else depth[parent] + 1
+
+    dtype = np.float32 if np.asarray(anchors).dtype == np.float32 else np.float64
+    checkpoint_every = checkpoint_every if checkpoints is not None else 0
+    checkpoint_count = frame_count // checkpoint_every + 1 if checkpoint_every else 0
+    checkpoint_current = np.empty((checkpoint_count, n, 3), dtype)
+    checkpoint_previous = np.empty((checkpoint_count, n, 3), dtype)
+
+    # every buffer the loop needs, made once here, the drivers' rows come after the objects' ones
+    rows = n + np.shape(anchors)[2]
+    result = np.empty((frame_count, n, 3), dtype)
+    _solve_frames(np.ascontiguousarray(anchors, dtype=dtype), np.asarray(current, dtype=dtype),
+                  np.asarray(previous, dtype=dtype), parent_row, np.asarray(offsets, dtype=dtype),
+                  np.asarray(lengths, dtype=dtype), child_share.astype(dtype), parent_share.astype(dtype), depth % 2,
+                  float(dt), float(mass), np.asarray(force, dtype=dtype).reshape(3), float(damping), float(k),
+                  bool(constraint), int(iterations), bool(cascade),
+                  result, checkpoint_every, checkpoint_current, checkpoint_previous,
+                  np.zeros((rows, 3), dtype), np.zeros((rows, 3), dtype), np.zeros((rows, 3), dtype),
+                  np.empty((n, 3), dtype))
+
+    if checkpoint_every:
+        for c in range(checkpoint_count):
+            frame = c * checkpoint_every
+            if frame < frame_count or (frame == frame_count and frame > 0):
+                checkpoints[frame] = (checkpoint_current[c], checkpoint_previous[c])
+    return result
+
+
+# Largest difference between the numpy and the compiled solver on solver.made_up_shot, for checking a new machine
+def parity(object_count=50, frame_count=100, parent_index=None, **params):
+    from secondary_motion import solver
+
+    if not available():
+        raise ImportError("parity() needs numba installed.")
+    driver, rest_positions, parent_index = solver.made_up_shot(object_count, frame_count, parent_index)
+
+    compiled = solver.solve(driver, rest_positions, parent_index, backend="numba", **params)
+    plain = solver.solve(driver, rest_positions, parent_index, backend="numpy", **params)
+    return float(np.abs(compiled - plain).max())
+# remove "#" to test:
+# print(parity(iterations=4, substeps=2))
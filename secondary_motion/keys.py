@@ -0,0 +1,225 @@
+import os
+
+import numpy as np
+
+from secondary_motion.scene import get_cmds
+from secondary_motion.solver import build_topology
+
+try:
+    from maya.api import OpenMaya, OpenMayaAnim
+except ImportError:
+    OpenMaya = OpenMayaAnim = None
+
+"""
+What code does:
+keys a whole (frames, nodes, 3) array of translate values at once, instead of
+cmds.xform + cmds.setKeyframe for every object on every frame
+
+Functions:
+- rest_local_matrices(node_list, cmds=None)
+- world_to_local_translate(world_pivots, parent_index, driver_matrix, local_matrices, scale_pivots)
+- write_translate_keys(node_list, frame_list, values, replace=True, cmds=None)
+- KeysCommand (only in Maya, the secondaryMotionKeys command node.py's plugin registers)
+
+Two ways of writing:
+- in Maya: the translateX/Y/Z anim curve of every object is created (or reused) through the API
+	and all of its keys go in with one MFnAnimCurve.addKeys call per channel
+	- it all happens inside one secondaryMotionKeys call, which keeps the MDGModifier that made the curves
+		and the MAnimCurveChange of every key, so ctrl+z takes the whole thing back like setKeyframe's keys
+		(the plugin gets loaded the first time, when it can't be the keys go in like outside Maya)
+	- values come in the scene's linear unit like cmds takes them, the API wants centimeters, so they're converted
+- anywhere else (FakeCmds, or no API): cmds.setKeyframe(..., value=) per key,
+	which still never moves the timeline or the object
+- replace=True clears the channel first, replace=False only overwrites the keys in frame_list
+
+Values are local translates, not world positions, because that is what ends up on the anim curves.
+world_to_local_translate does that conversion for the objects under their drivers:
+- the solved world position of every object is where its scalePivot goes (what sampling reads)
+- that position goes through the inverse of the parent's world matrix (the driver's, or the parent object's
+	with its new translate), minus where the scalePivot sits in the object's local matrix with translate at 0
+- what's left is the translate that puts the scalePivot right on the solved position, whatever the parents'
+	rotation and scale and the object's own rotation, scale and pivots are (only translate gets keyed)
+"""
+
+AXES = ("X", "Y", "Z")
+KEYS_COMMAND = "secondaryMotionKeys"
+# what the next secondaryMotionKeys call writes, (node_list, frame_list, values, replace),
+# a command can't be given arrays so write_translate_keys leaves them here
+_PENDING = []
+
+
+# Getting maya's API if it is there
+def _anim_api(cmds):
+    if getattr(cmds, "__name__", "") != "maya.cmds":
+        return None
+    try:
+        from maya.api import OpenMaya, OpenMayaAnim
+    except ImportError:
+        return None
+    return OpenMaya, OpenMayaAnim
+
+
+# Every object's local matrix with its translate taken out, and its scalePivot, read at the current time
+# (only translate gets keyed, the rest of the local matrix stays what it is now)
+# returns (n, 4, 4) and (n, 3)
+def rest_local_matrices(node_list, cmds=None):
+    cmds = get_cmds(cmds)
+    local_matrices = np.empty((len(node_list), 4, 4))
+    scale_pivots = np.empty((len(node_list), 3))
+    for n, node in enumerate(node_list):
+        local_matrices[n] = np.reshape(cmds.getAttr(node + ".matrix"), (4, 4))
+        # translate is added on last, it only ever moves the translation row
+        local_matrices[n, 3, :3] -= cmds.getAttr(node + ".translate")[0]
+        scale_pivots[n] = cmds.getAttr(node + ".scalePivot")[0]
+    return local_matrices, scale_pivots
+
+
+# World position of every object's scalePivot -> the local translate that puts it there
+# world_pivots: (frames, n, 3) solved world positions
+# driver_matrix: (frames, drivers, 4, 4) world matrices of the drivers
+# local_matrices, scale_pivots: (n, 4, 4) and (n, 3) from rest_local_matrices
+# done one depth at a time, every object's world matrix (with its new translate) is what its children go through
+def world_to_local_translate(world_pivots, parent_index, driver_matrix, local_matrices, scale_pivots):
+    world_pivots = np.asarray(world_pivots, dtype=float)
+    driver_matrix = np.asarray(driver_matrix, dtype=float)
+    if driver_matrix.ndim == 3:
+        driver_matrix = driver_matrix[:, None]
+    local_matrices = np.asarray(local_matrices, dtype=float)
+    topology = build_topology(parent_index)
+    frame_count, n = world_pivots.shape[:2]
+
+    # where every scalePivot sits in its parent's space with translate at 0 (row vectors, translation last)
+    rest_local_pivot = np.einsum("ni,nij->nj", np.asarray(scale_pivots, dtype=float), local_matrices[:, :3, :3]) \
+        + local_matrices[:, 3, :3]
+
+    translate = np.empty((frame_count, n, 3))
+    world = np.empty((frame_count, n, 4, 4))
+    for level in topology.levels:
+        parent = topology.parent_index[level]
+        parent_world = np.empty((frame_count, len(level), 4, 4))
+        roots = parent < 0
+        parent_world[:, roots] = driver_matrix[:, -parent[roots] - 1]
+        parent_world[:, ~roots] = world[:, parent[~roots]]
+
+        pivot = np.concatenate((world_pivots[:, level], np.ones((frame_count, len(level), 1))), axis=2)
+        local_pivot = np.einsum("fni,fnij->fnj", pivot, np.linalg.inv(parent_world))[..., :3]
+        translate[:, level] = local_pivot - rest_local_pivot[level]
+
+        local = np.repeat(local_matrices[level][None], frame_count, axis=0)
+        local[..., 3, :3] += translate[:, level]
+        world[:, level] = local @ parent_world
+    return translate
+
+
+# Writing one channel through the API: find the anim curve on the plug or make one, then add every key
+# modifier gets the new curves, change every key that goes or comes, for KeysCommand's undo
+def _write_curve_api(node, attribute, times, value_list, replace, api, modifier, change):
+    om, oma = api
+    selection = om.MSelectionList()
+    selection.add(f"{node}.{attribute}")
+    plug = selection.getPlug(0)
+
+    curve_fn = oma.MFnAnimCurve()
+    curves = oma.MAnimUtil.findAnimation(plug)
+    if len(curves):
+        curve_fn.setObject(curves[0])
+        # only the keys inside the range go when the rest of the curve is kept
+        if not replace:
+            for index in reversed(range(curve_fn.numKeys)):
+                if times[0] <= curve_fn.input(index) <= times[-1]:
+                    curve_fn.remove(index, change)
+    else:
+        curve_fn.create(plug, oma.MFnAnimCurve.kAnimCurveTL, modifier)
+        # the curve is only made and connected once the modifier runs
+        modifier.doIt()
+    curve_fn.addKeys(times, value_list, keepExistingKeys=not replace, change=change)
+
+
+# Every channel of every object through the API, what KeysCommand does
+def _write_keys_api(node_list, frame_list, values, replace, api, modifier, change):
+    om, _ = api
+    # addKeys takes internal units (cm), values are in the scene's linear unit
+    values = values * om.MDistance.uiToInternal(1.0)
+    unit = om.MTime.uiUnit()
+    times = [om.MTime(frame, unit) for frame in frame_list]
+    for n, node in enumerate(node_list):
+        for axis_index, axis in enumerate(AXES):
+            _write_curve_api(node, "translate" + axis, times, values[:, n, axis_index].tolist(), replace, api,
+                             modifier, change)
+
+
+# Whether secondaryMotionKeys is there, loading the plugin it comes with (node.py) when it isn't yet
+def _keys_command(cmds):
+    if not hasattr(cmds, KEYS_COMMAND):
+        try:
+            cmds.loadPlugin(os.path.join(os.path.dirname(os.path.abspath(__file__)), "node.py"), quiet=True)
+        except RuntimeError:
+            return False
+    return hasattr(cmds, KEYS_COMMAND)
+
+
+# Writing one channel with cmds, for when there is no API (outside Maya)
+def _write_curve_cmds(node, attribute, frame_list, value_list, replace, cmds):
+    if replace:
+        cmds.cutKey(node, attribute=attribute, clear=True)
+    else:
+        cmds.cutKey(node, attribute=attribute, time=(frame_list[0], frame_list[-1]), clear=True)
+    for frame, value in zip(frame_list, value_list):
+        cmds.setKeyframe(node, attribute=attribute, t=frame, value=value)
+
+
+# Keying translate on every object for every frame
+# values: (frames, nodes, 3) local translate values, values[f, n] goes on node_list[n] at frame_list[f]
+def write_translate_keys(node_list, frame_list, values, replace=True, cmds=None):
+    cmds = get_cmds(cmds)
+    values = np.asarray(values, dtype=float)
+    frame_list = list(frame_list)
+    if values.shape != (len(frame_list), len(node_list), 3):
+        cmds.error(f"Expected values shaped {(len(frame_list), len(node_list), 3)}, got {values.shape}.")
+
+    # in Maya everything goes in with one undoable command, see KeysCommand
+    if _anim_api(cmds) and _keys_command(cmds):
+        _PENDING.append((list(node_list), frame_list, values, replace))
+        getattr(cmds, KEYS_COMMAND)()
+        return
+
+    for n, node in enumerate(node_list):
+        for axis_index, axis in enumerate(AXES):
+            _write_curve_cmds(node, "translate" + axis, frame_list, values[:, n, axis_index].tolist(), replace, cmds)
+
+
+if OpenMaya is not None:
+
+    # secondaryMotionKeys: writes what write_translate_keys left in _PENDING through the API,
+    # keeping the modifier and the anim curve change so it can be undone and redone
+    class KeysCommand(OpenMaya.MPxCommand):
+
+        def __init__(self):
+            OpenMaya.MPxCommand.__init__(self)
+            self._modifier = None
+            self._change = None
+
+        @staticmethod
+        def creator():
+            return KeysCommand()
+
+        def isUndoable(self):
+            return True
+
+        def doIt(self, args):
+            node_list, frame_list, values, replace = _PENDING.pop()
+            self._modifier = OpenMaya.MDGModifier()
+            self._change = OpenMayaAnim.MAnimCurveChange()
+            _write_keys_api(node_list, frame_list, values, replace, (OpenMaya, OpenMayaAnim), self._modifier,
+                            self._change)
+
+        def redoIt(self):
+            self._modifier.doIt()
+            self._change.redoIt()
+
+        # the keys first, then the curves they were on
+        def undoIt(self):
+            self._change.undoIt()
+            self._modifier.undoIt()
+# remove "#" to test:
+# write_translate_keys(["SELECT_THIS"], [1, 2], np.zeros((2, 1, 3)))
@@ -0,0 +1,349 @@
+import numpy as np
+
+from secondary_motion import keys, solver
+from secondary_motion.keys import rest_local_matrices, world_to_local_translate
+from secondary_motion.parallel import _batch_parent_index
+from secondary_motion.sampling import sample_scene, world_pivot_from_matrix
+from secondary_motion.scene import get_cmds, list_chains
+
+try:
+    from maya.api import OpenMaya
+except ImportError:
+    OpenMaya = None
+
+"""
+What code does:
+the solver as a Maya node (python API 2.0) that works out the secondary motion while the scene evaluates,
+so nothing has to be baked again after the parent's animation changes, and every chain is its own node
+that the evaluation manager can schedule on its own
+
+Usage in Maya:
+    cmds.loadPlugin("path/to/secondary_motion/node.py")
+    from secondary_motion.node import create_nodes
+    create_nodes("SELECT_THIS", 1, k=0.2)
+and without Maya (FakeCmds), the same solving the node does, checked against pipeline.bake:
+    from secondary_motion.node import parity
+    print(parity())
+
+Classes:
+- NodeSolver(rest_positions, driver_rest, parent_index=None, start_frame=1, **params)
+	.evaluate(frame, driver) / .reset()
+- SecondaryMotionNode (only in Maya)
+
+Functions:
+- chain_inputs(obj, start_frame, include_descendants=True, cmds=None)
+- evaluate_outputs(node_solver, frame, driver_matrix, driver_pivot, local_matrices, scale_pivots)
+- create_nodes(obj, start_frame, include_descendants=True, cmds=None, **params)
+- parity(depth=8, width=2, frame_count=60, **params)
+- initializePlugin(plugin) / uninitializePlugin(plugin)
+	the plugin also has secondaryMotionKeys (secondary_motion.keys.KeysCommand), what bake keys with in Maya
+
+The node (secondaryMotion):
+- in: time, driverMatrix (the parent's worldMatrix), driverPivot (its scalePivot),
+	startFrame, driverRest / restPositions (where the parent and objects were on startFrame), parentIndex,
+	localMatrices / objectPivots (the objects' local matrices without translate and their scalePivots, for outTranslate),
+	and the solver params as attributes (dt, mass, force, damping, stiffness for k, constraint, cascade,
+	substeps, iterations)
+- out: outPositions (world positions) and outTranslate (the translate bake would key, connected to the objects)
+- one node per chain (everything under one parent), create_nodes makes and connects them
+
+What it keeps (NodeSolver, plain numpy, no Maya in it):
+- the solver state after every frame it solved, with where the parent was on that frame
+- the next frame steps the solver once from the frame before (solver.solve with state=, like the preview)
+- a frame it already solved with the parent in the same place comes straight from what it kept (scrubbing back)
+- a frame with the parent somewhere else (its animation changed) drops that frame and every one after it,
+	and solves again from the frame before
+- jumping ahead past frames it never saw: the parent goes in a straight line over the frames in between
+	(a node only sees its inputs at the time it is evaluated), play from startFrame to get bake's result
+- frames before startFrame show startFrame, in between frames (motion blur) are rounded to the nearest frame
+- the params or the rest inputs changing starts it all over
+
+Evaluation manager:
+- every node only reads its own inputs and keeps its own state, so it says it can run in parallel with others
+- it is python, so the GIL still lets only one of them run python at a time
+	(the numpy parts don't hold it, and the numba backend makes the python part small)
+"""
+
+NODE_NAME = "secondaryMotion"
+# Maya keeps 0x00000 - 0x7ffff for plugins that aren't given out, change it if it clashes with another one here
+NODE_ID = 0x0007a5c1
+# attribute name -> (solver param, what kind of number it is)
+PARAM_ATTRIBUTES = {"dt": ("dt", "double"), "mass": ("mass", "double"), "damping": ("damping", "double"),
+                    "stiffness": ("k", "double"), "constraint": ("constraint", "bool"), "cascade": ("cascade", "bool"),
+                    "substeps": ("substeps", "int"), "iterations": ("iterations", "int")}
+
+
+def maya_useNewAPI():
+    pass
+
+
+class NodeSolver(object):
+
+    def __init__(self, rest_positions, driver_rest, parent_index=None, start_frame=1, **params):
+        self.rest_positions = np.asarray(rest_positions, dtype=float)
+        self.driver_rest = np.asarray(driver_rest, dtype=float).reshape(-1, 3)
+        self.parent_index = solver.chain_parents(len(self.rest_positions)) if parent_index is None \
+            else np.asarray(parent_index)
+        self.start_frame = int(start_frame)
+        self.params = dict(solver.DEFAULT_PARAMS, **params)
+        self.reset()
+
+    # Forgetting every solved frame
+    def reset(self):
+        rest = self.rest_positions
+        # {frame: (current, previous, driver, positions)}, the state after that frame, the frame before start is rest
+        self._states = {self.start_frame - 1: (rest, rest, self.driver_rest, rest)}
+
+    # Solved world positions (objects, 3) on frame with the drivers at driver (drivers, 3)
+    def evaluate(self, frame, driver):
+        frame = max(int(round(frame)), self.start_frame)
+        driver = np.asarray(driver, dtype=float).reshape(-1, 3)
+        kept = self._states.get(frame)
+        if kept is not None and np.array_equal(kept[2], driver):
+            return kept[3]
+
+        # the drivers are somewhere else on this frame: nothing kept from here on is right anymore
+        for f in [f for f in self._states if f >= frame]:
+            del self._states[f]
+        from_frame = max(self._states)
+        current, previous, driver_before, _ = self._states[from_frame]
+
+        # frames never seen in between get the drivers on a straight line
+        weights = (np.arange(1, frame - from_frame + 1) / (frame - from_frame))[:, None, None]
+        drivers = driver_before + (driver - driver_before) * weights
+        states = {}
+        solved = solver.solve(drivers, self.rest_positions, self.parent_index, state=(current, previous),
+                              driver_rest=self.driver_rest, driver_before=driver_before, checkpoints=states,
+                              checkpoint_every=1, **self.params)
+        for i, f in enumerate(range(from_frame + 1, frame + 1)):
+            self._states[f] = states[i + 1] + (drivers[i], solved[i])
+        return solved[-1]
+
+
+# What every chain's node needs from the scene, read on start_frame:
+# one dict per driver with driver, objects, parent_index (within the chain), driver_pivot, driver_rest, rest_positions,
+# local_matrices and scale_pivots (keys.rest_local_matrices)
+def chain_inputs(obj, start_frame, include_descendants=True, cmds=None):
+    cmds = get_cmds(cmds)
+    driver_list, obj_list, parent_index = list_chains([obj] if isinstance(obj, str) else obj, include_descendants,
+                                                      cmds)
+    driver_count = len(driver_list)
+    samples, _ = sample_scene(driver_list + obj_list, start_frame, start_frame, use_time_context=True, cmds=cmds)
+
+    local_matrices, scale_pivots = rest_local_matrices(obj_list, cmds)
+
+    node_driver = solver.build_topology(parent_index).node_driver
+    chains = []
+    for d, driver in enumerate(driver_list):
+        chain = np.flatnonzero(node_driver == d)
+        chains.append({
+            "driver": driver,
+            "objects": [obj_list[n] for n in chain],
+            "parent_index": _batch_parent_index(np.asarray(parent_index), chain)[0],
+            "driver_pivot": np.asarray(cmds.getAttr(driver + ".scalePivot")[0], dtype=float),
+            "driver_rest": samples[0, d],
+            "rest_positions": samples[0, driver_count + chain],
+            "local_matrices": local_matrices[chain],
+            "scale_pivots": scale_pivots[chain],
+        })
+    return chains
+
+
+# What the node gives back on frame: the world positions and the translates bake would key
+# driver_matrix: the driver's world matrix (16 numbers or 4x4), driver_pivot: its scalePivot
+# local_matrices, scale_pivots: the objects' (n, 4, 4) and (n, 3) from keys.rest_local_matrices
+def evaluate_outputs(node_solver, frame, driver_matrix, driver_pivot, local_matrices, scale_pivots):
+    driver_matrix = np.asarray(driver_matrix, dtype=float).reshape(4, 4)
+    positions = node_solver.evaluate(frame, world_pivot_from_matrix(driver_pivot, driver_matrix))
+    translate = world_to_local_translate(positions[None], node_solver.parent_index, driver_matrix[None],
+                                         np.reshape(local_matrices, (-1, 4, 4)), scale_pivots)[0]
+    return positions, translate
+
+
+# Making a secondaryMotion node for every chain of obj and connecting it up (needs the plugin loaded)
+# gives back the nodes
+def create_nodes(obj, start_frame, include_descendants=True, cmds=None, **params):
+    cmds = get_cmds(cmds)
+    params = dict(solver.DEFAULT_PARAMS, **params)
+    node_list = []
+    for chain in chain_inputs(obj, start_frame, include_descendants, cmds):
+        node = cmds.createNode(NODE_NAME, name=chain["driver"].rsplit("|", 1)[-1] + "_secondaryMotion")
+        cmds.connectAttr("time1.outTime", node + ".time")
+        cmds.connectAttr(chain["driver"] + ".worldMatrix[0]", node + ".driverMatrix")
+        cmds.setAttr(node + ".startFrame", int(start_frame))
+        cmds.setAttr(node + ".driverPivot", *chain["driver_pivot"], type="double3")
+        cmds.setAttr(node + ".driverRest", *chain["driver_rest"], type="double3")
+        cmds.setAttr(node + ".parentIndex", [int(parent) for parent in chain["parent_index"]], type="Int32Array")
+        cmds.setAttr(node + ".localMatrices", chain["local_matrices"].ravel().tolist(), type="doubleArray")
+        for attribute, (param, _) in PARAM_ATTRIBUTES.items():
+            cmds.setAttr(node + "." + attribute, params[param])
+        cmds.setAttr(node + ".force", *params["force"], type="double3")
+
+        for n, (obj_name, rest) in enumerate(zip(chain["objects"], chain["rest_positions"])):
+            cmds.setAttr(f"{node}.restPositions[{n}]", *rest, type="double3")
+            cmds.setAttr(f"{node}.objectPivots[{n}]", *chain["scale_pivots"][n], type="double3")
+            cmds.connectAttr(f"{node}.outTranslate[{n}]", obj_name + ".translate", force=True)
+        node_list.append(node)
+    return node_list
+
+
+# Largest difference between bake and NodeSolver fed one frame at a time like the node is, on FakeCmds
+# (every frame in order, then back and forth a bit, which has to come from what it kept)
+def parity(depth=8, width=2, frame_count=60, **params):
+    from secondary_motion.benchmark import build_vertical_nurbs_hierarchy
+    from secondary_motion.fake_cmds import FakeCmds
+    from secondary_motion.pipeline import bake
+
+    cmds = FakeCmds()
+    root_list = build_vertical_nurbs_hierarchy(depth, width, 2, frame_count, cmds)
+    chains = chain_inputs(root_list, 1, cmds=cmds)
+    baked = bake(root_list, 1, frame_count, cmds=cmds, **params)
+    _, obj_list, _ = list_chains(root_list, cmds=cmds)
+
+    difference = 0.0
+    for chain in chains:
+        node_solver = NodeSolver(chain["rest_positions"], chain["driver_rest"], chain["parent_index"], 1, **params)
+        columns = [obj_list.index(obj) for obj in chain["objects"]]
+        frame_list = list(range(1, frame_count + 1)) + [frame_count // 2, 3, frame_count]
+        for frame in frame_list:
+            matrix = cmds.getAttr(chain["driver"] + ".worldMatrix", time=frame)
+            positions, _ = evaluate_outputs(node_solver, frame, matrix, chain["driver_pivot"], chain["local_matrices"],
+                                            chain["scale_pivots"])
+            difference = max(difference, float(np.abs(positions - baked[frame - 1, columns]).max()))
+    return difference
+
+
+if OpenMaya is not None:
+
+    class SecondaryMotionNode(OpenMaya.MPxNode):
+        type_id = OpenMaya.MTypeId(NODE_ID)
+
+        def __init__(self):
+            OpenMaya.MPxNode.__init__(self)
+            self._solver = None
+            self._inputs = None
+
+        @staticmethod
+        def creator():
+            return SecondaryMotionNode()
+
+        @staticmethod
+        def initialize():
+            cls = SecondaryMotionNode
+            numeric = OpenMaya.MFnNumericAttribute()
+            unit = OpenMaya.MFnUnitAttribute()
+            matrix = OpenMaya.MFnMatrixAttribute()
+            typed = OpenMaya.MFnTypedAttribute()
+            Type = OpenMaya.MFnNumericData
+            kinds = {"double": Type.kDouble, "int": Type.kInt, "bool": Type.kBoolean}
+
+            cls.time = unit.create("time", "tm", OpenMaya.MFnUnitAttribute.kTime, 0.0)
+            cls.driverMatrix = matrix.create("driverMatrix", "dm")
+            cls.startFrame = numeric.create("startFrame", "sf", Type.kInt, 1)
+            cls.driverPivot = numeric.create("driverPivot", "dp", Type.k3Double)
+            cls.driverRest = numeric.create("driverRest", "dr", Type.k3Double)
+            cls.restPositions = numeric.create("restPositions", "rp", Type.k3Double)
+            numeric.array = True
+            cls.parentIndex = typed.create("parentIndex", "pi", OpenMaya.MFnData.kIntArray)
+            # 16 numbers per object, row by row
+            cls.localMatrices = typed.create("localMatrices", "lm", OpenMaya.MFnData.kDoubleArray)
+            cls.objectPivots = numeric.create("objectPivots", "opv", Type.k3Double)
+            numeric.array = True
+            inputs = [cls.time, cls.driverMatrix, cls.startFrame, cls.driverPivot, cls.driverRest, cls.restPositions,
+                      cls.parentIndex, cls.localMatrices, cls.objectPivots]
+
+            cls.params = {}
+            for attribute, (param, kind) in PARAM_ATTRIBUTES.items():
+                cls.params[attribute] = numeric.create(attribute, attribute, kinds[kind], solver.DEFAULT_PARAMS[param])
+                numeric.keyable = True
+            cls.force = numeric.create("force", "fo", Type.k3Double)
+            inputs += list(cls.params.values()) + [cls.force]
+
+            cls.outPositions = numeric.create("outPositions", "op", Type.k3Double)
+            numeric.array = True
+            numeric.usesArrayDataBuilder = True
+            numeric.writable = False
+            numeric.storable = False
+            cls.outTranslate = numeric.create("outTranslate", "ot", Type.k3Double)
+            numeric.array = True
+            numeric.usesArrayDataBuilder = True
+            numeric.writable = False
+            numeric.storable = False
+
+            for attribute in inputs + [cls.outPositions, cls.outTranslate]:
+                cls.addAttribute(attribute)
+            for attribute in inputs:
+                cls.attributeAffects(attribute, cls.outPositions)
+                cls.attributeAffects(attribute, cls.outTranslate)
+
+        # only its own inputs and its own state, so it can go next to any other node
+        def schedulingType(self):
+            return OpenMaya.MPxNode.kParallel
+
+        # A new NodeSolver when the rest inputs or params changed, otherwise the one that kept every frame
+        def _node_solver(self, data):
+            cls = SecondaryMotionNode
+            rest_handle = data.inputArrayValue(cls.restPositions)
+            rest_positions = []
+            for i in range(len(rest_handle)):
+                rest_handle.jumpToPhysicalElement(i)
+                rest_positions.append(rest_handle.inputValue().asDouble3())
+            parent_index = list(OpenMaya.MFnIntArrayData(data.inputValue(cls.parentIndex).data()).array())
+            getters = {"double": "asDouble", "int": "asInt", "bool": "asBool"}
+            params = {param: getattr(data.inputValue(cls.params[attribute]), getters[kind])()
+                      for attribute, (param, kind) in PARAM_ATTRIBUTES.items()}
+            params["force"] = tuple(data.inputValue(cls.force).asDouble3())
+            driver_rest = tuple(data.inputValue(cls.driverRest).asDouble3())
+            start_frame = data.inputValue(cls.startFrame).asInt()
+
+            inputs = (tuple(map(tuple, rest_positions)), tuple(parent_index), driver_rest, start_frame,
+                      tuple(sorted(params.items())))
+            if inputs != self._inputs or self._solver is None:
+                self._inputs = inputs
+                self._solver = NodeSolver(rest_positions, driver_rest, parent_index or None, start_frame, **params)
+            return self._solver
+
+        def compute(self, plug, data):
+            cls = SecondaryMotionNode
+            if plug.isElement:
+                plug = plug.array()
+            if plug not in (cls.outPositions, cls.outTranslate):
+                return None
+
+            node_solver = self._node_solver(data)
+            frame = data.inputValue(cls.time).asTime().asUnits(OpenMaya.MTime.uiUnit())
+            world_matrix = data.inputValue(cls.driverMatrix).asMatrix()
+            driver_matrix = [world_matrix.getElement(row, column) for row in range(4) for column in range(4)]
+            driver_pivot = data.inputValue(cls.driverPivot).asDouble3()
+            local_matrices = list(OpenMaya.MFnDoubleArrayData(data.inputValue(cls.localMatrices).data()).array())
+            pivot_handle = data.inputArrayValue(cls.objectPivots)
+            scale_pivots = []
+            for i in range(len(pivot_handle)):
+                pivot_handle.jumpToPhysicalElement(i)
+                scale_pivots.append(pivot_handle.inputValue().asDouble3())
+            positions, translate = evaluate_outputs(node_solver, frame, driver_matrix, driver_pivot, local_matrices,
+                                                    scale_pivots)
+
+            for attribute, values in ((cls.outPositions, positions), (cls.outTranslate, translate)):
+                handle = data.outputArrayValue(attribute)
+                builder = handle.builder()
+                for n, value in enumerate(values):
+                    builder.addElement(n).set3Double(*(float(v) for v in value))
+                handle.set(builder)
+                handle.setAllClean()
+            data.setClean(plug)
+
+
+def initializePlugin(plugin):
+    plugin_fn = OpenMaya.MFnPlugin(plugin, "secondary_motion")
+    plugin_fn.registerNode(NODE_NAME, SecondaryMotionNode.type_id, SecondaryMotionNode.creator,
+                           SecondaryMotionNode.initialize)
+    plugin_fn.registerCommand(keys.KEYS_COMMAND, keys.KeysCommand.creator)
+
+
+def uninitializePlugin(plugin):
+    plugin_fn = OpenMaya.MFnPlugin(plugin)
+    plugin_fn.deregisterNode(SecondaryMotionNode.type_id)
+    plugin_fn.deregisterCommand(keys.KEYS_COMMAND)
+# remove "#" to test:
+# print(parity(iterations=2, substeps=2))
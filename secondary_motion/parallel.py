@@ -0,0 +1,186 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+
+from secondary_motion import solver
+
+"""
+What code does:
+solves the chains of a batch on every core at once, for farm boxes with lots of them
+(solver.solve does the whole hierarchy on one core)
+
+Functions:
+- independent_groups(parent_index)
+- split_batches(parent_index, batch_count)
+- make_executor(workers=None)
+- solve_parallel(driver, rest_positions, parent_index=None, workers=None, executor=None, out_path=None, ...)
+
+How it splits:
+- every object hanging off a driver starts its own tree, nothing in one tree looks at another one
+	(two trees can share a driver, the driver is only read)
+- the trees are packed into one batch per worker, biggest first onto the emptiest batch,
+	so every worker gets about as many objects
+- every batch is still one array solve, so a worker with 50 small chains is about as quick as one with 1
+- the workers only get their own objects and the drivers those hang off, and give back their positions,
+	which go back in the same order so the keys can all be written in one go afterwards
+- out_path (a (frames, objects, 3) .npy, see secondary_motion.buffers): the workers write their positions
+	straight into that file instead of sending them back
+
+In Maya:
+- python's sys.executable is maya itself there, so the workers are started with mayapy next to it instead
+- the workers never import maya, they only get numpy arrays
+"""
+
+
+# Which tree every object is in: the index of the root it hangs off (parents come first, so one pass is enough)
+def _tree_of(parent_index):
+    tree = np.empty(len(parent_index), dtype=np.intp)
+    for i, parent in enumerate(parent_index):
+        tree[i] = i if parent < 0 else tree[parent]
+    return tree
+
+
+# Indexes of the objects in every tree, each in the same order as parent_index
+def independent_groups(parent_index):
+    tree = _tree_of(np.asarray(parent_index, dtype=np.intp))
+    roots, tree_number = np.unique(tree, return_inverse=True)
+    order = np.argsort(tree_number, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(tree_number, minlength=len(roots)))[:-1])
+
+
+# Packing the trees into batch_count batches of about the same number of objects
+# returns the object indexes of every batch (sorted, so parents still come before their children)
+def split_batches(parent_index, batch_count):
+    groups = sorted(independent_groups(parent_index), key=len, reverse=True)
+    batches = [[] for _ in range(max(1, min(batch_count, len(groups))))]
+    sizes = [0] * len(batches)
+    for group in groups:
+        emptiest = sizes.index(min(sizes))
+        batches[emptiest].append(group)
+        sizes[emptiest] += len(group)
+    return [np.sort(np.concatenate(batch)) for batch in batches]
+
+
+# parent_index of a batch on its own: parents as indexes into the batch, drivers renumbered to the ones it uses
+# returns that and which of the original drivers those are
+def _batch_parent_index(parent_index, nodes):
+    parents = parent_index[nodes]
+    used_drivers = np.unique(-parents[parents < 0] - 1)
+
+    local_index = np.empty(len(parent_index), dtype=np.intp)
+    local_index[nodes] = np.arange(len(nodes))
+    local_driver = np.empty(used_drivers.max() + 1, dtype=np.intp)
+    local_driver[used_drivers] = np.arange(len(used_drivers))
+
+    batch_parent_index = np.where(parents >= 0, local_index[np.maximum(parents, 0)],
+                                  -local_driver[np.maximum(-parents - 1, 0)] - 1)
+    return batch_parent_index, used_drivers
+
+
+# What one worker runs, arguments and result are plain arrays so they pickle
+# with an out file the positions go in there (frames from out_start, this batch's objects) and None comes back
+def _solve_batch(args):
+    (driver, rest_positions, parent_index, state, driver_rest, driver_before, driver_substeps, checkpoint_every,
+     params, nodes, out_path, out_start) = args
+    checkpoints = {}
+    solved = solver.solve(driver, rest_positions, parent_index, state=state, driver_rest=driver_rest,
+                          driver_before=driver_before, driver_substeps=driver_substeps,
+                          checkpoints=checkpoints, checkpoint_every=checkpoint_every, **params)
+    if out_path is None:
+        return solved, checkpoints
+
+    out = np.load(out_path, mmap_mode="r+")
+    out[out_start:out_start + len(solved), nodes] = solved
+    out.flush()
+    return None, checkpoints
+
+
+# Starting the workers with mayapy when this runs inside Maya, the default everywhere else
+def _pool_context():
+    context = multiprocessing.get_context("spawn")
+    executable = os.path.basename(sys.executable).lower()
+    if executable.startswith("maya") and not executable.startswith("mayapy"):
+        mayapy = os.path.join(os.path.dirname(sys.executable), "mayapy" + (".exe" if os.name == "nt" else ""))
+        context.set_executable(mayapy)
+    return context
+
+
+# A process pool to keep around for more than one solve_parallel (starting one takes a while)
+def make_executor(workers=None):
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=_pool_context())
+
+
+# Same as solver.solve (same arguments and result), with the independent trees solved on workers processes
+# workers: how many processes, os.cpu_count() by default
+# executor: a concurrent.futures executor to use instead of starting one (so a batch of shots can keep one around)
+# out_path, out_start: a .npy file the result goes into from frame out_start, what comes back is that part of it
+# with one tree, or one worker, this is just solver.solve
+def solve_parallel(driver, rest_positions, parent_index=None, workers=None, executor=None, state=None,
+                   driver_rest=None, driver_before=None, checkpoints=None, checkpoint_every=0, driver_substeps=None,
+                   out_path=None, out_start=0, **params):
+    driver = np.asarray(driver, dtype=float)
+    if driver.ndim == 2:
+        driver = driver[:, None, :]
+    rest_positions = np.asarray(rest_positions, dtype=float)
+    if parent_index is None:
+        parent_index = solver.chain_parents(len(rest_positions))
+    parent_index = np.asarray(parent_index, dtype=np.intp)
+    workers = workers or os.cpu_count() or 1
+
+    batches = split_batches(parent_index, workers) if len(parent_index) else []
+    if len(batches) <= 1:
+        solved = solver.solve(driver, rest_positions, parent_index, state=state, driver_rest=driver_rest,
+                              driver_before=driver_before, checkpoints=checkpoints, checkpoint_every=checkpoint_every,
+                              driver_substeps=driver_substeps, **params)
+        if out_path is None:
+            return solved
+        out = np.load(out_path, mmap_mode="r+")
+        out[out_start:out_start + len(solved)] = solved
+        return out[out_start:out_start + len(solved)]
+
+    # only what each batch needs goes over to its worker
+    jobs = []
+    for nodes in batches:
+        batch_parent_index, used = _batch_parent_index(parent_index, nodes)
+        jobs.append((
+            driver[:, used],
+            rest_positions[nodes],
+            batch_parent_index,
+            None if state is None else (np.asarray(state[0])[nodes], np.asarray(state[1])[nodes]),
+            None if driver_rest is None else np.asarray(driver_rest, dtype=float).reshape(-1, 3)[used],
+            None if driver_before is None else np.asarray(driver_before, dtype=float).reshape(-1, 3)[used],
+            None if driver_substeps is None else np.asarray(driver_substeps)[:, :, used],
+            checkpoint_every if checkpoints is not None else 0,
+            params,
+            nodes,
+            out_path,
+            out_start,
+        ))
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=_pool_context()) as pool:
+            results = list(pool.map(_solve_batch, jobs))
+    else:
+        results = list(executor.map(_solve_batch, jobs))
+
+    # putting every batch back where its objects were (the workers already did that with an out file)
+    dtype = solver.PRECISIONS[params.get("precision", "float64")]
+    if out_path is None:
+        solved = np.empty((len(driver),) + rest_positions.shape, dtype)
+        for nodes, (batch_solved, _) in zip(batches, results):
+            solved[:, nodes] = batch_solved
+    else:
+        solved = np.load(out_path, mmap_mode="r+")[out_start:out_start + len(driver)]
+    if checkpoints is not None:
+        for frame in results[0][1]:
+            current = np.empty(rest_positions.shape, dtype)
+            previous = np.empty(rest_positions.shape, dtype)
+            for nodes, (_, batch_checkpoints) in zip(batches, results):
+                current[nodes], previous[nodes] = batch_checkpoints[frame]
+            checkpoints[frame] = (current, previous)
+    return solved
+# remove "#" to test:
+# print(solve_parallel(np.zeros((10, 2, 3)), [[0, 2, 0], [5, 2, 0]], [-1, -2], workers=2)[-1])
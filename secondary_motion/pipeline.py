@@ -0,0 +1,452 @@
+import math
+import os
+
+import numpy as np
+
+from secondary_motion import solver
+from secondary_motion.buffers import BakeBuffers
+from secondary_motion.cache import (
+    SimulationCache, ancestor_paths, changed_frame, curve_data, default_cache_directory, dump_curves, hash_curves,
+    keyed_hash, last_bake_key, load_curves, rest_hash, same_rest, sample_key, solve_key,
+)
+from secondary_motion.keys import rest_local_matrices, world_to_local_translate, write_translate_keys
+from secondary_motion.parallel import make_executor, solve_parallel
+from secondary_motion.profiling import Profiler, stage
+from secondary_motion.sampling import sample_scene, sample_substeps
+from secondary_motion.scene import get_cmds, list_chains
+from secondary_motion.trajectory import write_trajectory
+
+"""
+What code does:
+the whole thing the scripts do, in one call:
+selected object (and its descendants) will move based off movement of its parent
+
+Functions:
+- creat_loc_at_position(transform_values=[0, 0, 0], name="NameThis", cmds=None)
+- bake(obj, start_frame, end_frame, include_descendants=True, debug_locators=False, cache=None,
+	checkpoint_every=10, interpolation="linear", workers=0, buffers=None, profiler=None, trajectory=None, cmds=None,
+	**params)
+
+Steps:
+- rest: read the objects once, on the first frame (that's all the solver needs of them)
+- sample: read the parents over the frame range in one pass
+- solve: secondary_motion.solver, arrays in and arrays out, no Maya needed
+- key: only the objects themselves, every translate channel in one go with
+	secondary_motion.keys.write_translate_keys
+	(cannot move the objects directly with the world values because of frozen transformation,
+	so they get keyed at the translate that puts their scalePivot on the solved position, see secondary_motion.keys)
+
+Cache (secondary_motion.cache):
+- cache=True keeps the samples and solved positions in a folder next to the scene,
+	or pass a SimulationCache to pick the folder and size cap
+- same animation, frame range and rest pose of the objects: no sampling, same params too: no solving either
+	(the objects' rest pose is read every time, their first frame and their local matrices, see secondary_motion.cache)
+- animation changed from frame F onward (and the last bake with these params is still in the cache):
+	only frames from F are sampled again, the solver picks up from the last checkpoint before F
+	(one every checkpoint_every frames), and only frames from F get keyed again
+	(while the keys on the objects are still the ones that bake left, otherwise all of them are)
+
+Batches:
+- bake takes one object or a list of them (everything selected), all of them are done in one go:
+	one pass over the frame range for every parent, one solve for all of them
+	(every parent is one more driver of the same hierarchy, see secondary_motion.scene.list_chains)
+- objects that share a parent share its samples, an object under another selected object is only baked once
+- workers=N solves the independent chains on N processes (secondary_motion.parallel) once everything is sampled,
+	the keys are still written in one go at the end; workers=0 solves everything here
+
+Buffers (secondary_motion.buffers):
+- buffers=True keeps the samples and solved positions in memory mapped files while baking
+	(in a buffers folder in the cache folder), or pass the folder to keep them in
+- they get sampled and solved checkpoint_every frames at a time, so after a crash the same bake
+	carries on from the last frames that made it to disk, and the folder is deleted once the keys are on
+- with workers, the workers write straight into the solved file
+
+Profiling (secondary_motion.profiling):
+- profiler=Profiler() times every stage (list_chains, rest, hash, cache, sample, substeps, solve, key, trajectory,
+	locators...)
+	and counts the cmds calls in each, per frame and per chain, profiler=True prints the table at the end
+- keys get written one chain (everything under one driver) at a time, so every chain is its own key stage
+
+Trajectory (secondary_motion.trajectory):
+- trajectory="path.smtraj" also writes the solved positions and the keyed translates there (float32, memory mapped),
+	trajectory.apply_trajectory puts them back on the objects later without sampling or solving
+
+Very long shots:
+- bake keeps every frame in memory (or in buffers), secondary_motion.streaming.bake_streaming does the same bake
+	a window of frames at a time and only ever keeps one window around
+
+Locators:
+- the parent samples and the solved positions never leave the arrays, so no ParentLoc/ObjLoc is made
+- debug_locators=True still makes them (keyed on the parent samples and solved positions)
+	and leaves them in the scene so the motion can be looked at
+
+params are the solver ones (dt, mass, force, damping, k, constraint, cascade, substeps, iterations),
+see solver.DEFAULT_PARAMS
+with substeps, interpolation="linear" puts the parent in between frames on a straight line (nothing extra to sample),
+interpolation="curve" samples the parent at every substep too
+cascade=True is the HIERARCHY-RepeatBaseChunk behaviour, every object following its own parent,
+still with one pass over the frame range no matter how deep the hierarchy goes
+"""
+
+
+# Create loc based on the given location
+def creat_loc_at_position(transform_values=[0, 0, 0], name="NameThis", cmds=None):
+    cmds = get_cmds(cmds)
+    loc = cmds.spaceLocator(name=name)
+    cmds.move(transform_values[0], transform_values[1], transform_values[2], loc, relative=True)
+    return loc
+
+
+# Making the ParentLoc and ObjLoc_N locators and keying them, only to look at what the solver did
+# parent_samples: (frames, drivers, 3), one ParentLoc per driver
+def _make_debug_locators(parent_samples, solved, frame_list, cmds):
+    with stage(cmds, "locators", frames=len(frame_list), objects=parent_samples.shape[1] + solved.shape[1]):
+        return _make_locators(parent_samples, solved, frame_list, cmds)
+
+
+def _make_locators(parent_samples, solved, frame_list, cmds):
+    parent_loc_list = [creat_loc_at_position(pos, "ParentLoc", cmds)[0] for pos in parent_samples[0]]
+    obj_loc_list = [creat_loc_at_position(pos, f"ObjLoc_{n + 1}", cmds)[0] for n, pos in enumerate(solved[0])]
+
+    # the locators have no parent, so their translate is their world position
+    write_translate_keys(parent_loc_list, frame_list, parent_samples, cmds=cmds)
+    write_translate_keys(obj_loc_list, frame_list, solved, cmds=cmds)
+    return parent_loc_list + obj_loc_list
+
+
+# The parents in between frames, when the solver has substeps and they should come from the curves
+# None means the solver interpolates linearly on its own
+def _driver_substeps(driver_list, start_frame, end_frame, params, interpolation, cmds, first_frame_holds=True):
+    if interpolation != "curve" or params["substeps"] <= 1:
+        return None
+    with stage(cmds, "substeps", frames=end_frame - start_frame + 1, chains=len(driver_list)):
+        return sample_substeps(driver_list, start_frame, end_frame, params["substeps"], first_frame_holds,
+                               dtype=solver.PRECISIONS[params["precision"]], cmds=cmds)
+
+
+# solver.solve, or solve_parallel when there are workers to spread the chains over
+# args are solve's (driver, rest_positions, parent_index...), cmds only carries the profiler
+def _solve(workers, cmds, *args, **kwargs):
+    with stage(cmds, "solve", frames=len(args[0]), chains=-min(args[2]) if len(args[2]) else 0,
+               objects=len(args[2]), workers=workers):
+        if workers:
+            return solve_parallel(*args, workers=workers, **kwargs)
+        return solver.solve(*args, **kwargs)
+
+
+# sample_scene of the drivers as a profiler stage, the positions in the solver's precision
+# (the objects aren't in it, only their first frame is ever used and bake reads that once)
+def _sample(driver_list, start_frame, end_frame, params, cmds):
+    with stage(cmds, "sample", frames=end_frame - start_frame + 1, chains=len(driver_list)):
+        return sample_scene(driver_list, start_frame, end_frame, driver_list,
+                            dtype=solver.PRECISIONS[params["precision"]], cmds=cmds)
+
+
+# Full sample and solve, gives back samples, parent matrices, rest positions, solved positions and checkpoints
+# ({frame index: (current, previous)})
+# node_list is the drivers and then the objects, samples are only the drivers' (frames, drivers, 3)
+# rest_positions: the objects on the first frame
+def _sample_and_solve(node_list, driver_count, parent_index, start_frame, end_frame, params, interpolation,
+                      checkpoint_every, workers, cmds, rest_positions, samples=None, mapped=None):
+    driver_list = node_list[:driver_count]
+    if samples is None and mapped is not None:
+        return _sample_and_solve_mapped(node_list, driver_count, parent_index, start_frame, end_frame, params,
+                                        interpolation, workers, mapped, cmds, rest_positions)
+    if samples is None:
+        samples = _sample(driver_list, start_frame, end_frame, params, cmds)
+    driver_substeps = _driver_substeps(driver_list, start_frame, end_frame, params, interpolation, cmds)
+    checkpoints = {}
+    solved = _solve(workers, cmds, samples[0], rest_positions, parent_index,
+                    driver_substeps=driver_substeps, checkpoints=checkpoints, checkpoint_every=checkpoint_every,
+                    **params)
+    return samples[0], samples[1], rest_positions, solved, checkpoints
+
+
+# Same thing a chunk of frames at a time into BakeBuffers, starting from wherever they got to before
+# the checkpoints that come back are the ones in the buffers, one every chunk frames
+# (the rest positions go in with the first chunk, picking up again solves from the ones in there)
+def _sample_and_solve_mapped(node_list, driver_count, parent_index, start_frame, end_frame, params, interpolation,
+                             workers, mapped, cmds, rest_positions):
+    driver_list = node_list[:driver_count]
+    frame_count = end_frame - start_frame + 1
+    chunk = mapped.chunk
+
+    if not mapped.sampled_frames:
+        mapped.rest_positions[:] = rest_positions
+    for f0 in range(mapped.sampled_frames, frame_count, chunk):
+        f1 = min(f0 + chunk, frame_count)
+        mapped.samples[f0:f1], mapped.parent_matrices[f0:f1] = _sample(
+            driver_list, start_frame + f0, start_frame + f1 - 1, params, cmds)
+        mapped.mark_sampled(f1)
+
+    samples = mapped.samples
+    rest_positions = mapped.rest_positions
+    if not mapped.solved_frames:
+        mapped.checkpoints[0] = (rest_positions, rest_positions)
+
+    # one pool for every chunk, starting one takes longer than solving a chunk
+    executor = make_executor(workers) if workers else None
+    try:
+        for f0 in range(mapped.solved_frames, frame_count, chunk):
+            f1 = min(f0 + chunk, frame_count)
+            checkpoints = {}
+            solve_args = dict(
+                state=tuple(mapped.checkpoints[f0 // chunk]),
+                driver_rest=samples[0],
+                driver_before=samples[f0 - 1] if f0 else None,
+                driver_substeps=_driver_substeps(driver_list, start_frame + f0, start_frame + f1 - 1, params,
+                                                 interpolation, cmds, first_frame_holds=not f0),
+                checkpoints=checkpoints,
+                checkpoint_every=chunk,
+            )
+            if executor:
+                _solve(workers, cmds, samples[f0:f1], rest_positions, parent_index,
+                       executor=executor, out_path=mapped.solved_path, out_start=f0, **solve_args, **params)
+            else:
+                mapped.solved[f0:f1] = _solve(0, cmds, samples[f0:f1], rest_positions, parent_index, **solve_args,
+                                              **params)
+
+            # the state at the end of this chunk is where the next one starts from
+            if chunk in checkpoints:
+                mapped.checkpoints[f0 // chunk + 1] = checkpoints[chunk]
+            mapped.mark_solved(f1)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    checkpoints = {f: (mapped.checkpoints[f // chunk, 0], mapped.checkpoints[f // chunk, 1])
+                   for f in range(0, frame_count, chunk)}
+    return samples, mapped.parent_matrices, rest_positions, mapped.solved, checkpoints
+
+
+# A cache entry's samples and solver state are only any good from the same rest pose (see secondary_motion.cache)
+# (entries from before the objects were only read on the first frame don't have it on its own)
+def _same_rest(sampled_entry, rest_positions):
+    return "rest_positions" in sampled_entry and same_rest(sampled_entry["rest_positions"], rest_positions)
+
+
+# Everything animating the drivers: the drivers and everything above them
+# (the objects' own keys are what bake writes, so they don't count, their rest pose goes in the key on its own)
+def _driver_curves(node_list, driver_count, cmds):
+    ancestors = []
+    for driver in node_list[:driver_count]:
+        ancestors.extend(path for path in ancestor_paths(driver) if path not in ancestors)
+    with stage(cmds, "hash", chains=driver_count, objects=len(ancestors)):
+        return curve_data(ancestors, cmds)
+
+
+# Picking up the last bake of this chain from the first frame its animation changed
+# gives back None when it can't (nothing to pick up from, or the change goes back to the first frame)
+def _resume(last, curves, node_list, driver_count, parent_index, start_frame, end_frame, params, interpolation,
+            checkpoint_every, workers, cache, cmds, rest_positions):
+    if last is None:
+        return None
+    frame = changed_frame(load_curves(last["curves"]), curves)
+    if frame is None or frame <= start_frame:
+        return None
+    changed_index = min(int(math.floor(frame)), end_frame + 1) - start_frame
+
+    with stage(cmds, "cache"):
+        old_sampled = cache.load(str(last["sampled_key"]))
+        old_solved = cache.load(str(last["solved_key"]))
+    if old_sampled is None or old_solved is None:
+        return None
+    if not _same_rest(old_sampled, rest_positions):
+        return None
+
+    # last checkpoint before the change
+    checkpoint_frames = old_solved["checkpoint_frames"]
+    usable = np.flatnonzero(checkpoint_frames <= changed_index)
+    if not len(usable):
+        return None
+    c = usable[-1]
+    checkpoint_index = int(checkpoint_frames[c])
+    state = (old_solved["checkpoint_current"][c], old_solved["checkpoint_previous"][c])
+
+    # the samples before the change are still good
+    samples = old_sampled["samples"].copy()
+    parent_matrices = old_sampled["parent_matrices"].copy()
+    if changed_index < len(samples):
+        samples[changed_index:], parent_matrices[changed_index:] = _sample(
+            node_list[:driver_count], start_frame + changed_index, end_frame, params, cmds)
+    # the checkpoints were solved from these
+    rest_positions = old_sampled["rest_positions"]
+
+    # the substeps of the checkpoint frame start from the frame before it
+    driver_before = samples[checkpoint_index - 1] if checkpoint_index else None
+    driver_substeps = _driver_substeps(node_list[:driver_count], start_frame + checkpoint_index, end_frame, params,
+                                       interpolation, cmds, first_frame_holds=not checkpoint_index)
+
+    new_checkpoints = {}
+    solved = old_solved["solved"].copy()
+    solved[checkpoint_index:] = _solve(
+        workers, cmds, samples[checkpoint_index:], rest_positions, parent_index, state=state,
+        driver_rest=samples[0],
+        driver_before=driver_before, driver_substeps=driver_substeps,
+        checkpoints=new_checkpoints, checkpoint_every=checkpoint_every, **params)
+
+    checkpoints = {int(f): (old_solved["checkpoint_current"][i], old_solved["checkpoint_previous"][i])
+                   for i, f in enumerate(checkpoint_frames) if f < checkpoint_index}
+    checkpoints.update({checkpoint_index + f: state for f, state in new_checkpoints.items()})
+    return samples, parent_matrices, rest_positions, solved, checkpoints, changed_index
+
+
+# Everything the cache can save, gives back samples, parent matrices, solved positions
+# and the first frame index that needs keying again
+# rest: rest_hash of the objects, rest_positions: where they are on the first frame (see secondary_motion.cache)
+def _sample_and_solve_cached(node_list, driver_count, parent_index, start_frame, end_frame, params, interpolation,
+                             checkpoint_every, workers, cache, cmds, rest, rest_positions, mapped=None):
+    curves = _driver_curves(node_list, driver_count, cmds)
+    sampled_key = sample_key(hash_curves(curves), node_list, start_frame, end_frame, precision=params["precision"],
+                             rest=rest)
+    solved_key = solve_key(sampled_key, dict(params, interpolation=interpolation))
+    last_key = last_bake_key(node_list, start_frame, end_frame, dict(params, interpolation=interpolation))
+
+    with stage(cmds, "cache"):
+        sampled_entry = cache.load(sampled_key)
+        solved_entry = cache.load(solved_key)
+    # the objects were moved on the first frame (translate isn't in the key): nothing in there is any good
+    if sampled_entry is not None and not _same_rest(sampled_entry, rest_positions):
+        sampled_entry = solved_entry = None
+    # same animation and same params: nothing to do
+    if sampled_entry is not None and solved_entry is not None:
+        return sampled_entry["samples"], sampled_entry["parent_matrices"], solved_entry["solved"], 0
+
+    first_index = 0
+    if sampled_entry is not None:
+        # only the params changed: the samples are still good
+        samples = (sampled_entry["samples"], sampled_entry["parent_matrices"])
+        result = _sample_and_solve(node_list, driver_count, parent_index, start_frame, end_frame, params,
+                                   interpolation, checkpoint_every, workers, cmds, sampled_entry["rest_positions"],
+                                   samples)
+    else:
+        with stage(cmds, "cache"):
+            last = cache.load(last_key)
+        result = _resume(last, curves, node_list, driver_count, parent_index, start_frame, end_frame,
+                         params, interpolation, checkpoint_every, workers, cache, cmds, rest_positions)
+        if result is None:
+            result = _sample_and_solve(node_list, driver_count, parent_index, start_frame, end_frame, params,
+                                       interpolation, checkpoint_every, workers, cmds, rest_positions, mapped=mapped)
+        else:
+            first_index = result[5]
+            # the keys before the change are only right if they're still the ones that bake left on the objects
+            # (another bake with other params in between keyed them too), otherwise everything gets keyed again
+            with stage(cmds, "cache", objects=len(node_list) - driver_count):
+                if str(last.get("keyed", "")) != keyed_hash(node_list[driver_count:], cmds):
+                    first_index = 0
+    samples, parent_matrices, rest_positions, solved, checkpoints = result[:5]
+
+    checkpoint_frames = sorted(checkpoints)
+    with stage(cmds, "cache"):
+        cache.save(sampled_key, samples=samples, parent_matrices=parent_matrices, rest_positions=rest_positions)
+        cache.save(solved_key, solved=solved,
+                   checkpoint_frames=np.array(checkpoint_frames, dtype=int),
+                   checkpoint_current=np.array([checkpoints[f][0] for f in checkpoint_frames], dtype=solved.dtype),
+                   checkpoint_previous=np.array([checkpoints[f][1] for f in checkpoint_frames], dtype=solved.dtype))
+        cache.save(last_key, curves=dump_curves(curves), sampled_key=np.array(sampled_key),
+                   solved_key=np.array(solved_key))
+    return samples, parent_matrices, solved, first_index
+
+
+# Remembering the keys bake just left on the objects in its last bake entry, see _sample_and_solve_cached
+def _remember_keys(node_list, driver_count, start_frame, end_frame, params, interpolation, cache, cmds):
+    last_key = last_bake_key(node_list, start_frame, end_frame, dict(params, interpolation=interpolation))
+    with stage(cmds, "cache", objects=len(node_list) - driver_count):
+        last = cache.load(last_key)
+        if last is not None:
+            last["keyed"] = np.array(keyed_hash(node_list[driver_count:], cmds))
+            cache.save(last_key, **last)
+
+
+# Baking the secondary motion of obj (and its descendants) from start_frame to end_frame
+# obj can be a list of objects too (like everything selected), they all get baked together
+# returns the solved world positions as a (frames, objects, 3) array
+def bake(obj, start_frame, end_frame, include_descendants=True, debug_locators=False, cache=None,
+         checkpoint_every=10, interpolation="linear", workers=0, buffers=None, profiler=None, trajectory=None,
+         cmds=None, **params):
+    cmds = get_cmds(cmds)
+    print_table = profiler is True
+    if profiler:
+        profiler = Profiler() if profiler is True else profiler
+        cmds = profiler.wrap(cmds)
+    params = dict(solver.DEFAULT_PARAMS, **params)
+    frame_list = list(range(start_frame, end_frame + 1))
+
+    with stage(cmds, "list_chains"):
+        driver_list, obj_list, parent_index = list_chains([obj] if isinstance(obj, str) else obj, include_descendants,
+                                                          cmds)
+    node_list = driver_list + obj_list
+    driver_count = len(driver_list)
+
+    # the objects' rest pose: the local matrices they get keyed with, and where they are on the first frame
+    # (the only frame the solver needs them on, so the sampling after this is only the drivers)
+    with stage(cmds, "rest", objects=len(obj_list)):
+        local_matrices, scale_pivots = rest_local_matrices(obj_list, cmds)
+        rest = rest_hash(local_matrices, scale_pivots)
+        rest_positions = sample_scene(obj_list, start_frame, start_frame,
+                                      dtype=solver.PRECISIONS[params["precision"]], cmds=cmds)[0][0]
+
+    mapped = None
+    if buffers:
+        directory = os.path.join(default_cache_directory(cmds), "buffers") if buffers is True else buffers
+        key = solve_key(sample_key(hash_curves(_driver_curves(node_list, driver_count, cmds)), node_list,
+                                   start_frame, end_frame, precision=params["precision"], rest=rest),
+                        dict(params, interpolation=interpolation))
+        # without checkpoints it still goes 10 frames at a time, so there is something to pick up from
+        with stage(cmds, "buffers"):
+            mapped = BakeBuffers(directory, key, len(frame_list), driver_count, len(obj_list),
+                                 checkpoint_every or 10, dtype=solver.PRECISIONS[params["precision"]])
+            # what's in there was solved with the objects somewhere else on the first frame
+            if mapped.sampled_frames and not same_rest(mapped.rest_positions, rest_positions):
+                mapped.reset()
+
+    if cache is True:
+        cache = SimulationCache(cmds=cmds)
+    if cache:
+        samples, parent_matrices, solved, first_index = _sample_and_solve_cached(
+            node_list, driver_count, parent_index, start_frame, end_frame, params, interpolation, checkpoint_every,
+            workers, cache, cmds, rest, rest_positions, mapped)
+    else:
+        samples, parent_matrices, _, solved, _ = _sample_and_solve(
+            node_list, driver_count, parent_index, start_frame, end_frame, params, interpolation, 0, workers, cmds,
+            rest_positions, mapped=mapped)
+        first_index = 0
+
+    # the objects get keyed at the translate that puts them on the solved positions, in their parent's space
+    # when only the end of the shot changed, only the end gets keyed again
+    with stage(cmds, "key", objects=len(obj_list)):
+        local_translate = world_to_local_translate(solved[first_index:], parent_index, parent_matrices[first_index:],
+                                                   local_matrices, scale_pivots)
+
+    # one chain (everything under one driver) at a time
+    node_driver = solver.build_topology(parent_index).node_driver
+    for d, driver in enumerate(driver_list):
+        chain = np.flatnonzero(node_driver == d)
+        with stage(cmds, "key", frames=len(frame_list) - first_index, chains=1, objects=len(chain), chain=driver):
+            write_translate_keys([obj_list[n] for n in chain], frame_list[first_index:], local_translate[:, chain],
+                                 replace=first_index == 0, cmds=cmds)
+    if cache:
+        _remember_keys(node_list, driver_count, start_frame, end_frame, params, interpolation, cache, cmds)
+
+    if trajectory:
+        with stage(cmds, "trajectory", frames=len(frame_list), objects=len(obj_list)):
+            if first_index:
+                local_translate = world_to_local_translate(solved, parent_index, parent_matrices, local_matrices,
+                                                           scale_pivots)
+            write_trajectory(trajectory, solved, local_translate, obj_list, start_frame, driver_list, parent_index,
+                             dict(params, interpolation=interpolation))
+
+    if debug_locators:
+        _make_debug_locators(samples, solved, frame_list, cmds)
+
+    # the keys are on, nothing left to pick up from
+    if mapped is not None:
+        solved = np.array(solved)
+        with stage(cmds, "buffers"):
+            mapped.remove()
+
+    if print_table:
+        print(profiler.table())
+    return solved
+# remove "#" to test:
+# bake("SELECT_THIS", 1, 50)
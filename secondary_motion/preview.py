@@ -0,0 +1,157 @@
+from secondary_motion import solver
+from secondary_motion.keys import rest_local_matrices, world_to_local_translate
+from secondary_motion.profiling import stage
+from secondary_motion.sampling import sample_scene
+from secondary_motion.scene import get_cmds, list_chains
+
+"""
+What code does:
+shows the secondary motion live while the timeline plays or gets scrubbed, without baking any keys,
+so k / damping / ... can be tried on the shot straight away
+
+Usage:
+    from secondary_motion.preview import LivePreview
+    preview = LivePreview("SELECT_THIS", 1, k=0.2, damping=0.7)
+    preview.start()
+    # play / scrub, try something else:
+    preview.set_params(k=0.3)
+    # and when it looks right:
+    preview.stop()
+    bake("SELECT_THIS", 1, 50, **preview.params)
+
+Classes:
+- LivePreview(obj, start_frame, include_descendants=True, checkpoint_every=10, cmds=None, **params)
+	.start() / .stop() / .update(frame=None) / .set_params(**params) / .reset()
+
+How it works:
+- start() reads where every parent and object is on start_frame (the default positions, same as bake)
+	and registers a timeChanged scriptJob, so every time change after that (playing or scrubbing) calls update()
+- update() only reads the parents on the new frame and steps the solver one frame on from the state it kept
+	from the frame before, then sets the objects' translate (setAttr, no keys) to what bake would key there
+- the parents are read with getAttr(time=), the timeline is never moved from inside the callback
+- every checkpoint_every frames the state is kept, going back (or jumping ahead) solves again from the
+	latest state before the new frame, so scrubbing back is at most checkpoint_every frames of solving
+- frames before start_frame show start_frame, in between frames are rounded to the nearest frame
+- with substeps, the parents go in between frames on a straight line (bake's interpolation="linear")
+
+What it keeps is only right while the parents' animation stays the same: after editing it, reset()
+(set_params() resets too, every frame has to be solved again with new params)
+stop() puts the objects back where they were, do that before bake, the bake's time changes would step it too
+objects with translate keys go back to their keys on every time change, cutKey them first
+"""
+
+
+class LivePreview(object):
+
+    def __init__(self, obj, start_frame, include_descendants=True, checkpoint_every=10, cmds=None, **params):
+        self.cmds = get_cmds(cmds)
+        self.start_frame = int(start_frame)
+        self.checkpoint_every = max(int(checkpoint_every), 1)
+        self.params = dict(solver.DEFAULT_PARAMS, **params)
+        self.driver_list, self.obj_list, self.parent_index = list_chains(
+            [obj] if isinstance(obj, str) else obj, include_descendants, self.cmds)
+        # the scriptJob while it's running
+        self.job = None
+        # frame shown, its solved world positions (objects, 3) and the parents' world matrices (drivers, 4, 4)
+        self.frame = None
+        self.positions = None
+        self._parent_matrices = None
+        self._original_translate = None
+        self._driver_rest = None
+        self._rest_positions = None
+        self._local_matrices = None
+        self._scale_pivots = None
+        # {frame: (current, previous, drivers)}, the solver state after that frame and where the parents were
+        self._checkpoints = {}
+        self._last = None
+
+    # Reading the default positions and following the timeline from now on
+    def start(self):
+        cmds = self.cmds
+        if self.job is not None:
+            return
+        node_list = self.driver_list + self.obj_list
+        driver_count = len(self.driver_list)
+        self._original_translate = [cmds.getAttr(obj + ".translate")[0] for obj in self.obj_list]
+        self._local_matrices, self._scale_pivots = rest_local_matrices(self.obj_list, cmds)
+        samples, _ = sample_scene(node_list, self.start_frame, self.start_frame, use_time_context=True, cmds=cmds)
+        self._driver_rest = samples[0, :driver_count]
+        self._rest_positions = samples[0, driver_count:]
+        self.reset()
+
+        self.job = cmds.scriptJob(event=["timeChanged", self._time_changed])
+        self.update()
+
+    # No more following the timeline, the objects go back to where they were
+    def stop(self):
+        cmds = self.cmds
+        if self.job is not None:
+            cmds.scriptJob(kill=self.job, force=True)
+            self.job = None
+        if self._original_translate is not None:
+            for obj, translate in zip(self.obj_list, self._original_translate):
+                cmds.setAttr(obj + ".translate", *translate)
+            self._original_translate = None
+        self.frame = None
+
+    # Forgetting every solved frame, the objects start still at their default positions again
+    # (the state before start_frame, with the parents where they are on start_frame, like solver.solve)
+    def reset(self):
+        self.frame = None
+        rest = self._rest_positions
+        self._checkpoints = {self.start_frame - 1: (rest, rest, self._driver_rest)}
+        self._last = None
+
+    # New params for the solver, shown straight away when it's running
+    def set_params(self, **params):
+        self.params.update(params)
+        self.reset()
+        if self.job is not None:
+            self.update()
+
+    def _time_changed(self):
+        self.update()
+
+    # Showing frame (the current time by default), gives back the solved world positions (objects, 3)
+    def update(self, frame=None):
+        cmds = self.cmds
+        frame = cmds.currentTime(query=True) if frame is None else frame
+        frame = max(int(round(frame)), self.start_frame)
+        if frame == self.frame:
+            return self.positions
+
+        with stage(cmds, "preview", frames=1, objects=len(self.obj_list), frame=frame):
+            self._solve_to(frame)
+            local_translate = world_to_local_translate(self.positions[None], self.parent_index,
+                                                       self._parent_matrices[None], self._local_matrices,
+                                                       self._scale_pivots)[0]
+            for obj, translate in zip(self.obj_list, local_translate):
+                cmds.setAttr(obj + ".translate", *translate)
+        return self.positions
+
+    # Solving up to frame from the latest state before it: one frame when playing, a few when scrubbing back
+    def _solve_to(self, frame):
+        known = dict(self._checkpoints)
+        if self._last is not None:
+            known[self._last[0]] = self._last[1]
+        from_frame = max(f for f in known if f < frame)
+        current, previous, driver_before = known[from_frame]
+
+        samples, parent_matrices = sample_scene(self.driver_list, from_frame + 1, frame, self.driver_list,
+                                                use_time_context=True, evaluate_curves=False, cmds=self.cmds)
+        # the state after every frame comes back in states (before frame i is after frame i - 1)
+        states = {}
+        solved = solver.solve(samples, self._rest_positions, self.parent_index, state=(current, previous),
+                              driver_rest=self._driver_rest, driver_before=driver_before, checkpoints=states,
+                              checkpoint_every=1, **self.params)
+
+        for i, f in enumerate(range(from_frame + 1, frame + 1)):
+            if (f - self.start_frame + 1) % self.checkpoint_every == 0:
+                self._checkpoints[f] = states[i + 1] + (samples[i],)
+        self._last = (frame, states[len(samples)] + (samples[-1],))
+        self.frame = frame
+        self.positions = solved[-1]
+        self._parent_matrices = parent_matrices[-1]
+# remove "#" to test:
+# preview = LivePreview("SELECT_THIS", 1)
+# preview.start()
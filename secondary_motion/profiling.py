@@ -0,0 +1,186 @@
+import contextlib
+import json
+import time
+from collections import Counter
+
+"""
+What code does:
+times every stage of a bake (sampling, solving, keying, locators...) and counts the maya.cmds calls in each,
+so a slow bake shows where the time goes, as a table and as a trace for chrome://tracing or ui.perfetto.dev
+
+Usage:
+    from secondary_motion.profiling import Profiler
+    profiler = Profiler()
+    bake("SELECT_THIS", 1, 50, profiler=profiler)
+    print(profiler.table())
+    profiler.write_trace("bake_trace.json")
+or bake(..., profiler=True) to just print the table at the end
+
+Classes:
+- Profiler().stage(name, **args) / .wrap(cmds) / .summary() / .table() / .write_trace(path)
+- CountingCmds(cmds, profiler)
+
+Functions:
+- stage(cmds, name, **args)
+
+How it hangs together:
+- profiler.wrap(cmds) gives back a cmds that times and counts every call, and that carries the profiler,
+	so it goes everywhere cmds already goes and nothing else needs passing around
+- stage(cmds, "sample", frames=50, chains=1) marks a stage, a cmds call counts towards the innermost open stage
+- args are whatever describes the stage, frames / chains / objects give the per frame and per chain columns
+- every time change (currentTime(edit=True)) is a mark in the trace, so sampling shows every frame
+
+Turned off (plain maya.cmds or FakeCmds, no profiler): stage() is one getattr and gives back the same
+do-nothing context every time, and the cmds calls are the real ones, not wrapped
+"""
+
+_OFF = contextlib.nullcontext()
+
+
+# A stage of whatever profiler cmds carries, or nothing when there isn't one
+def stage(cmds, name, **args):
+    profiler = getattr(cmds, "profiler", None)
+    if profiler is None:
+        return _OFF
+    return profiler.stage(name, **args)
+
+
+class Profiler(object):
+
+    def __init__(self):
+        # finished stages, in the order they finished (children before their parents)
+        self.spans = []
+        # points in time, like every frame change
+        self.marks = []
+        self._open = []
+        # calls made outside of every stage
+        self._unstaged = self._new_span("(no stage)", {}, 0)
+        self._origin = time.perf_counter()
+
+    @staticmethod
+    def _new_span(name, args, depth):
+        return {"name": name, "args": args, "depth": depth, "start": 0.0, "seconds": 0.0,
+                "calls": Counter(), "cmds_seconds": 0.0}
+
+    @contextlib.contextmanager
+    def stage(self, name, **args):
+        span = self._new_span(name, args, len(self._open))
+        self._open.append(span)
+        span["start"] = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span["seconds"] = time.perf_counter() - span["start"]
+            self._open.pop()
+            self.spans.append(span)
+
+    def mark(self, name, **args):
+        self.marks.append((name, time.perf_counter(), args))
+
+    def count(self, call, seconds):
+        span = self._open[-1] if self._open else self._unstaged
+        span["calls"][call] += 1
+        span["cmds_seconds"] += seconds
+
+    # cmds that counts towards this profiler
+    def wrap(self, cmds):
+        return CountingCmds(cmds, self)
+
+    # One row per stage name, in the order they started:
+    # how often, seconds (with the stages inside it), cmds calls and seconds in them (only the ones made directly in it),
+    # and per frame / per chain numbers for the stages that said how many frames / chains they did
+    def summary(self):
+        rows = {}
+        spans = sorted(self.spans, key=lambda span: span["start"])
+        if self._unstaged["calls"]:
+            spans.append(self._unstaged)
+        for span in spans:
+            row = rows.setdefault(span["name"], {"stage": span["name"], "depth": span["depth"], "count": 0,
+                                                 "seconds": 0.0, "calls": 0, "cmds_seconds": 0.0,
+                                                 "frames": 0, "chains": 0, "by_call": Counter()})
+            row["count"] += 1
+            row["seconds"] += span["seconds"]
+            row["calls"] += sum(span["calls"].values())
+            row["cmds_seconds"] += span["cmds_seconds"]
+            row["frames"] += span["args"].get("frames", 0)
+            row["chains"] += span["args"].get("chains", 0)
+            row["by_call"].update(span["calls"])
+
+        total = sum(span["seconds"] for span in self.spans if span["depth"] == 0) or 1.0
+        for row in rows.values():
+            row["percent"] = 100.0 * row["seconds"] / total
+            row["ms_per_frame"] = 1000.0 * row["seconds"] / row["frames"] if row["frames"] else None
+            row["calls_per_frame"] = row["calls"] / row["frames"] if row["frames"] else None
+            row["ms_per_chain"] = 1000.0 * row["seconds"] / row["chains"] if row["chains"] else None
+            row["calls_per_chain"] = row["calls"] / row["chains"] if row["chains"] else None
+            row["by_call"] = dict(row["by_call"].most_common())
+        return list(rows.values())
+
+    def table(self):
+        def number(value, width, digits):
+            return f"{value:>{width}.{digits}f}" if value is not None else " " * (width - 1) + "-"
+
+        lines = [f"{'stage':<22}{'count':>7}{'seconds':>10}{'%':>7}{'cmds calls':>12}{'in cmds s':>11}"
+                 f"{'ms/frame':>10}{'calls/frame':>13}{'ms/chain':>10}{'calls/chain':>13}  most calls"]
+        for row in self.summary():
+            top = ", ".join(f"{call} {count}" for call, count in list(row["by_call"].items())[:3])
+            lines.append(f"{'  ' * row['depth'] + row['stage']:<22}{row['count']:>7}{row['seconds']:>10.4f}"
+                         f"{row['percent']:>7.1f}{row['calls']:>12}{row['cmds_seconds']:>11.4f}"
+                         f"{number(row['ms_per_frame'], 10, 3)}{number(row['calls_per_frame'], 13, 1)}"
+                         f"{number(row['ms_per_chain'], 10, 3)}{number(row['calls_per_chain'], 13, 1)}  {top}")
+        return "\n".join(lines)
+
+    # Chrome's trace event format: one complete event per stage, one instant event per mark (times in microseconds)
+    def trace_events(self):
+        events = []
+        for span in self.spans:
+            args = dict(span["args"], cmds_calls=dict(span["calls"]), cmds_seconds=span["cmds_seconds"])
+            events.append({"name": span["name"], "cat": "stage", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": (span["start"] - self._origin) * 1e6, "dur": span["seconds"] * 1e6,
+                           "args": _plain(args)})
+        for name, at, args in self.marks:
+            events.append({"name": name, "cat": "mark", "ph": "i", "s": "t", "pid": 1, "tid": 1,
+                           "ts": (at - self._origin) * 1e6, "args": _plain(args)})
+        return sorted(events, key=lambda event: event["ts"])
+
+    def write_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "summary": _plain(self.summary())}, f)
+
+
+# Anything numpy made json can write
+def _plain(value):
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
+
+
+class CountingCmds(object):
+
+    def __init__(self, cmds, profiler):
+        self._cmds = cmds
+        self.profiler = profiler
+
+    # every call goes through here the first time, after that the wrapped call is an attribute of its own
+    # (anything that isn't a call, like __name__ which keys.py looks at, comes straight from cmds)
+    def __getattr__(self, name):
+        attribute = getattr(self._cmds, name)
+        if not callable(attribute):
+            return attribute
+        profiler = self.profiler
+
+        def call(*args, **kwargs):
+            if name == "currentTime" and kwargs.get("edit") and args:
+                profiler.mark("frame", frame=args[0])
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                profiler.count(name, time.perf_counter() - start)
+
+        setattr(self, name, call)
+        return call
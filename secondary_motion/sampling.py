@@ -0,0 +1,270 @@
+from collections import namedtuple
+
+import numpy as np
+
+from secondary_motion.curves import curve_local_matrices, frames_per_second
+from secondary_motion.scene import get_cmds
+from secondary_motion.solver import build_topology
+
+"""
+What code does:
+reads the world space position of a list of objects over a frame range in one go,
+instead of calling get_world_space_at_frame (currentTime + pointPosition) once per object per frame
+
+Functions:
+- sample_world_space(node_list, start_frame, end_frame, use_time_context=False, compose=True, evaluate_curves=True,
+	dtype=float, cmds=None)
+- sample_scene(node_list, start_frame, end_frame, matrix_node_list=(), use_time_context=False, compose=True,
+	evaluate_curves=True, dtype=float, cmds=None)
+	same thing, plus the world matrices of matrix_node_list read in the same pass
+- sample_substeps(node_list, start_frame, end_frame, substeps, first_frame_holds=True, use_time_context=False,
+	compose=True, evaluate_curves=True, dtype=float, cmds=None)
+	positions in between frames for the solver's substeps, (frames, substeps, nodes, 3)
+- sample_hierarchy(node_list, cmds=None)
+- compose_world_matrices(local_matrices, topology)
+- world_pivot_from_matrix(scale_pivot, world_matrix)
+
+Output:
+- a (frames, nodes, 3) array, frame 0 of the array is start_frame
+- the driver usually goes in as the first node so samples[:, 0] is the driver and samples[:, 1:] is the chain
+
+Two ways of reading:
+- default: change the time once per frame and query the nodes at that frame
+	(the scripts used to change the time once per node per frame)
+- use_time_context=True: ask with getAttr(..., time=frame) so the timeline never moves at all
+
+What gets read (compose=True, the default):
+- the local matrix (getAttr .matrix) of every node and everything above it, and the world matrices are
+	multiplied together here for the whole hierarchy at once, parents to children, instead of Maya
+	walking up the hierarchy again for every pointPosition
+- only nodes with something coming into them (anim curves, constraints, expressions...) can change
+	from frame to frame, those get read every frame, everything else once
+	(so usually only the parents and what's above them, not the objects)
+- evaluate_curves=True: the ones only moved by anim curves aren't read at all, their curves are evaluated here
+	for every frame at once (secondary_motion.curves), when that's all of them the timeline never moves
+- the scalePivot is read once and put through the world matrix, it is not animated on these rigs
+- the hierarchy (parent of every node, worked out from the full paths list_chains gets from
+	listRelatives(allDescendents=True)) is kept between calls, so windows and chunks of the same bake don't redo it
+- compose=False reads pointPosition / the worldMatrix of every node every frame instead,
+	for rigs where the local matrices don't add up to the world one (offsetParentMatrix, inheritsTransform off...)
+- compose=True checks that itself: what it worked out has to match Maya's worldMatrix on the first and last frame,
+	when it doesn't it reads everything the compose=False way
+"""
+
+
+# Getting the world position of the scalePivot through a 4x4 world matrix
+# scalePivot is in object space, so this is the same point pointPosition(obj + ".scalePivot", world=True) gives back
+# Maya matrices are row major with translation in the last row, so the point goes on the left
+def world_pivot_from_matrix(scale_pivot, world_matrix):
+    world_matrix = np.asarray(world_matrix, dtype=float).reshape(-1, 4, 4)
+    pivot = np.append(np.asarray(scale_pivot, dtype=float), 1.0)
+    return (pivot @ world_matrix)[:, :3]
+# remove "#" to test:
+# print(world_pivot_from_matrix([0, 1, 0], np.eye(4)))
+
+
+# Everything about the hierarchy above a list of nodes, kept between calls
+# paths: every node and everything above it, parents first
+# parent_index: the parent of every path as an index into paths, -1 under the world
+# rows: where every node of the list is in paths
+# topology: solver.build_topology(parent_index), its pointer jumping rounds are what compose_world_matrices uses
+SampleHierarchy = namedtuple("SampleHierarchy", ["paths", "parent_index", "rows", "topology"])
+
+# how many hierarchies to keep, the oldest ones go first
+HIERARCHY_CACHE_SIZE = 32
+_hierarchy_cache = {}
+
+# how many frames of local matrices are multiplied together at a time, so a long shot doesn't need them all at once
+FRAME_BLOCK = 256
+
+
+# The hierarchy above node_list, a full path says where a node is, so the same paths always give the same answer
+def sample_hierarchy(node_list, cmds=None):
+    cmds = get_cmds(cmds)
+    long_list = tuple(node if node.startswith("|") else cmds.ls(node, long=True)[0] for node in node_list)
+    hierarchy = _hierarchy_cache.pop(long_list, None)
+    if hierarchy is None:
+        path_set = set()
+        for path in long_list:
+            parts = path.split("|")
+            path_set.update("|".join(parts[:depth]) for depth in range(2, len(parts) + 1))
+        paths = sorted(path_set, key=lambda path: (path.count("|"), path))
+        index_of = {path: i for i, path in enumerate(paths)}
+        parent_index = np.array([index_of.get(path.rsplit("|", 1)[0], -1) for path in paths], dtype=np.intp)
+        rows = np.array([index_of[path] for path in long_list], dtype=np.intp)
+        hierarchy = SampleHierarchy(paths, parent_index, rows, build_topology(parent_index))
+        if len(_hierarchy_cache) >= HIERARCHY_CACHE_SIZE:
+            del _hierarchy_cache[next(iter(_hierarchy_cache))]
+    _hierarchy_cache[long_list] = hierarchy
+    return hierarchy
+
+
+# World matrices from local ones: world = local @ parent's world, (frames, nodes, 4, 4) in and out
+# same pointer jumping as solver.accumulate_down_tree with a product instead of a sum: every round each node
+# multiplies in what its pointer has so far, on the right since that is further up, so a chain of n is log2(n) rounds
+def compose_world_matrices(local_matrices, topology):
+    world = np.array(local_matrices, dtype=float)
+    for moving, source in topology.jump_rounds:
+        world[:, moving] = world[:, moving] @ world[:, source]
+    return world
+
+
+# The paths whose local matrix can change over time: anything with a connection coming in
+def _animated_rows(paths, cmds):
+    return [i for i, path in enumerate(paths) if cmds.listConnections(path, source=True, destination=False)]
+
+
+# Whether the world matrices worked out for the rows match Maya's worldMatrix on frame
+def _matches_world(paths, rows, world, frame, cmds):
+    maya = np.array([np.reshape(cmds.getAttr(paths[i] + ".worldMatrix[0]", time=frame), (4, 4)) for i in rows])
+    return np.allclose(world[rows], maya, rtol=1e-6, atol=1e-6)
+
+
+# Sampling through local matrices, see "What gets read" at the top
+# gives back None when the local matrices don't add up to Maya's world matrices on this rig
+def _sample_composed(node_list, matrix_node_list, frame_list, use_time_context, evaluate_curves, dtype, cmds):
+    hierarchy = sample_hierarchy(list(node_list) + list(matrix_node_list), cmds)
+    paths = hierarchy.paths
+    node_rows = hierarchy.rows[:len(node_list)]
+    matrix_rows = hierarchy.rows[len(node_list):]
+    animated = _animated_rows(paths, cmds)
+
+    # the ones that come straight from their curves don't need reading every frame
+    curve_local = {}
+    if evaluate_curves and animated:
+        fps = frames_per_second(cmds)
+        for i in animated:
+            curve_matrices = curve_local_matrices(paths[i], frame_list, fps, cmds)
+            if curve_matrices is not None:
+                curve_local[i] = curve_matrices
+    read_rows = [i for i in animated if i not in curve_local]
+
+    static_local = np.tile(np.eye(4), (len(paths), 1, 1))
+    for i in sorted(set(range(len(paths))) - set(animated)):
+        static_local[i] = np.reshape(cmds.getAttr(paths[i] + ".matrix"), (4, 4))
+    pivots = np.array([np.append(cmds.getAttr(paths[i] + ".scalePivot")[0], 1.0) for i in node_rows])
+
+    samples = np.empty((len(frame_list), len(node_list), 3), dtype)
+    matrices = np.empty((len(frame_list), len(matrix_node_list), 4, 4))
+    current_frame = None if use_time_context or not read_rows else cmds.currentTime(query=True)
+    check_rows = sorted(set(node_rows) | set(matrix_rows))
+    check_frames = {0, len(frame_list) - 1}
+
+    for b0 in range(0, len(frame_list), FRAME_BLOCK):
+        block = frame_list[b0:b0 + FRAME_BLOCK]
+        local = np.repeat(static_local[None], len(block), axis=0)
+        for i, curve_matrices in curve_local.items():
+            local[:, i] = curve_matrices[b0:b0 + len(block)]
+        if use_time_context:
+            for i in read_rows:
+                local[:, i] = np.reshape([cmds.getAttr(paths[i] + ".matrix", time=frame) for frame in block],
+                                         (-1, 4, 4))
+        elif read_rows:
+            for f, frame in enumerate(block):
+                cmds.currentTime(frame, edit=True)
+                for i in read_rows:
+                    local[f, i] = np.reshape(cmds.getAttr(paths[i] + ".matrix"), (4, 4))
+
+        world = compose_world_matrices(local, hierarchy.topology)
+        for f in sorted(check_frames & set(range(b0, b0 + len(block)))):
+            if not _matches_world(paths, check_rows, world[f - b0], frame_list[f], cmds):
+                if current_frame is not None:
+                    cmds.currentTime(current_frame, edit=True)
+                return None
+        samples[b0:b0 + len(block)] = np.einsum("ni,fnij->fnj", pivots, world[:, node_rows])[..., :3]
+        matrices[b0:b0 + len(block)] = world[:, matrix_rows]
+
+    # put the timeline back where the artist had it
+    if current_frame is not None:
+        cmds.currentTime(current_frame, edit=True)
+    return samples, matrices
+
+
+# Sampling every node for every frame with one time change per frame
+# (frame_list can have in between frames too, currentTime and getAttr(time=) both take those)
+def _sample_with_time_change(node_list, matrix_node_list, frame_list, dtype, cmds):
+    samples = np.empty((len(frame_list), len(node_list), 3), dtype)
+    matrices = np.empty((len(frame_list), len(matrix_node_list), 4, 4))
+    current_frame = cmds.currentTime(query=True)
+
+    for f, frame in enumerate(frame_list):
+        cmds.currentTime(frame, edit=True)
+        for n, node in enumerate(node_list):
+            samples[f, n] = cmds.pointPosition(node + ".scalePivot", world=True)
+        for n, node in enumerate(matrix_node_list):
+            matrices[f, n] = np.reshape(cmds.xform(node, query=True, worldSpace=True, matrix=True), (4, 4))
+
+    # put the timeline back where the artist had it
+    cmds.currentTime(current_frame, edit=True)
+    return samples, matrices
+
+
+# Sampling every node for every frame without moving the timeline
+# the scale pivot is read once since it is not animated on these rigs
+def _sample_with_time_context(node_list, matrix_node_list, frame_list, dtype, cmds):
+    samples = np.empty((len(frame_list), len(node_list), 3), dtype)
+    matrices = np.empty((len(frame_list), len(matrix_node_list), 4, 4))
+
+    for n, node in enumerate(node_list):
+        scale_pivot = cmds.getAttr(node + ".scalePivot")[0]
+        world_matrix = [cmds.getAttr(node + ".worldMatrix[0]", time=frame) for frame in frame_list]
+        samples[:, n] = world_pivot_from_matrix(scale_pivot, world_matrix)
+    for n, node in enumerate(matrix_node_list):
+        world_matrix = [cmds.getAttr(node + ".worldMatrix[0]", time=frame) for frame in frame_list]
+        matrices[:, n] = np.reshape(world_matrix, (-1, 4, 4))
+
+    return samples, matrices
+
+
+# Getting world space values of every node in node_list, and the world matrix of every node
+# in matrix_node_list, for every frame from start_frame to end_frame in the same pass
+# returns (frames, nodes, 3) and (frames, matrix nodes, 4, 4)
+# dtype: what the positions are kept in (np.float32 for the solver's precision="float32"), matrices are always float64
+def sample_scene(node_list, start_frame, end_frame, matrix_node_list=(), use_time_context=False, compose=True,
+                 evaluate_curves=True, dtype=float, cmds=None):
+    cmds = get_cmds(cmds)
+    if not node_list:
+        cmds.error("Nothing to sample.")
+
+    frame_list = list(range(start_frame, end_frame + 1))
+    return _sample(node_list, list(matrix_node_list), frame_list, use_time_context, compose, evaluate_curves, dtype,
+                   cmds)
+
+
+# Whichever way of reading was asked for
+def _sample(node_list, matrix_node_list, frame_list, use_time_context, compose, evaluate_curves, dtype, cmds):
+    if compose:
+        result = _sample_composed(node_list, matrix_node_list, frame_list, use_time_context, evaluate_curves, dtype,
+                                  cmds)
+        if result is not None:
+            return result
+    if use_time_context:
+        return _sample_with_time_context(node_list, matrix_node_list, frame_list, dtype, cmds)
+    return _sample_with_time_change(node_list, matrix_node_list, frame_list, dtype, cmds)
+
+
+# Getting world space values of every node in node_list for every frame from start_frame to end_frame
+def sample_world_space(node_list, start_frame, end_frame, use_time_context=False, compose=True, evaluate_curves=True,
+                       dtype=float, cmds=None):
+    return sample_scene(node_list, start_frame, end_frame, use_time_context=use_time_context, compose=compose,
+                        evaluate_curves=evaluate_curves, dtype=dtype, cmds=cmds)[0]
+# remove "#" to test:
+# print(sample_world_space(["PARENT", "SELECT_THIS"], 1, 10).shape)
+
+
+# Getting world space values in between frames, for when the driver shouldn't just be interpolated linearly
+# substep s of frame f is at f - 1 + (s + 1) / substeps, the first frame holds still on start_frame
+# (same as solver.substep_driver without driver_before)
+def sample_substeps(node_list, start_frame, end_frame, substeps, first_frame_holds=True, use_time_context=False,
+                    compose=True, evaluate_curves=True, dtype=float, cmds=None):
+    cmds = get_cmds(cmds)
+    time_list = []
+    for frame in range(start_frame, end_frame + 1):
+        for s in range(substeps):
+            if frame == start_frame and first_frame_holds:
+                time_list.append(float(frame))
+            else:
+                time_list.append(frame - 1 + (s + 1.0) / substeps)
+
+    samples = _sample(node_list, [], time_list, use_time_context, compose, evaluate_curves, dtype, cmds)[0]
+    return samples.reshape((-1, substeps, len(node_list), 3))
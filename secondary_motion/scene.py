@@ -0,0 +1,101 @@
+"""
+What code does:
+everything in secondary_motion that needs to ask the scene something goes through a "cmds" object,
+so the same code runs inside Maya (maya.cmds) and outside of it (FakeCmds from secondary_motion.fake_cmds)
+
+Functions:
+- get_cmds(cmds=None)
+- get_selected(cmds=None)
+- get_parent(obj, cmds=None)
+- list_chain(obj, include_descendants=True, cmds=None)
+- list_chains(obj_list, include_descendants=True, cmds=None)
+
+Adapter:
+- anything with the same calls the scripts use on maya.cmds works:
+	ls, listRelatives, nodeType, currentTime, pointPosition, xform, move, spaceLocator, setKeyframe, delete,
+	getAttr, listConnections, keyframe, keyTangent, setInfinity, currentUnit, setAttr, scriptJob, warning, error
+"""
+
+
+# Getting the cmds to talk to: the one passed in, otherwise maya.cmds
+# maya is only imported here so the rest of the package can be imported without a Maya session
+def get_cmds(cmds=None):
+    if cmds is not None:
+        return cmds
+    import maya.cmds
+    return maya.cmds
+
+
+# ERROR HANDLING: check if there is object selected
+def get_selected(cmds=None):
+    cmds = get_cmds(cmds)
+    selected = cmds.ls(selection=True)
+    if not selected:
+        cmds.error("No object is selected")
+    return selected
+
+
+# ERROR HANDLING: check if the object has a parent, the parent is what drives the motion
+def get_parent(obj, cmds=None):
+    cmds = get_cmds(cmds)
+    parent_obj = cmds.listRelatives(obj, parent=True, fullPath=True)
+    if not parent_obj:
+        cmds.error(f"{obj} has no parent.")
+    return parent_obj[0]
+
+
+# Putting the object and its transform descendants in a list, parents always before their children
+# parent_index is the parent of every object as an index into obj_list, -1 is the parent object (the driver)
+def list_chain(obj, include_descendants=True, cmds=None):
+    driver_list, obj_list, parent_index = list_chains([obj], include_descendants, cmds)
+    return driver_list[0], obj_list, parent_index
+# remove "#" to test:
+# print(list_chain("SELECT_THIS"))
+
+
+# Same thing for every object in obj_list (and their descendants) at once, so they can all be solved together
+# returns the drivers, every object (parents before children) and parent_index
+# where -1 is driver_list[0], -2 is driver_list[1]...
+# - objects that share a parent share the driver too
+# - an object already in the list through another one's descendants is only in there once,
+#	and an object whose parent is in the list hangs off that object instead of a driver
+def list_chains(obj_list, include_descendants=True, cmds=None):
+    cmds = get_cmds(cmds)
+    roots = []
+    for obj in obj_list:
+        obj = cmds.ls(obj, long=True)[0]
+        if obj not in roots:
+            roots.append(obj)
+
+    all_obj_list = []
+    seen = set()
+    for obj in roots:
+        # every selected object needs a parent to drive it, even when it turns out to be under another one
+        get_parent(obj, cmds)
+        chain = [obj]
+        if include_descendants:
+            descendants = cmds.listRelatives(obj, allDescendents=True, fullPath=True) or []
+            # Filter for only the transform descendents
+            chain.extend(node for node in descendants if cmds.nodeType(node) == "transform")
+        for node in chain:
+            if node not in seen:
+                seen.add(node)
+                all_obj_list.append(node)
+    # full paths get longer the deeper they are, so sorting by depth puts parents first
+    all_obj_list.sort(key=lambda node: node.count("|"))
+
+    index_of = {node: i for i, node in enumerate(all_obj_list)}
+    driver_list = []
+    parent_index = []
+    for node in all_obj_list:
+        node_parent = node.rsplit("|", 1)[0]
+        if node_parent in index_of:
+            parent_index.append(index_of[node_parent])
+            continue
+        if node_parent not in driver_list:
+            driver_list.append(node_parent)
+        parent_index.append(-driver_list.index(node_parent) - 1)
+
+    return driver_list, all_obj_list, parent_index
+# remove "#" to test:
+# print(list_chains(["SELECT_THIS", "SELECT_THIS_TOO"]))
@@ -0,0 +1,532 @@
+from collections import namedtuple
+
+import numpy as np
+
+from secondary_motion import kernels
+
+"""
+What code does:
+verlet + spring + fixed distance for a whole chain (or hierarchy) of objects at once,
+with every position stored in one (n, 3) array instead of python lists of 3-vectors
+
+Functions:
+- chain_parents(n)
+- build_topology(parent_index)
+- accumulate_down_tree(values, topology)
+- rest_offsets(rest_positions, driver_rest, topology)
+- apply_length_constraint(positions, anchors, offsets, lengths, topology)
+- relax_lengths(positions, anchors, lengths, topology, iterations)
+- step(current, previous, anchors, offsets, lengths, topology, ...)
+- step_cascade(current, previous, anchors, offsets, lengths, topology, ...)
+- substep_driver(driver, substeps, driver_before=None)
+- solve(driver, rest_positions, parent_index=None, ..., backend="auto")
+- made_up_shot(object_count=50, frame_count=100, parent_index=None)
+- precision_error(object_count=50, frame_count=100, parent_index=None, **params)
+
+How the hierarchy is stored:
+- parent_index[i] is the index of the parent of object i in the same array
+- a negative number means the parent is a driver, -1 is the first driver, -2 the second...
+	so for a single chain under one parent it is [-1, 0, 1, 2, ...]
+- parents always come before their children (same order as obj_list in the scripts)
+
+Per frame (same as the LOOP N MOVE part of HIERARCHY-AllAtOnce):
+- displacement = (object - its parent) - default displacement
+- acc = (-k * displacement + force) / mass
+- verlet: next = current + damping * (current - previous) + acc * dt * dt
+- constraint: every segment is scaled back to its default length, starting from the driver
+
+iterations=N swaps that constraint for the Jakobsen / position based dynamics one:
+- every segment pulls both of its ends back towards its default length (half each, the driver never moves)
+- segments are done in two halves, odd depths then even depths, so no two segments in a half share a child
+	(red-black Gauss-Seidel, siblings pulling on the same parent are averaged)
+- N passes over both halves, more passes get closer to the default lengths, a few is usually enough
+- the motion also pulls back on the parents, so it looks less like the tip is whipped by the base
+- iterations=0 (default) is the one-pass scaling above, which gets every length exact
+
+cascade=True is HIERARCHY-RepeatBaseChunk instead:
+- every object only looks at its own parent, and the parent has already moved this frame
+	(RepeatBaseChunk baked the parent first and then used it as the driver of the child)
+- objects are done one depth at a time, every object at the same depth in one go
+
+substeps=S splits every frame into S smaller steps:
+- the driver is interpolated in between frames (linearly, or pass driver_substeps sampled from the curves)
+- each substep uses dt / S, and damping ** (1 / S) so the motion loses the same amount per frame
+- only the last substep of every frame ends up in the result
+- stiffer k stays stable with more substeps, k that explodes at 1 substep can work at 4 or 8
+- the default solver (constraint, no iterations, not cascade) works on the segments (object minus its parent)
+	in between substeps, so a substep is a few array operations with no going down the tree,
+	the segments are only added back up into positions once a frame (_solve_segments)
+- that is still one python level pass per substep, every substep needs the constrained one before it,
+	so they can't be done in one go and 8 substeps are NOT far less than 8x on numpy:
+	on a 200 frame made_up_shot 8 substeps cost 6.1x (10 objects), 4.5x (100), 3.1x (1000) of 1 substep
+	(7.4x / 6.1x / 5.7x before the segments, so 1.5 to 1.7x quicker at 8 substeps),
+	iterations and cascade still run a whole step per substep (about 7x to 10x)
+- numba is the one that gets there, 1.9x (10 objects) to 2.9x (1000) for 8 substeps
+
+backend="auto" runs every frame in one compiled loop when numba is installed (secondary_motion.kernels),
+"numpy" always uses the arrays here, "numba" insists on the compiled loop
+(same maths either way, they only differ by float rounding, kernels.parity() checks that)
+
+Precision:
+- precision="float32" keeps the state, the drivers and every buffer the loop uses in float32
+	(pipeline samples, caches and buffers in float32 too), half the memory and a bit faster on big batches
+- the default offsets and lengths are still worked out in float64 and then rounded, and the parents' matrices
+	used for keying stay float64
+- one frame from the same state lands within 2e-6 of the chain's length of where float64 does, usually under 1e-6
+	(a few float32 roundings: 1e-5 on a 50 joint chain 100 units long, up to 4e-4 on 200 joints and 400 units)
+- segment lengths stay within 1e-5 of float64's (relative), 2e-4 with iterations on long chains
+	(iterations don't get the lengths exact in float64 either)
+- over a whole shot they only stay that close while the motion is tame: 50 joints over 1000 frames are within 1e-3
+	without substeps, but long whippy chains (hundreds of joints, substeps, cascade) are chaotic,
+	float64 itself ends up tens of units away after a few hundred frames when its start is nudged by 1e-5,
+	and float32's rounding is that kind of nudge every frame
+	so it's a different take on the same motion, not a worse one, but it won't match a float64 bake key for key
+- precision_error() measures all three on a made up shot and says if the first two are inside those bounds
+	(PRECISION_BOUNDS), run it with the shot's params before switching
+	(tests/test_solver.py holds it to them on long chains, substeps, iterations, cascade and a tree)
+"""
+
+DEFAULT_PARAMS = {
+    "dt": 1,
+    "mass": 1,
+    "force": (0, 0, 0),
+    "damping": 0.8,
+    "k": 0.1, # Higher the value, stiffer this becomes
+    "constraint": True,
+    "cascade": False,
+    "substeps": 1,
+    "iterations": 0,
+    "precision": "float64",
+}
+
+# what precision= can be, see "Precision" at the top
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+# how far precision_error() lets float32 get from float64, see "Precision" at the top
+# frame is relative to the chain's length, length to the segments' lengths (with iterations it gets more room)
+PRECISION_BOUNDS = {"frame": 2e-6, "length": 1e-5, "length_iterations": 2e-4}
+
+# parent_index    - parent of every object, negative numbers are drivers
+# root_index      - indexes of objects whose parent is a driver
+# root_driver     - which driver each of those roots hangs off
+# child_index     - indexes of objects whose parent is another object
+# parent_of_child - the parent of each of those
+# node_driver     - which driver every object eventually hangs off
+# levels          - indexes of the objects at every depth, roots first
+# jump_rounds     - precomputed (objects, source) pairs for accumulate_down_tree
+# is_chain        - one plain chain under one driver ([-1, 0, 1, 2, ...]), which has faster paths
+# relax_colors    - the two halves of segments for relax_lengths, see _relax_colors
+ChainTopology = namedtuple(
+    "ChainTopology",
+    ["parent_index", "root_index", "root_driver", "child_index", "parent_of_child", "node_driver", "levels",
+     "jump_rounds", "is_chain", "relax_colors"],
+)
+
+
+# Parent index for a plain chain hanging off one driver: [-1, 0, 1, 2, ...]
+def chain_parents(n):
+    return np.arange(n) - 1
+
+
+# Everything about the hierarchy that doesn't change from frame to frame
+# The jump rounds are pointer jumping: every round each object adds what its current pointer has
+# and then points to its pointer's pointer, so summing down a chain of n takes log2(n) array operations
+def build_topology(parent_index):
+    parent_index = np.asarray(parent_index, dtype=np.intp)
+    n = len(parent_index)
+    if np.any(parent_index >= np.arange(n)):
+        raise ValueError("parent_index has to list parents before their children.")
+
+    is_root = parent_index < 0
+    root_index = np.flatnonzero(is_root)
+    child_index = np.flatnonzero(~is_root)
+
+    jump_rounds = []
+    pointer = np.where(is_root, -1, parent_index)
+    while np.any(pointer >= 0):
+        moving = np.flatnonzero(pointer >= 0)
+        source = pointer[moving]
+        jump_rounds.append((moving, source))
+        pointer[moving] = pointer[source]
+
+    # parents come first, so one pass down the list is enough
+    node_driver = np.empty(n, dtype=np.intp)
+    depth = np.zeros(n, dtype=np.intp)
+    for i, parent in enumerate(parent_index):
+        node_driver[i] = -parent - 1 if parent < 0 else node_driver[parent]
+        depth[i] = 0 if parent < 0 else depth[parent] + 1
+    levels = [np.flatnonzero(depth == d) for d in range(depth.max() + 1)] if n else []
+    is_chain = bool(n) and parent_index[0] < 0 and np.array_equal(parent_index[1:], np.arange(n - 1))
+    relax_colors = [_relax_color(np.flatnonzero(depth % 2 == parity), parent_index, is_chain, parity)
+                    for parity in (0, 1)]
+
+    return ChainTopology(
+        parent_index=parent_index,
+        root_index=root_index,
+        root_driver=-parent_index[root_index] - 1,
+        child_index=child_index,
+        parent_of_child=parent_index[child_index],
+        node_driver=node_driver,
+        levels=levels,
+        jump_rounds=jump_rounds,
+        is_chain=is_chain,
+        relax_colors=[color for color in relax_colors if len(color[0])],
+    )
+
+
+# One half of the segments for relax_lengths, indexes are into relax_lengths' points (drivers first):
+# (objects, children, parents, child share, parent share, whether an object is the parent more than once)
+# a segment to a driver moves only its child, otherwise both ends move half way
+# siblings pull on the same parent, so their share is split between them
+# a plain chain gets slices instead of index arrays, which numpy does a lot faster
+def _relax_color(node, parent_index, is_chain, parity):
+    drivers = -parent_index.min() if len(parent_index) else 1
+    parent = parent_index[node]
+    to_object = parent >= 0
+    child_share = np.where(to_object, 0.5, 1.0)
+
+    _, inverse, counts = np.unique(parent, return_inverse=True, return_counts=True)
+    parent_share = np.where(to_object, 0.5 / counts[inverse], 0.0)
+    shared = bool(np.any(np.unique(parent[to_object], return_counts=True)[1] > 1))
+
+    if is_chain:
+        return node, slice(1 + parity, None, 2), slice(parity, len(parent_index), 2), child_share, parent_share, False
+    return node, node + drivers, parent + drivers, child_share, parent_share, shared
+
+
+# Summing values from each root down to every object: total[i] = values[i] + total[parent of i]
+def accumulate_down_tree(values, topology):
+    if topology.is_chain:
+        return np.cumsum(values, axis=0)
+    # a copy in values' own precision (float32 stays float32), whole numbers become floats
+    total = np.array(values, dtype=np.result_type(values, 0.0))
+    for moving, source in topology.jump_rounds:
+        total[moving] += total[source]
+    return total
+
+
+# Position of every object's parent, drivers included, for one frame
+def parent_positions(positions, anchors, topology):
+    if topology.is_chain:
+        return np.concatenate((anchors[topology.root_driver], positions[:-1]))
+    parents = np.empty_like(positions)
+    parents[topology.root_index] = anchors[topology.root_driver]
+    parents[topology.child_index] = positions[topology.parent_of_child]
+    return parents
+
+
+# Default displacement and distance of every segment
+# distance between a driver and its first object is stored on that object, so on and so forth
+def rest_offsets(rest_positions, driver_rest, topology):
+    rest_positions = np.asarray(rest_positions, dtype=float)
+    driver_rest = np.asarray(driver_rest, dtype=float).reshape(-1, 3)
+    offsets = rest_positions - parent_positions(rest_positions, driver_rest, topology)
+    return offsets, np.linalg.norm(offsets, axis=1)
+
+
+# Constraint: have a set distance between every object and its parent
+# each segment keeps the direction it got from verlet but is scaled back to its default length,
+# then the segments are added up from the driver so the whole chain is fixed at once
+def apply_length_constraint(positions, anchors, offsets, lengths, topology):
+    segments = _to_lengths(positions - parent_positions(positions, anchors, topology), offsets, lengths)
+
+    # the roots start from their driver, so adding up the segments gives world positions
+    segments[topology.root_index] += anchors[topology.root_driver]
+    return accumulate_down_tree(segments, topology)
+
+
+# Every segment scaled to its default length, keeping its direction (segments gets changed, or swapped for a copy)
+def _to_lengths(segments, offsets, lengths):
+    distance_new = np.sqrt(np.einsum("ij,ij->i", segments, segments))[:, None]
+
+    # a segment that collapsed to zero has no direction, so it keeps its default one
+    collapsed = distance_new == 0
+    if collapsed.any():
+        segments = np.where(collapsed, offsets, segments)
+        distance_new = np.where(collapsed, lengths[:, None], distance_new)
+
+    distance_ratio = np.divide(lengths[:, None], distance_new, out=np.ones_like(distance_new), where=distance_new > 0)
+    segments *= distance_ratio
+    return segments
+
+
+# Constraint, Jakobsen style: pull both ends of every segment back towards its default length, iterations times
+# the drivers and positions share one (3, drivers + n) array, drivers first in reverse order,
+# so object i is at drivers + i and its parent at drivers + parent_index[i] even when that is a driver
+# (x, y and z in rows keeps every slice of it contiguous enough to be quick)
+def relax_lengths(positions, anchors, lengths, topology, iterations):
+    drivers = -topology.parent_index.min()
+    points = np.concatenate((anchors[drivers - 1::-1], positions)).T.copy()
+    color_lengths = [lengths[color[0]] for color in topology.relax_colors]
+
+    for _ in range(iterations):
+        for (_, child, parent, child_share, parent_share, shared), length in zip(topology.relax_colors, color_lengths):
+            segments = points[:, child] - points[:, parent]
+            distance_new = np.sqrt(np.einsum("ij,ij->j", segments, segments))
+            # how far off every segment is as a fraction of its length (a collapsed one has nothing to scale)
+            np.maximum(distance_new, 1e-12, out=distance_new)
+            segments *= 1 - length / distance_new
+
+            points[:, child] -= segments * child_share
+            if shared:
+                np.add.at(points.T, parent, (segments * parent_share).T)
+            else:
+                points[:, parent] += segments * parent_share
+    return points[:, drivers:].T.copy()
+
+
+# One frame for every object in the hierarchy
+# out: where to put the result (anything but current and previous), a new array when it's None
+def step(current, previous, anchors, offsets, lengths, topology,
+         dt=1, mass=1, force=(0, 0, 0), damping=0.8, k=0.1, constraint=True, iterations=0, out=None):
+    # diplacement of every object from its parent, minus the default displacement
+    # displacement = current - parent - offsets
+    # acc = F / m, Fs = -kx
+    # acc = (-k * displacement + force) / mass
+    # Verlet Integration
+    # next = current + damping * (current - previous) + acc * dt * dt
+    # written out so it is as few array operations as possible (this runs once per substep):
+    spring = k * dt * dt / mass
+    next = np.multiply(current, 1 + damping - spring, out=out)
+    next -= damping * previous
+    next += spring * (parent_positions(current, anchors, topology) + offsets)
+    next += np.multiply(force, dt * dt / mass)
+
+    if constraint and iterations:
+        next = relax_lengths(next, anchors, lengths, topology, iterations)
+    elif constraint:
+        next = apply_length_constraint(next, anchors, offsets, lengths, topology)
+    return next
+
+
+# One frame, HIERARCHY-RepeatBaseChunk style: parents move first and their children follow where they went
+# the parent has already moved when its children get constrained, so iterations don't do anything here
+def step_cascade(current, previous, anchors, offsets, lengths, topology,
+                 dt=1, mass=1, force=(0, 0, 0), damping=0.8, k=0.1, constraint=True, iterations=0, out=None):
+    next = np.empty_like(current) if out is None else out
+
+    for depth, level in enumerate(topology.levels):
+        # where the parents of this level are this frame: the driver for the roots,
+        # otherwise where the level above just moved to
+        if depth == 0:
+            pos_parent = anchors[-topology.parent_index[level] - 1]
+        else:
+            pos_parent = next[topology.parent_index[level]]
+
+        displacement = current[level] - pos_parent - offsets[level]
+        acc = (-k * displacement + force) / mass
+        pos_next = current[level] + damping * (current[level] - previous[level]) + acc * dt * dt
+
+        if constraint:
+            segment = pos_next - pos_parent
+            distance_new = np.linalg.norm(segment, axis=1, keepdims=True)
+            distance_ratio = np.divide(lengths[level, None], distance_new, out=np.ones_like(distance_new), where=distance_new > 0)
+            pos_next = segment * distance_ratio + pos_parent
+
+        next[level] = pos_next
+    return next
+
+
+# Driver position for every substep: (frames, substeps, drivers, 3)
+# substep s of frame f is (s + 1) / substeps of the way from frame f - 1 to frame f,
+# the first frame goes from driver_before (or holds still when there is none)
+def substep_driver(driver, substeps, driver_before=None):
+    driver = np.asarray(driver, dtype=float)
+    before = driver[:1] if driver_before is None else np.asarray(driver_before, dtype=float).reshape((1,) + driver.shape[1:])
+    from_frame = np.concatenate([before, driver[:-1]])
+    weights = (np.arange(substeps) + 1.0) / substeps
+    return from_frame[:, None] + (driver - from_frame)[:, None] * weights[None, :, None, None]
+
+
+# World positions from segments (every object minus its parent) hanging off anchor
+def _from_segments(segments, anchors, topology):
+    return accumulate_down_tree(segments, topology) + anchors[topology.node_driver]
+
+
+# solve's numpy loop for the default solver (constraint, no iterations, not cascade), one segment at a time:
+# with g the segments now (object minus its parent, the driver for a root) and h the ones a substep ago,
+# step and apply_length_constraint come down to
+#   segment = (1 + damping - spring) * g - damping * h + spring * (parent's g) + (pull - parent's pull)
+#   scaled back to its default length
+# (pull = spring * offsets + force * dt * dt / mass, a root's "parent's" g and pull are 0)
+# same maths as step, but nothing in a substep has to go down the tree: the segments are only added up into
+# positions once a frame, a driver moving in between substeps only changes the roots' g and h
+# every frame starts again from the positions, so picking up from a checkpoint gives the exact same numbers
+# anchors: (frames, substeps, drivers, 3), current / previous: where to start, result: (frames, n, 3) to fill
+def _solve_segments(anchors, current, previous, offsets, lengths, topology, result, checkpoints, checkpoint_every,
+                    dt=1, mass=1, force=(0, 0, 0), damping=0.8, k=0.1, **_):
+    spring = k * dt * dt / mass
+    keep = 1 + damping - spring
+    pull = spring * offsets + np.multiply(force, dt * dt / mass)
+    pull_segments = pull - parent_positions(pull, np.zeros_like(anchors[0, 0]), topology)
+    roots, children, parent_of_child = topology.root_index, topology.child_index, topology.parent_of_child
+    # how far the roots' drivers move between substeps, for the whole shot in one go
+    moves = anchors[:, :-1, topology.root_driver] - anchors[:, 1:, topology.root_driver]
+
+    for f in range(len(anchors)):
+        if checkpoint_every and checkpoints is not None and f % checkpoint_every == 0:
+            checkpoints[f] = (current.copy(), previous.copy())
+
+        g = current - parent_positions(current, anchors[f, 0], topology)
+        h = previous - parent_positions(previous, anchors[f, 0], topology)
+        for s in range(anchors.shape[1]):
+            # the roots hang off a driver that moved since the last substep
+            if s:
+                g[roots] += moves[f, s - 1]
+                h[roots] += moves[f, s - 1]
+
+            segments = keep * g
+            segments -= damping * h
+            if topology.is_chain:
+                segments[1:] += spring * g[:-1]
+            else:
+                segments[children] += spring * g[parent_of_child]
+            segments += pull_segments
+            h, g = g, _to_lengths(segments, offsets, lengths)
+
+        current = result[f] = _from_segments(g, anchors[f, -1], topology)
+        previous = _from_segments(h, anchors[f, -1], topology)
+
+    if checkpoint_every and checkpoints is not None and len(anchors) and len(anchors) % checkpoint_every == 0:
+        checkpoints[len(anchors)] = (current.copy(), previous.copy())
+    return result
+
+
+# Solving every frame
+# driver: (frames, 3) for one driver or (frames, drivers, 3)
+# rest_positions: (n, 3) positions of the objects on the first frame
+# returns (frames, n, 3), frame f of the output is the position after stepping with the driver at frame f
+#
+# Picking up from somewhere in the middle (verlet only needs the current and previous positions):
+# - state: (current, previous) to start from instead of the objects standing still at rest_positions
+# - driver_rest: where the drivers were on the first frame, when driver doesn't start on the first frame
+# - driver_before: where the drivers were the frame before driver[0], for the substeps of that first frame
+# - checkpoints: a dict that gets {frame index: (current, previous)} every checkpoint_every frames,
+#	the state right before that frame is stepped, so solve(driver[f:], ..., state=checkpoints[f]) carries on from there
+#	(when the frame count is a multiple of checkpoint_every, the state after the last frame is in there too,
+#	so solving a shot checkpoint_every frames at a time can hand the state from one piece to the next)
+#
+# driver_substeps: (frames, substeps, drivers, 3) to use instead of interpolating the driver linearly
+# backend: "auto", "numpy" or "numba", precision: "float64" or "float32", see the top of this file
+def solve(driver, rest_positions, parent_index=None, state=None, driver_rest=None, driver_before=None,
+          checkpoints=None, checkpoint_every=0, driver_substeps=None, backend="auto", **params):
+    params = dict(DEFAULT_PARAMS, **params)
+    precision = params.pop("precision")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}")
+    dtype = PRECISIONS[precision]
+
+    driver = np.asarray(driver, dtype=float)
+    if driver.ndim == 2:
+        driver = driver[:, None, :]
+    rest_positions = np.asarray(rest_positions, dtype=float)
+    if parent_index is None:
+        parent_index = chain_parents(len(rest_positions))
+
+    topology = build_topology(parent_index)
+    offsets, lengths = rest_offsets(rest_positions, driver[0] if driver_rest is None else driver_rest, topology)
+    offsets, lengths = offsets.astype(dtype), lengths.astype(dtype)
+    cascade = params.pop("cascade")
+    step_function = step_cascade if cascade else step
+
+    # every substep is a smaller step with less damping, same per frame
+    substeps = int(params.pop("substeps"))
+    params["dt"] = params["dt"] / substeps
+    params["damping"] = params["damping"] ** (1.0 / substeps)
+    params["force"] = np.asarray(params["force"], dtype=dtype)
+    if driver_substeps is None:
+        anchors = substep_driver(driver, substeps, driver_before) if substeps > 1 else driver[:, None]
+    else:
+        anchors = np.asarray(driver_substeps, dtype=float).reshape((len(driver), substeps) + driver.shape[1:])
+    anchors = np.ascontiguousarray(anchors, dtype=dtype)
+
+    # the objects start still (previous frame is the same as the current one) unless there is a state to pick up
+    current = np.array(rest_positions if state is None else state[0], dtype=dtype)
+    previous = np.array(rest_positions if state is None else state[1], dtype=dtype)
+
+    if kernels.use_compiled(backend):
+        return kernels.solve_frames(anchors, current, previous, topology.parent_index, offsets, lengths,
+                                    cascade=cascade, checkpoints=checkpoints, checkpoint_every=checkpoint_every,
+                                    **params)
+
+    result = np.empty((len(driver),) + rest_positions.shape, dtype=dtype)
+    if not cascade and params["constraint"] and not params["iterations"]:
+        return _solve_segments(anchors, current, previous, offsets, lengths, topology, result, checkpoints,
+                               checkpoint_every, **params)
+
+    # three buffers taking turns: next goes into the one that isn't current or previous anymore
+    spare = np.empty_like(current)
+    for f in range(len(driver)):
+        if checkpoint_every and checkpoints is not None and f % checkpoint_every == 0:
+            checkpoints[f] = (current.copy(), previous.copy())
+
+        for substep_anchors in anchors[f]:
+            next = step_function(current, previous, substep_anchors, offsets, lengths, topology, out=spare,
+                                 **params)
+
+            # update positions so current becomes previous and next becomes current
+            # (the constraints give back a new array, then spare is simply the old previous)
+            spare = previous
+            previous = current
+            current = next
+        result[f] = current
+
+    if checkpoint_every and checkpoints is not None and len(driver) and len(driver) % checkpoint_every == 0:
+        checkpoints[len(driver)] = (current.copy(), previous.copy())
+    return result
+# remove "#" to test:
+# print(solve(np.zeros((10, 3)), [[0, 2, 0], [0, 4, 0]], substeps=4)[-1])
+
+
+# A made up shot for checking the solver: drivers swinging around on x and bobbing on y,
+# a plain chain 2 units a segment unless parent_index says otherwise
+# gives back driver (frames, drivers, 3), rest_positions (objects, 3) and parent_index
+def made_up_shot(object_count=50, frame_count=100, parent_index=None):
+    if parent_index is not None:
+        object_count = len(parent_index)
+    driver_count = -int(np.min(parent_index)) if parent_index is not None else 1
+
+    # every driver swings a bit differently, and sits further along x
+    time = np.arange(frame_count)[:, None] * (1 + 0.1 * np.arange(driver_count))
+    driver = np.stack([3 * np.sin(time / 7.0) + 5 * np.arange(driver_count), np.cos(time / 5.0),
+                       np.zeros(time.shape)], axis=2)
+    rest_positions = np.stack([np.zeros(object_count), 2.0 * (np.arange(object_count) + 1),
+                               np.zeros(object_count)], axis=1)
+    return driver, rest_positions, parent_index
+
+
+# How far precision="float32" ends up from float64 on made_up_shot, see "Precision" at the top
+# - shot: largest difference over the whole shot
+# - frame: largest difference after one frame, both starting every frame from float64's state
+# - length: largest difference in how far the segments are from their default lengths, relative to those lengths
+# - ok: whether frame and length are inside PRECISION_BOUNDS (shot isn't checked, chaotic chains never match)
+def precision_error(object_count=50, frame_count=100, parent_index=None, **params):
+    driver, rest_positions, parent_index = made_up_shot(object_count, frame_count, parent_index)
+    topology = build_topology(parent_index if parent_index is not None else chain_parents(len(rest_positions)))
+    states = {}
+    double = solve(driver, rest_positions, topology.parent_index, checkpoints=states, checkpoint_every=1,
+                   **dict(params, precision="float64"))
+    single = solve(driver, rest_positions, topology.parent_index, **dict(params, precision="float32"))
+
+    frame_error = 0.0
+    for f in range(frame_count):
+        one_frame = solve(driver[f:f + 1], rest_positions, topology.parent_index, state=states[f],
+                          driver_rest=driver[0], driver_before=driver[f - 1] if f else None,
+                          **dict(params, precision="float32"))
+        frame_error = max(frame_error, float(np.abs(one_frame[0] - double[f]).max()))
+
+    # every segment's length (object to its parent, or its driver) over its default length, float64 then float32
+    _, lengths = rest_offsets(rest_positions, driver[0], topology)
+    stretch = []
+    for positions in (double, single.astype(float)):
+        parents = np.stack([parent_positions(frame, driver[f], topology) for f, frame in enumerate(positions)])
+        stretch.append(np.linalg.norm(positions - parents, axis=2) / lengths)
+    length_error = float(np.abs(stretch[1] - stretch[0]).max())
+
+    # the chain's length is the longest way from a driver to an object along the segments
+    chain_length = float(accumulate_down_tree(lengths, topology).max())
+    length_bound = PRECISION_BOUNDS["length_iterations" if params.get("iterations") else "length"]
+    ok = frame_error <= PRECISION_BOUNDS["frame"] * chain_length and length_error <= length_bound
+    return {"shot": float(np.abs(single - double).max()), "frame": frame_error, "length": length_error, "ok": ok}
+# remove "#" to test:
+# print(precision_error(200, 1000, iterations=4))
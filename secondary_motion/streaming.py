@@ -0,0 +1,122 @@
+from secondary_motion import solver
+from secondary_motion.keys import rest_local_matrices, world_to_local_translate, write_translate_keys
+from secondary_motion.profiling import Profiler, stage
+from secondary_motion.sampling import sample_scene, sample_substeps
+from secondary_motion.scene import get_cmds, list_chains
+
+"""
+What code does:
+bakes a shot a window of frames at a time: sample the window, solve it, key it, forget it,
+so a 10k frame shot needs as much memory as one window instead of all of it
+
+Functions:
+- sample_windows(driver_list, start_frame, end_frame, window, cmds=None, **params)
+- solve_windows(windows, driver_list, rest_positions, parent_index, interpolation="linear", cmds=None, **params)
+- key_windows(windows, obj_list, driver_count, parent_index, cmds=None)
+- bake_streaming(obj, start_frame, end_frame, window=250, include_descendants=True, interpolation="linear",
+	profiler=None, cmds=None, **params)
+
+How the windows join up:
+- each generator takes the one before it and gives back one window at a time
+	as (first frame, samples, parent matrices[, solved]), so only one window is ever around
+- only the drivers get sampled in the windows, the objects are read once on the first frame before them
+	(their default positions, the only thing the solver needs of them)
+- the solver carries its (current, previous) state from the end of one window into the next,
+	and the driver on the first frame is kept from the first window,
+	so the result is the same as solving the whole range in one go
+- the first window replaces the keys on the objects, every window after that only the keys in its own frames
+
+Compared to pipeline.bake: no cache, no buffers, no debug locators, it returns nothing
+(the whole point is to never have all the frames at once)
+profiler works like pipeline.bake's, every window is its own sample / solve / key stage
+"""
+
+
+# Sampling the drivers window frames at a time, params only for the solver's precision
+def sample_windows(driver_list, start_frame, end_frame, window, cmds=None, **params):
+    cmds = get_cmds(cmds)
+    dtype = solver.PRECISIONS[dict(solver.DEFAULT_PARAMS, **params)["precision"]]
+    for window_start in range(start_frame, end_frame + 1, window):
+        window_end = min(window_start + window - 1, end_frame)
+        with stage(cmds, "sample", frames=window_end - window_start + 1, chains=len(driver_list)):
+            samples, parent_matrices = sample_scene(driver_list, window_start, window_end, driver_list, dtype=dtype,
+                                                    cmds=cmds)
+        yield window_start, samples, parent_matrices
+
+
+# Solving every window where the last one left off
+# rest_positions: the objects on the first frame, driver_list is only sampled again for interpolation="curve" substeps
+def solve_windows(windows, driver_list, rest_positions, parent_index, interpolation="linear", cmds=None, **params):
+    params = dict(solver.DEFAULT_PARAMS, **params)
+    driver_count = len(driver_list)
+    state = None
+    driver_rest = driver_before = None
+    first_frame = None
+
+    for window_start, samples, parent_matrices in windows:
+        if first_frame is None:
+            first_frame = window_start
+            driver_rest = samples[0]
+
+        driver_substeps = None
+        if interpolation == "curve" and params["substeps"] > 1:
+            with stage(cmds, "substeps", frames=len(samples), chains=driver_count):
+                driver_substeps = sample_substeps(driver_list, window_start,
+                                                  window_start + len(samples) - 1, params["substeps"],
+                                                  first_frame_holds=window_start == first_frame,
+                                                  dtype=solver.PRECISIONS[params["precision"]], cmds=cmds)
+
+        # every window is a checkpoint long, so the state after its last frame comes back in checkpoints
+        checkpoints = {}
+        with stage(cmds, "solve", frames=len(samples), chains=driver_count, objects=len(parent_index)):
+            solved = solver.solve(samples, rest_positions, parent_index, state=state,
+                                  driver_rest=driver_rest, driver_before=driver_before,
+                                  driver_substeps=driver_substeps, checkpoints=checkpoints,
+                                  checkpoint_every=len(samples), **params)
+        state = checkpoints[len(samples)]
+        driver_before = samples[-1]
+        yield window_start, samples, parent_matrices, solved
+
+
+# Keying every solved window on the objects, gives back the frames it keyed
+def key_windows(windows, obj_list, driver_count, parent_index, cmds=None):
+    cmds = get_cmds(cmds)
+    local_matrices = None
+    for window_start, samples, parent_matrices, solved in windows:
+        replace = local_matrices is None
+        if replace:
+            local_matrices, scale_pivots = rest_local_matrices(obj_list, cmds)
+
+        frame_list = list(range(window_start, window_start + len(solved)))
+        with stage(cmds, "key", frames=len(frame_list), chains=driver_count, objects=len(obj_list)):
+            local_translate = world_to_local_translate(solved, parent_index, parent_matrices, local_matrices,
+                                                       scale_pivots)
+            write_translate_keys(obj_list, frame_list, local_translate, replace=replace, cmds=cmds)
+        yield frame_list
+
+
+# Baking obj (a list of objects works too) window frames at a time, same result as pipeline.bake
+def bake_streaming(obj, start_frame, end_frame, window=250, include_descendants=True, interpolation="linear",
+                   profiler=None, cmds=None, **params):
+    cmds = get_cmds(cmds)
+    print_table = profiler is True
+    if profiler:
+        profiler = Profiler() if profiler is True else profiler
+        cmds = profiler.wrap(cmds)
+    with stage(cmds, "list_chains"):
+        driver_list, obj_list, parent_index = list_chains([obj] if isinstance(obj, str) else obj, include_descendants,
+                                                          cmds)
+    driver_count = len(driver_list)
+    with stage(cmds, "rest", objects=len(obj_list)):
+        rest_positions = sample_scene(obj_list, start_frame, start_frame,
+                                      dtype=solver.PRECISIONS[dict(solver.DEFAULT_PARAMS, **params)["precision"]],
+                                      cmds=cmds)[0][0]
+
+    windows = sample_windows(driver_list, start_frame, end_frame, window, cmds, **params)
+    windows = solve_windows(windows, driver_list, rest_positions, parent_index, interpolation, cmds, **params)
+    for _ in key_windows(windows, obj_list, driver_count, parent_index, cmds):
+        pass
+    if print_table:
+        print(profiler.table())
+# remove "#" to test:
+# bake_streaming("SELECT_THIS", 1, 10000, window=250)
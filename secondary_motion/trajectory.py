@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+
+from secondary_motion.keys import write_translate_keys
+from secondary_motion.scene import get_cmds
+
+"""
+What code does:
+keeps what a bake solved in one compact file (float32, a few hundred bytes of metadata), so the motion can go
+to another scene or tool, or back onto the objects later, without sampling or solving anything again
+
+Usage:
+    bake("SELECT_THIS", 1, 50, trajectory="tail.smtraj")
+    trajectory = Trajectory("tail.smtraj")
+    trajectory.frame(25)          # (objects, 3) world positions on frame 25, only that frame is read
+    apply_trajectory("tail.smtraj")   # keys every object at once, like the bake did
+
+Classes:
+- Trajectory(path): .nodes / .drivers / .start_frame / .end_frame / .frame_list / .params / .parent_index,
+	.positions / .translate (memory mapped, (frames, objects, 3)), .frame(frame) / .translate_at(frame)
+
+Functions:
+- write_trajectory(path, positions, translate, node_list, start_frame, driver_list=(), parent_index=None, params=None)
+- apply_trajectory(trajectory, node_list=None, start_frame=None, end_frame=None, replace=True, cmds=None)
+
+The file (.smtraj):
+- 8 bytes: SMTRAJ and the format version
+- 8 bytes: how long the header is (little endian)
+- the header: json with nodes (full paths of the objects), drivers, start_frame, end_frame, params,
+	parent_index, and where every column is in the file (offset and shape)
+- the columns, float32 little endian, frames first, every one starting on a 64 byte boundary:
+	positions: solved world positions, translate: the local translates bake keyed
+- frames first means one frame is one small contiguous read, the columns are memory mapped,
+	so opening a file reads only the header and frame(f) only touches that frame
+- float32 is about 7 significant digits, well under a thousandth of a unit on a rig a few hundred units across
+
+Applying it (apply_trajectory) keys the translate column on the nodes with keys.write_translate_keys,
+the same call a bake ends with, so it's only as slow as keying: nothing gets sampled or solved
+the nodes are the paths in the file, or node_list (same order) for a rig that has moved or been renamed
+"""
+
+MAGIC = b"SMTRAJ\x00\x01"
+ALIGN = 64
+COLUMNS = ("positions", "translate")
+
+
+# Writing what a bake solved: positions and translate are (frames, objects, 3), node_list the objects' paths
+def write_trajectory(path, positions, translate, node_list, start_frame, driver_list=(), parent_index=None,
+                     params=None):
+    columns = {"positions": np.ascontiguousarray(positions, dtype="<f4"),
+               "translate": np.ascontiguousarray(translate, dtype="<f4")}
+    frame_count = len(columns["positions"])
+    header = {
+        "nodes": list(node_list),
+        "drivers": list(driver_list),
+        "start_frame": int(start_frame),
+        "end_frame": int(start_frame) + frame_count - 1,
+        "parent_index": [int(parent) for parent in (parent_index if parent_index is not None else [])],
+        "params": {name: np.asarray(value).tolist() for name, value in (params or {}).items()},
+        "columns": {},
+    }
+
+    # the offsets depend on how long the header is, which depends on the offsets: leave room for them first
+    for name in COLUMNS:
+        header["columns"][name] = {"offset": 0, "shape": list(columns[name].shape)}
+    header_size = len(json.dumps(header).encode("utf-8")) + 64
+    offset = -(-(16 + header_size) // ALIGN) * ALIGN
+    for name in COLUMNS:
+        header["columns"][name]["offset"] = offset
+        offset += -(-columns[name].nbytes // ALIGN) * ALIGN
+    header_bytes = json.dumps(header).encode("utf-8").ljust(header_size)
+
+    # written next to it and then moved in, so a half written file is never there under that name
+    with open(path + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for name in COLUMNS:
+            f.seek(header["columns"][name]["offset"])
+            f.write(columns[name].tobytes())
+    os.replace(path + ".tmp", path)
+    return path
+
+
+class Trajectory(object):
+
+    # Only the header is read here, the columns are memory mapped and read when they're looked at
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a secondary motion trajectory.")
+            header_size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            self.header = json.loads(f.read(header_size).decode("utf-8"))
+
+        self.nodes = self.header["nodes"]
+        self.drivers = self.header["drivers"]
+        self.start_frame = self.header["start_frame"]
+        self.end_frame = self.header["end_frame"]
+        self.params = self.header["params"]
+        self.parent_index = np.array(self.header["parent_index"], dtype=int)
+        self.frame_list = list(range(self.start_frame, self.end_frame + 1))
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            column = self.header["columns"][name]
+            self._columns[name] = np.memmap(self.path, dtype="<f4", mode="r", offset=column["offset"],
+                                            shape=tuple(column["shape"]))
+        return self._columns[name]
+
+    @property
+    def positions(self):
+        return self.column("positions")
+
+    @property
+    def translate(self):
+        return self.column("translate")
+
+    def __len__(self):
+        return len(self.frame_list)
+
+    def _index(self, frame):
+        index = int(round(frame)) - self.start_frame
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame {frame} is outside of {self.start_frame}-{self.end_frame}.")
+        return index
+
+    # World positions (objects, 3) on frame
+    def frame(self, frame):
+        return np.array(self.positions[self._index(frame)], dtype=float)
+
+    # Local translates (objects, 3) on frame
+    def translate_at(self, frame):
+        return np.array(self.translate[self._index(frame)], dtype=float)
+
+
+# Keying a trajectory (a path or a Trajectory) on its nodes (or node_list), every channel in one go
+# start_frame / end_frame: only part of it (the keys outside of that stay with replace=False)
+def apply_trajectory(trajectory, node_list=None, start_frame=None, end_frame=None, replace=True, cmds=None):
+    cmds = get_cmds(cmds)
+    if not isinstance(trajectory, Trajectory):
+        trajectory = Trajectory(trajectory)
+    node_list = list(node_list) if node_list is not None else trajectory.nodes
+    if len(node_list) != len(trajectory.nodes):
+        cmds.error(f"The trajectory has {len(trajectory.nodes)} objects, not {len(node_list)}.")
+
+    first = trajectory._index(trajectory.start_frame if start_frame is None else start_frame)
+    last = trajectory._index(trajectory.end_frame if end_frame is None else end_frame)
+    values = np.asarray(trajectory.translate[first:last + 1], dtype=float)
+    write_translate_keys(node_list, trajectory.frame_list[first:last + 1], values, replace=replace, cmds=cmds)
+    return node_list
+# remove "#" to test:
+# apply_trajectory("tail.smtraj")
@@ -0,0 +1,28 @@
+import pytest
+
+from secondary_motion import kernels
+
+# the compiled loop is optional, without numba there's nothing to compare
+pytest.importorskip("numba")
+
+# two drivers, branches under both of them
+TREE = [-1, 0, 1, 0, 3, 4, -2, 6, 6, 7, 8]
+CASES = {
+    "plain": {},
+    "substeps": {"substeps": 4},
+    "iterations": {"iterations": 4},
+    "cascade": {"cascade": True},
+    "tree": {"parent_index": TREE},
+    "tree cascade": {"parent_index": TREE, "cascade": True},
+    "tree substeps iterations": {"parent_index": TREE, "substeps": 2, "iterations": 3},
+}
+# precision -> (frames, largest difference), float32 only agrees to its own rounding,
+# which adds up over a shot (a 50 joint chain ends up ~1e-2 apart after 100 frames), so it gets a shorter one
+TOLERANCES = {"float64": (100, 1e-9), "float32": (20, 1e-3)}
+
+
+@pytest.mark.parametrize("precision", sorted(TOLERANCES))
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_parity(case, precision):
+    frame_count, tolerance = TOLERANCES[precision]
+    assert kernels.parity(frame_count=frame_count, precision=precision, **CASES[case]) <= tolerance
@@ -0,0 +1,21 @@
+import pytest
+
+from secondary_motion import solver
+
+# (objects, frames, params), the long chains and whippy settings "Precision" at the top of solver.py talks about
+PRECISION_CASES = {
+    "long chain": (200, 300, {}),
+    "long chain iterations": (200, 300, {"iterations": 4}),
+    "substeps": (50, 300, {"substeps": 4}),
+    "long chain substeps": (200, 300, {"substeps": 4, "k": 0.3}),
+    "cascade": (200, 1000, {"cascade": True}),
+    "tree": (None, 300, {"parent_index": [-1, 0, 1, 2, 1, 4, -2, 6, 7, 7]}),
+}
+
+
+# float32 against float64: one frame and the segment lengths inside PRECISION_BOUNDS
+@pytest.mark.parametrize("case", sorted(PRECISION_CASES))
+def test_precision_error(case):
+    object_count, frame_count, params = PRECISION_CASES[case]
+    error = solver.precision_error(object_count or 50, frame_count, **params)
+    assert error["ok"], error